@@ -18,7 +18,7 @@ setup(name='CSciBox',
             'images.fatcow-hosting-icons-3000.16x16',
             'images.fatcow-hosting-icons-3000.32x32',
             ],
-        py_modules = ['cscibox','config','dbconversion'],
+        py_modules = ['cscibox','cscibox_run','config','dbconversion'],
         install_requires = [
             "quantities>=0.11.1",
             "bagit>=1.5.4",
@@ -27,6 +27,7 @@ setup(name='CSciBox',
             "matplotlib>=1.5.3"
             ],
         package_dir = {'' : 'src'},
-        entry_points={ "gui_scripts": [ "cscibox = cscibox:main", ] },
+        entry_points={ "gui_scripts": [ "cscibox = cscibox:main", ],
+                       "console_scripts": [ "cscibox-run = cscibox_run:main", ] },
         include_package_data=True,
         )
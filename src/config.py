@@ -1,15 +1,27 @@
 
-#mongodb or hbase
+#mongodb, hbase or sqlite
 db_type = 'mongodb'
-#IP address location of the database
+#IP address location of the database (for sqlite, the path to its file)
 db_location = 'localhost'
-#port to connect on
+#port to connect on (ignored by sqlite)
 db_port = 27017
 
 installer_db_type = 'mongodb'
 installer_db_location = 'localhost'
 installer_db_port = 27018
 
+#roughly how many sample values to keep in memory across all open cores;
+#past this, the least recently used cores get unloaded
+core_cache_size = 1000000
+
+#where to keep local copies of data that's slow to load from the database
+cache_location = '~/cscibox/cache'
+
+#how many samples of a core to store together; cores get split into chunks
+#of this many depths (per run) so a range of depths can be read on its own.
+#None keeps each run of a core in one piece.
+core_chunk_size = None
+
 
 #location of plugins; relative locations are relative to
 #CScience/src
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+cscibox_run.py
+
+Runs a computation plan on many cores without the GUI, and saves a new run on
+each of them:
+
+    cscibox-run [-j JOBS] [-t THREADS] PLAN PARAMETERS CORE [CORE ...]
+
+Cores are names, or shell-style patterns (quote them) matched against every
+core in the repository. PARAMETERS is a JSON file with an answer for
+everything the plan's components would otherwise ask for:
+
+    {"Bacon Number of Iterations": 200,
+     "Bacon Section Thickness": 5,
+     "Reservoir Correction": [100, 20],
+     "cores": {"MD02-2496": {"Bacon Section Thickness": 2}}}
+
+Entries under "cores" only apply to that core. Inputs with an error take
+[value, error] or [value, plus, minus]; inputs the components give a default
+for can be left out. Cores are run in parallel, one per worker process, and
+one failing doesn't stop the others.
+"""
+
+import argparse
+import fnmatch
+import json
+import multiprocessing
+import sys
+import traceback
+
+from cscience import datastore
+
+
+def start_worker():
+    #every process needs its own connection to the repository
+    datastore.Datastore().load_from_config()
+
+
+def run_core(job):
+    """
+    Run a plan on one core, and save it. Returns (core name, run name,
+    {component: seconds}) on success, or (core name, None, traceback) on
+    failure.
+    """
+    core_name, plan, answers, threads = job
+    store = datastore.Datastore()
+    core = vcore = None
+    try:
+        computation_plan = store.computation_plans[plan]
+        workflow = store.workflows[computation_plan['workflow']]
+        core = store.cores[core_name]
+        vcore = core.new_computation(plan, core_name)
+        timings = workflow.execute(computation_plan, vcore, None, answers,
+                                   threads)
+        store.runs.add(vcore.partial_run)
+        store.save_datastore()
+    except Exception:
+        error = traceback.format_exc()
+        if vcore is not None:
+            #don't let a half-finished run get saved along with the next core
+            try:
+                core.delete_run(vcore.partial_run.name)
+                if vcore.partial_run.name in store.runs:
+                    store.runs.delete_one(vcore.partial_run)
+            except Exception:
+                error += ('\nand its partial run %s could not be removed:\n%s'
+                          % (vcore.partial_run.name, traceback.format_exc()))
+        return core_name, None, error
+    return core_name, vcore.partial_run.name, timings
+
+
+def find_cores(names, patterns):
+    """
+    The cores in names matching any of patterns, in the order first matched;
+    patterns that match nothing are returned too, so they can be reported.
+    """
+    found = []
+    missing = []
+    for pattern in patterns:
+        matches = sorted(fnmatch.filter(names, pattern))
+        if not matches:
+            missing.append(pattern)
+        for name in matches:
+            if name not in found:
+                found.append(name)
+    return found, missing
+
+
+def core_answers(parameters, core_name):
+    answers = dict(parameters)
+    overrides = answers.pop('cores', {})
+    answers.update(overrides.get(core_name, {}))
+    return answers
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='cscibox-run',
+        description='Run a computation plan on many cores, without the GUI.')
+    parser.add_argument('plan', help='name of the computation plan to run')
+    parser.add_argument('parameters',
+                        help='JSON file answering all user input prompts')
+    parser.add_argument('cores', nargs='+',
+                        help='core names, or patterns like "MD02-*"')
+    parser.add_argument('-j', '--jobs', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='number of cores to run at once '
+                             '(default: one per CPU)')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='number of components to run at once on each '
+                             'core, where the plan allows (default: 1)')
+    options = parser.parse_args(args)
+
+    with open(options.parameters) as paramfile:
+        parameters = json.load(paramfile)
+
+    #start workers before connecting here, so none of them share a connection
+    pool = None
+    if options.jobs > 1:
+        pool = multiprocessing.Pool(options.jobs, start_worker)
+
+    store = datastore.Datastore()
+    store.load_from_config()
+    if options.plan not in store.computation_plans:
+        parser.error("no computation plan named '%s'" % options.plan)
+    core_names, missing = find_cores(store.cores.keys(), options.cores)
+    for pattern in missing:
+        print >>sys.stderr, "no cores match '%s'" % pattern
+    if not core_names:
+        parser.error('no cores to run')
+
+    jobs = [(name, options.plan, core_answers(parameters, name),
+             options.threads) for name in core_names]
+    if pool is None:
+        results = (run_core(job) for job in jobs)
+    else:
+        results = pool.imap_unordered(run_core, jobs)
+
+    failed = []
+    for core_name, run_name, result in results:
+        if run_name is not None:
+            print 'ok      %s: saved %s' % (core_name, run_name)
+            for component, seconds in result.iteritems():
+                print '          %6.2fs  %s' % (seconds, component)
+        else:
+            failed.append(core_name)
+            print 'FAILED  %s' % core_name
+            print >>sys.stderr, result
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    print '%d of %d cores run' % (len(core_names) - len(failed),
+                                  len(core_names))
+    if failed:
+        print 'failed: %s' % ', '.join(failed)
+    return 1 if failed or missing else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
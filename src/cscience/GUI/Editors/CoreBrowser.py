@@ -680,6 +680,7 @@ class CoreBrowser(wx.Frame):
                 new_unit = ids[menu_event.GetId()]
                 for sample in self.samples:
                     sample[att].units = new_unit
+                    sample.touch(att)
                 self.display_samples()
 
             for unit in datastructures.get_conv_units(old_unit):
@@ -794,8 +795,9 @@ class CoreBrowser(wx.Frame):
         if self.core is not None:
             self.virtual_cores = self.core.virtualize()
             for vc in self.virtual_cores:
-                self.samples.extend(vc)
-                self.samples.extend(vc.__iter_ignored__())
+                samples, ignored = vc.partition()
+                self.samples.extend(samples)
+                self.samples.extend(ignored)
         self.show_by_runs()
 
     @property
@@ -865,15 +867,15 @@ class CoreBrowser(wx.Frame):
             attr_ign.SetBackgroundColour(wx.Colour(200, 200, 200))
             attr = wx.grid.GridCellAttr()
             attr.SetBackgroundColour(wx.Colour(255, 255, 255))
-            vcore = self.virtual_cores[0]
-            depths_ign = [
+            samples, ignored = self.virtual_cores[0].partition()
+            depths_ign = set(
                 str(float(str(sample.sample['input']['depth']).split(" ")[0]))
-                for sample in vcore.__iter_ignored__()
-            ]
-            depths = [
+                for sample in ignored
+            )
+            depths = set(
                 str(float(str(sample.sample['input']['depth']).split(" ")[0]))
-                for sample in vcore.__iter__()
-            ]
+                for sample in samples
+            )
             for i in range(self.grid.GetNumberRows()):
                 depth = str(self.grid.GetRowLabelValue(i))
                 if depth in depths_ign:
@@ -1112,9 +1114,12 @@ class CoreBrowser(wx.Frame):
         try:
             self.core = datastore.cores[
                 self.selected_core.GetStringSelection()]
+            self.selected_core.SetToolTipString(
+                    self.core.summary_text() or '')
             self.core.force_load()
         except KeyError:
             self.core = None
+            self.selected_core.SetToolTipString('')
         self.update_runs()
         self.refresh_samples()
 
@@ -29,6 +29,10 @@ dialogs.py
 A collection of small dialogs useful to ACE's gui/editors.
 """
 
+import httplib
+import urllib2
+
+import quantities
 import wx
 import wx.html
 import wx.lib.hyperlink
@@ -117,3 +121,226 @@ def field_dialog(name, query_name, types):
     setattr(EditField, 'is_%s' % query_name.lower(),
             property(lambda self:self.query_box.GetValue()))
     return EditField
+
+#TODO: better error checking!
+class InputQuery(wx.Dialog):
+    class BooleanInput(wx.RadioBox):
+        def __init__(self, parent):
+            super(InputQuery.BooleanInput, self).__init__(parent, wx.ID_ANY, label="",
+                                               choices=['Yes', 'No'])
+        def get_value(self):
+            #not, since we have No in the 1 position
+            return not self.GetSelection()
+
+    class StringInput(wx.TextCtrl):
+        def get_value(self):
+            return self.GetValue()
+
+    class NumericInput(wx.TextCtrl):
+        def __init__(self, parent, type_=float, unit=None, defval=0, minmax=(None, None)):
+            super(InputQuery.NumericInput, self).__init__(parent, wx.ID_ANY)
+
+            self.type_ = type_
+            self.minmax = minmax
+            self.unit = unit
+            self.defval = defval
+            if minmax[0] and self.defval < minmax[0]:
+                self.defval = minmax[0]
+            if minmax[1] and self.defval > minmax[1]:
+                self.defval = minmax[1]
+            self.defval = str(self.defval)
+            self.SetValue(self.defval)
+            self.SetSelection(-1, -1)
+
+            self.Bind(wx.EVT_KILL_FOCUS, self.check_input)
+            self.Bind(wx.EVT_SET_FOCUS, self.highlight)
+
+        def show_error(self, err):
+            if err:
+                self.SetValue(self.defval)
+                self.SetBackgroundColour('red')
+                self.SetSelection(-1, -1)
+            else:
+                self.SetBackgroundColour('white')
+
+        def check_input(self, event):
+            try:
+                val = self.type_(self.GetValue())
+            except ValueError:
+                self.show_error(True)
+            else:
+                if self.minmax[0] is not None and val < self.minmax[0]:
+                    self.show_error(True)
+                elif self.minmax[1] is not None and val > self.minmax[1]:
+                    self.show_error(True)
+                else:
+                    self.show_error(False)
+
+            event.Skip()
+
+        def highlight(self, event):
+            #wait till all selections are actually finshed, then select
+            wx.CallAfter(self.SetSelection, -1, -1)
+            event.Skip()
+
+        def get_value(self):
+            val = self.type_(self.GetValue())
+            if self.unit:
+                return quantities.Quantity(val, self.unit)
+            else:
+                return val
+
+    class ErrorInput(wx.Panel):
+        def __init__(self, parent, type_=float, unit=None, minmax=(None, None)):
+            super(InputQuery.ErrorInput, self).__init__(parent, wx.ID_ANY)
+            self.main_input = InputQuery.NumericInput(self, type_, None, minmax)
+            self.err_input = InputQuery.NumericInput(self, type_)
+
+            self.unit = unit
+
+            sizer = wx.BoxSizer(wx.HORIZONTAL)
+            sizer.Add(self.main_input, flag=wx.EXPAND | wx.TOP | wx.BOTTOM | wx.RIGHT,
+                      border=2, proportion=1)
+            sizer.Add(wx.StaticText(self, label='+/-'), flag=wx.ALL, border=2)
+            sizer.Add(self.err_input, flag=wx.EXPAND | wx.TOP | wx.BOTTOM | wx.LEFT,
+                      border=2, proportion=1)
+            self.SetSizer(sizer)
+
+        def get_value(self):
+            return datastructures.UncertainQuantity(
+                        self.main_input.get_value(), self.unit,
+                        self.err_input.get_value())
+
+    class LabelledInput(wx.Panel):
+        def __init__(self, parent, label, control_type, params=[], extra={}):
+            super(InputQuery.LabelledInput, self).__init__(parent)
+
+            tooltip = extra.pop('helptip', '')
+            self.control = control_type(self, *params, **extra)
+            if tooltip:
+                helplabel = wx.StaticText(self, wx.ID_ANY, tooltip)
+                helplabel.SetFont(helplabel.GetFont().Scale(.9))
+                
+
+            sizer = wx.BoxSizer(wx.HORIZONTAL)
+            sizer.Add(wx.StaticText(self, label=label), flag=wx.ALL, border=2)
+            if tooltip:
+                csizer = wx.BoxSizer(wx.VERTICAL)
+                csizer.Add(self.control, flag=wx.EXPAND, proportion=1)
+                csizer.Add(helplabel, flag=wx.LEFT, border=10)
+                sizer.Add(csizer, flag=wx.EXPAND | wx.ALL, border=2, proportion=1)
+            else:
+                sizer.Add(self.control, flag=wx.EXPAND | wx.ALL, border=2, proportion=1)
+            if params[1]: #unit
+                sizer.Add(wx.StaticText(self, label=params[1]), flag=wx.ALL, border=2)
+            self.SetSizer(sizer)
+
+        def get_value(self):
+            return self.control.get_value()
+
+    def __init__(self, core, dataneeded):
+        #TODO: the sizing on these is really freaking annoying; I should get that
+        #fixed.
+        super(InputQuery, self).__init__(None, title='Please Provide Input', style=wx.CAPTION)
+
+        self.dataneeded = dataneeded
+        self.controls = {}
+
+        scrolledwindow = wx.ScrolledWindow(self)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+
+        #TODO set control default values as appropriate from core
+        for details in self.dataneeded:
+            sizer.Add(self.create_control(details[0], details[1:], scrolledwindow),
+                      flag=wx.EXPAND | wx.ALL, border=3)
+
+        scrolledwindow.SetSizer(sizer)
+        scrolledwindow.SetScrollRate(20, 20)
+        scrolledwindow.EnableScrolling(True, True)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(scrolledwindow, flag=wx.EXPAND | wx.ALL, border=2, proportion=1)
+        sizer.Add(wx.Button(self, wx.ID_OK), flag=wx.CENTER|wx.ALL, border=5)
+        self.SetSizer(sizer)
+
+        scrolledwindow.Layout()
+        self.Centre()
+        self.Layout()
+
+    def create_control(self, name, details, parent):
+        attdata = details[0]
+        otherparms = details[2] if len(details) > 2 else {}
+        defval = details[1] if len(details) > 1 else 0
+        params = []
+        if attdata[0] == 'boolean':
+            ctrl = InputQuery.BooleanInput
+        elif attdata[0] == 'string':
+            ctrl = InputQuery.StringInput
+        else:
+            ctrl = InputQuery.ErrorInput if attdata[2] else InputQuery.NumericInput
+            type_ = int if attdata[0] == 'integer' else float
+            params = [type_, attdata[1], defval] #unit
+
+        ctrl = InputQuery.LabelledInput(parent, name, ctrl, params, otherparms)
+        self.controls[name] = ctrl
+        return ctrl
+
+    @property
+    def result(self):
+        return dict([(name, ctrl.get_value()) for name, ctrl in self.controls.items()])
+
+class ReservoirMapDialog(wx.Dialog):
+    """
+    A nice user-friendly map to show where the reservoir correction point
+    we're using from our database turns out to be
+    """
+    MAP_FORMAT = """<html xmlns="http://www.w3.org/1999/xhtml">
+        <img src="http://maps.googleapis.com/maps/api/staticmap?size=400x300&markers=color:blue|label:S|{0},{1}&markers=color:red|label:R|{2},{3}"
+        </img></html>"""
+
+    def __init__(self, core_loc, closest_data):
+        super(ReservoirMapDialog, self).__init__(
+            None, title="Reservoir Location Map", style=wx.CAPTION)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        try:
+            urllib2.urlopen('http://www.google.com', timeout=1)
+        except (urllib2.URLError, httplib.BadStatusLine):
+            # No network connection, fallback to textual display (no map)
+            sizer.Add(wx.StaticText(self, label="Selected Reservoir Coordinates:"),
+                      flag=wx.EXPAND | wx.CENTER | wx.ALL, border=5)
+            sizer.Add(wx.StaticText(self, label="{0}, {1}".\
+                        format(closest_data['Latitude'], closest_data['Longitude'])),
+                      flag=wx.EXPAND | wx.CENTER | wx.ALL, border=5)
+            sizer.Add(wx.StaticText(self, label="Reservoir Age: {0}, Error: {1}".\
+                        format(closest_data['Delta R'], closest_data['Error'])),
+                      flag=wx.EXPAND | wx.CENTER | wx.ALL, border=5)
+        else:
+            #google works, anyway...
+            self.browser = wx.html.HtmlWindow(self, wx.ID_ANY, size=(400, 300))
+            sizer.Add(self.browser, flag=wx.EXPAND | wx.ALL, border=0)
+
+            h_sizer = wx.BoxSizer(wx.HORIZONTAL)
+            h_sizer.Add(wx.StaticText(self, label="R = Reservoir Location"),
+                        flag=wx.EXPAND | wx.CENTER | wx.ALL, border=5)
+            h_sizer.Add(wx.StaticText(self, label="S = Sample Location"),
+                        flag=wx.EXPAND | wx.CENTER | wx.ALL, border=5)
+            sizer.Add(h_sizer)
+
+            html_string = self.MAP_FORMAT.format(core_loc.lat, core_loc.lon,
+                                                 closest_data['Latitude'],
+                                                 closest_data['Longitude'])
+            self.browser.SetPage(html_string)
+
+        button_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        button_sizer.Add(wx.Button(self, wx.ID_CANCEL,
+                                   label="Reject Selection (Input Manual Correction)"),
+                         flag=wx.CENTER | wx.ALL, border=5)
+        button_sizer.Add(wx.Button(self, wx.ID_OK, label="Accept Selection"),
+                         flag=wx.CENTER | wx.ALL, border=5)
+
+        sizer.Add(button_sizer, flag=wx.CENTER | wx.TOP, border=5)
+
+        self.SetSizer(sizer)
+        self.Centre()
+        self.SetSize((420, 400))
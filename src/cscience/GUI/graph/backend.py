@@ -185,9 +185,8 @@ class SampleCollection(object):
         for vcore in self.virtual_cores:
             if vcore.run != run:
                 continue
-            samples = []
-            samples.extend(vcore.__iter__())
-            samples.extend(vcore.__iter_ignored__())
+            samples, ignored = vcore.partition()
+            samples.extend(ignored)
             # for sample in vcore:
             for sample in samples:
                 indep_var = sample[iattr]
@@ -223,12 +222,15 @@ class SampleCollection(object):
         returns (attributes, properties)
         '''
 
-        # if this is slow, replace with izip to test each core
+        # saved core summaries can usually answer this without going
+        # through the samples
         def att_exists(att):
             for c in self.virtual_cores:
-                for sample in c:
-                    if sample[att] is not None:
-                        return True
+                known = c.has_values(att)
+                if known is None:
+                    known = any(sample[att] is not None for sample in c)
+                if known:
+                    return True
             return False
 
         attset = [
@@ -25,19 +25,15 @@ ADD_PLOT_ID = wx.NewId()
 
 
 def get_distribution(original_point):
-    def clip(points):
-        top = max([i.y for i in points]) * 0.001
-        return [i for i in points if i.y > top]
-
     dist = original_point.uncertainty.distribution
     if hasattr(dist, "x"):
-        x_points = dist.x
-        y_points = dist.y
-        ret = [
+        #clip off the tails, so the interesting part fills the plot
+        y_points = np.asarray(dist.y)
+        keep = y_points > y_points.max() * 0.001
+        return [
             backend.PlotPoint(x, y, None, None, None)
-            for (x, y) in zip(x_points, y_points)
+            for (x, y) in zip(np.asarray(dist.x)[keep], y_points[keep])
         ]
-        return clip(ret)
     else:
         return None
 
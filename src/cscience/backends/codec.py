@@ -0,0 +1,522 @@
+"""
+Conversion between CScience data types and the JSON/BSON-friendly forms they
+are stored in.
+
+Encoding looks up a converter by the type of the value, and decoding looks
+one up by the '_datatype' tag stored with the value, so each value costs a
+dict lookup instead of a pass through every converter we know about. Data
+saved without a tag (site locations, times and publication lists, which use
+their LiPD form) is recognized by its keys instead.
+
+Numeric columns of a core, where every value shares the same units, can also
+be converted all in one go with encode_quantities/decode_quantities.
+
+Probability distributions (from calibration) are packed as binary: a grid
+start and step where the x values are evenly spaced, as they almost always
+are, and the density as float32, zlib-compressed when that helps. They are
+only unpacked when something actually asks for uncertainty.distribution.
+Bacon age model ensembles are packed the same way.
+
+Framework objects that are stored whole (workflows, computation plans, runs,
+views, attributes and templates) are encoded field by field as versioned
+records, rather than pickled.
+"""
+
+import base64
+import collections
+import functools
+import time
+import zlib
+
+import numpy as np
+import quantities as pq
+from quantities import Quantity
+
+from cscience.framework import calculations, datastructures, paleobase, \
+    views
+from cscience.framework.samples import attributes
+
+#dtypes for packed distributions
+DIST_X_DTYPE = '<f8'
+DIST_Y_DTYPE = '<f4'
+#dtype for packed bacon ensembles
+BACON_DTYPE = '<f4'
+
+#current version of each kind of framework record
+RECORD_VERSIONS = {'workflow': 1, 'cplan': 1, 'run': 1, 'view': 1,
+                   'attribute': 1, 'template': 1}
+
+
+class Codec(object):
+
+    def __init__(self):
+        #type -> function to encode values of exactly that type (or
+        #subclasses, if nothing more specific is registered)
+        self.encoders = {}
+        #_datatype tag -> function to decode values with that tag
+        self.decoders = {}
+        #(key, function) for old untagged data, in the order to check them;
+        #function can return None if it turns out not to apply after all
+        self.untagged = []
+        #cache of the encoder to use for each concrete type seen
+        self._dispatch = {}
+
+    def register_encoder(self, cls, func):
+        self.encoders[cls] = func
+        self._dispatch.clear()
+
+    def register_decoder(self, tag, func):
+        self.decoders[tag] = func
+
+    def register_untagged(self, key, func):
+        self.untagged.append((key, func))
+
+    def _encoder_for(self, cls):
+        try:
+            return self._dispatch[cls]
+        except KeyError:
+            pass
+        func = None
+        for base in cls.__mro__:
+            if base in self.encoders:
+                func = self.encoders[base]
+                break
+        else:
+            if hasattr(cls, 'LiPD_tuple'):
+                func = self.encode_lipd
+        self._dispatch[cls] = func
+        return func
+
+    def encode(self, value):
+        """
+        Convert value (and anything it contains) to storable form.
+        """
+        func = self._encoder_for(type(value))
+        if func is None:
+            return value
+        return func(value)
+
+    def decode(self, value):
+        """
+        Convert a stored value back to the CScience type it came from. Plain
+        dicts are decoded in place.
+        """
+        if isinstance(value, dict):
+            tag = value.get('_datatype')
+            if tag in self.decoders:
+                return self.decoders[tag](value)
+            for key, func in self.untagged:
+                if key in value:
+                    result = func(value)
+                    if result is not None:
+                        return result
+            for key, val in value.iteritems():
+                value[key] = self.decode(val)
+            return value
+        elif isinstance(value, list):
+            return [self.decode(item) for item in value]
+        return value
+
+    #containers
+    def encode_dict(self, value):
+        return dict([(key, self.encode(val)) for key, val in
+                     value.iteritems()])
+
+    def encode_list(self, value):
+        return [self.encode(item) for item in value]
+
+    #quantities
+    def encode_quantity(self, value):
+        return {'_datatype': 'quantity',
+                'magnitude': unicode(value.magnitude),
+                'units': unicode(value.units.dimensionality)}
+
+    def encode_uncertain_quantity(self, value):
+        val = self.encode_quantity(value)
+        val['uncertainty'] = self.encode_uncertainty(value.uncertainty)
+        return val
+
+    def encode_uncertainty(self, uncert):
+        if uncert.distribution:
+            return {'dist': self.encode_distribution(uncert.distribution)}
+        if not uncert.magnitude:
+            return {}
+        return {'mag': [unicode(mag.magnitude) for mag in uncert.magnitude]}
+
+    def decode_quantity(self, value):
+        if 'uncertainty' in value:
+            uncert = value['uncertainty']
+            loader = None
+            if 'dist' in uncert:
+                loader, uncert = self.defer_distribution(uncert['dist'])
+            else:
+                uncert = self.decode_uncertainty(uncert)
+            quantity = datastructures.UncertainQuantity(
+                value['magnitude'], value['units'], uncert)
+            if loader is not None:
+                quantity.uncertainty.defer_distribution(loader)
+            return quantity
+        return Quantity(value['magnitude'], value['units'])
+
+    def decode_uncertainty(self, value):
+        if 'dist' in value:
+            return self.decode_distribution(value['dist'])
+        elif value:
+            if len(value['mag']) == 1:
+                return float(value['mag'][0])
+            return [float(val) for val in value['mag']]
+        return 0
+
+    def encode_distribution(self, dist):
+        #packed, with the binary part in base64 so it can go in json
+        info, data = self.pack_distribution(dist)
+        info['data'] = base64.b64encode(data)
+        return info
+
+    def decode_distribution(self, value):
+        return self.unpack_distribution(value)
+
+    def pack_distribution(self, dist, compress=True):
+        """
+        Pack a probability distribution into (info, data), where info is a
+        small json-friendly dict and data is a byte string holding the
+        density (and x values, if they aren't on a regular grid).
+        """
+        ys = np.asarray(dist.y, dtype=float)
+        info = {'avg': float(dist.average),
+                'rng': [float(val) for val in dist.range],
+                'n': len(ys)}
+        data = ''
+        if dist.step is not None:
+            info['start'] = float(dist.start)
+            info['step'] = float(dist.step)
+        else:
+            data = np.asarray(dist.x).astype(DIST_X_DTYPE).tostring()
+        data += ys.astype(DIST_Y_DTYPE).tostring()
+        if compress:
+            packed = zlib.compress(data)
+            if len(packed) < len(data):
+                info['z'] = True
+                data = packed
+        return info, data
+
+    def unpack_distribution(self, info, data=None):
+        """
+        Inverse of pack_distribution. If data isn't given, it comes from
+        info (see encode_distribution). Returns None if the distribution
+        can't be built.
+        """
+        try:
+            if 'x' in info:
+                #stored as plain lists, before distributions were packed
+                return datastructures.ProbabilityDistribution(
+                    info['x'], info['y'], info['avg'], info['rng'], False)
+            if data is None:
+                data = base64.b64decode(info['data'])
+            if info.get('z'):
+                data = zlib.decompress(data)
+            if 'start' in info:
+                ys = np.fromstring(data, dtype=DIST_Y_DTYPE).astype(float)
+                return datastructures.ProbabilityDistribution.on_grid(
+                    info['start'], info['step'], ys, info['avg'], info['rng'],
+                    False)
+            xsize = info['n'] * np.dtype(DIST_X_DTYPE).itemsize
+            xs = np.fromstring(data[:xsize], dtype=DIST_X_DTYPE)
+            ys = np.fromstring(data[xsize:], dtype=DIST_Y_DTYPE).astype(float)
+            return datastructures.ProbabilityDistribution(
+                xs, ys, info['avg'], info['rng'], False)
+        except TypeError:
+            return None
+
+    def defer_distribution(self, info, data=None):
+        """
+        Returns (loader, errors) for a packed distribution, where errors is
+        what the distribution's error would be, worked out without unpacking
+        it, and loader unpacks it. Both are None if it can't be used.
+        """
+        try:
+            avg, rng = info['avg'], info['rng']
+            errors = (rng[1] - avg, avg - rng[0])
+        except TypeError:
+            return None, None
+        return functools.partial(self.unpack_distribution, info, data), errors
+
+    def encode_quantities(self, values, uncertain):
+        """
+        Encode a list of quantities that all have the same units.
+
+        Returns (magnitudes, errors), where magnitudes is an array and errors
+        is None if uncertain is False, otherwise a tuple of
+        (error counts, plus errors, minus errors, distributions); the last is
+        None if no value has a distribution, else a list of (info, data)
+        pairs from pack_distribution (None where a value has none).
+        """
+        count = len(values)
+        mags = np.fromiter((val.magnitude.item() for val in values), float,
+                           count)
+        if not uncertain:
+            return mags, None
+
+        nerr = np.zeros(count, dtype=np.uint8)
+        plus = np.zeros(count)
+        minus = np.zeros(count)
+        dists = None
+        for index, val in enumerate(values):
+            uncert = val.uncertainty
+            errs = [err.magnitude.item() for err in uncert.magnitude]
+            nerr[index] = len(errs)
+            if errs:
+                plus[index] = errs[0]
+                minus[index] = errs[-1]
+            if uncert.distribution is not None:
+                if dists is None:
+                    dists = [None] * count
+                dists[index] = self.pack_distribution(uncert.distribution)
+        return mags, (nerr, plus, minus, dists)
+
+    def decode_quantities(self, mags, units, errors=None):
+        """
+        Inverse of encode_quantities; returns a list of quantities. Data for
+        distributions can also be given as None, in which case it is looked
+        for in the info dict.
+        """
+        #parsing units is a large part of the cost of building a quantity,
+        #so do it just the once and hand out copies.
+        dims = pq.quantity.validate_dimensionality(units)
+        mags = np.asarray(mags, dtype=float)
+        if errors is None:
+            return [_make_quantity(Quantity, mag, dims) for mag in mags]
+
+        nerr, plus, minus, dists = errors
+        nerr = np.asarray(nerr).tolist()
+        plus = np.asarray(plus, dtype=float)
+        minus = np.asarray(minus, dtype=float)
+        result = []
+        for index, mag in enumerate(mags):
+            value = _make_quantity(datastructures.UncertainQuantity, mag, dims)
+            uncert = datastructures.Uncertainty(None, units)
+            loader = None
+            if dists is not None and dists[index] is not None:
+                loader, errs = self.defer_distribution(*dists[index])
+            if loader is not None:
+                uncert.defer_distribution(loader)
+            else:
+                errs = [plus[index], minus[index]][:nerr[index]]
+            uncert.magnitude = [_make_quantity(Quantity, err, dims)
+                                for err in errs]
+            value.uncertainty = uncert
+            result.append(value)
+        return result
+
+    #age models
+    def encode_baconinfo(self, value):
+        #the ensemble is packed as float32, like distribution densities
+        result = {'_datatype': 'baconinfo', 'run': value.run,
+                  'depths': value.depths.tolist()}
+        if value.summary_only:
+            result['mean'] = value.mean().tolist()
+            result['quantiles'] = [[level, value.quantile(level).tolist()]
+                                   for level in value.SUMMARY_LEVELS]
+        else:
+            data = value.ensemble.astype(BACON_DTYPE).tostring()
+            packed = zlib.compress(data)
+            if len(packed) < len(data):
+                result['z'] = True
+                data = packed
+            result['ensemble'] = base64.b64encode(data)
+        return result
+
+    def decode_baconinfo(self, value):
+        run = value.get('run', '')
+        if 'csv_data' in value:
+            #stored as a list of lists
+            return datastructures.BaconInfo(value['csv_data'], run)
+        if 'ensemble' not in value:
+            return datastructures.BaconInfo(None, run,
+                        (value['depths'], value['mean'],
+                         dict((level, quantiles)
+                              for level, quantiles in value['quantiles'])))
+        data = base64.b64decode(value['ensemble'])
+        if value.get('z'):
+            data = zlib.decompress(data)
+        return datastructures.BaconInfo.from_ensemble(
+                    value['depths'], np.fromstring(data, BACON_DTYPE), run)
+
+    def encode_pointlist(self, value):
+        return {'_datatype': 'pointlist',
+                'xpoints': list(value.xpoints),
+                'ypoints': list(value.ypoints),
+                'xunits': value.xunits}
+
+    def decode_pointlist(self, value):
+        #older models didn't say what units their depths were in
+        return datastructures.PointlistInterpolation(value['xpoints'],
+                    value['ypoints'], xunits=value.get('xunits'))
+
+    #everything else
+    def encode_time(self, value):
+        print 'still running into outgoing times...'
+        return {'timeval': list(value)}
+
+    def encode_lipd(self, value):
+        return dict([value.LiPD_tuple()])
+
+    def decode_site(self, value):
+        if 'Longitude' not in value:
+            return None
+        val = value.copy()
+        lat = val.pop('Latitude')
+        lon = val.pop('Longitude')
+        elev = val.pop('Elevation', None)
+        val['Core Site'] = datastructures.GeographyData(lat, lon, elev)
+        return val
+
+    def decode_timeval(self, value):
+        #Switch to using new, awesome times!
+        return datastructures.TimeData(time.struct_time(value['timeval']))
+
+    #framework records
+    def record(self, tag, **fields):
+        fields['_datatype'] = tag
+        fields['version'] = RECORD_VERSIONS[tag]
+        return fields
+
+    def record_fields(self, value):
+        """
+        Returns a record's fields, decoded, after checking we know how to
+        read its version.
+        """
+        tag = value['_datatype']
+        if value.get('version', 1) > RECORD_VERSIONS[tag]:
+            raise ValueError('%s record %s is from a newer version of '
+                             'CScience' % (tag, value.get('name')))
+        return dict((key, self.decode(val)) for key, val in value.iteritems()
+                    if key not in ('_datatype', 'version'))
+
+    def encode_workflow(self, value):
+        return self.record('workflow', name=value.name,
+                           connections=self.encode(value.connections))
+
+    def decode_workflow(self, value):
+        fields = self.record_fields(value)
+        workflow = calculations.Workflow(fields['name'])
+        workflow.connections = fields['connections']
+        return workflow
+
+    def encode_cplan(self, value):
+        return self.record('cplan', name=value['name'],
+                           parameters=self.encode(dict(value)))
+
+    def decode_cplan(self, value):
+        fields = self.record_fields(value)
+        cplan = calculations.ComputationPlan(fields['name'])
+        cplan.update(fields['parameters'])
+        return cplan
+
+    def encode_run(self, value):
+        return self.record('run', name=value.name,
+                           created_time=value._created_time,
+                           user_name=value.user_name,
+                           computation_plan=value.computation_plan,
+                           rundata=self.encode(value.rundata))
+
+    def decode_run(self, value):
+        fields = self.record_fields(value)
+        run = calculations.Run.__new__(calculations.Run)
+        run._created_time = fields['created_time']
+        run.name = fields['name']
+        run.user_name = fields['user_name']
+        run.computation_plan = fields['computation_plan']
+        run.rundata = fields['rundata']
+        return run
+
+    def encode_view(self, value):
+        return self.record('view', name=value.name, attributes=list(value))
+
+    def decode_view(self, value):
+        fields = self.record_fields(value)
+        return views.View(fields['name'], fields['attributes'])
+
+    def encode_attribute(self, value):
+        if value.is_virtual:
+            return self.record('attribute', name=value.name,
+                               type=value.type_, aggregates=value.aggatts)
+        return self.record('attribute', name=value.name, type=value.type_,
+                           unit=value.unit, output=value.output,
+                           has_error=value.has_error)
+
+    def decode_attribute(self, value):
+        fields = self.record_fields(value)
+        if 'aggregates' in fields:
+            return attributes.VirtualAttribute(fields['name'], fields['type'],
+                                               fields['aggregates'])
+        return attributes.Attribute(fields['name'], fields['type'],
+                                    fields['unit'], fields['output'],
+                                    fields['has_error'])
+
+    def encode_template(self, value):
+        #fields in the order they were added, which isn't iteration order
+        fields = [[value[key].name, value[key].field_type, value[key].iskey]
+                  for key in collections.OrderedDict.__iter__(value)]
+        return self.record('template', name=value.name,
+                           key_fields=list(value.key_fields), fields=fields)
+
+    def decode_template(self, value):
+        fields = self.record_fields(value)
+        template = paleobase.Template(name=fields['name'])
+        for name, field_type, iskey in fields['fields']:
+            template[name] = paleobase.TemplateField(name, field_type, iskey)
+        template.key_fields = fields['key_fields']
+        return template
+
+
+def _make_quantity(cls, magnitude, dims):
+    ret = np.array(magnitude, dtype='d').view(cls)
+    ret._dimensionality = dims.copy()
+    return ret
+
+
+def make_codec():
+    """
+    Returns a Codec set up for all the types CScience stores.
+    """
+    codec = Codec()
+    codec.register_encoder(dict, codec.encode_dict)
+    codec.register_encoder(list, codec.encode_list)
+    codec.register_encoder(tuple, codec.encode_list)
+    codec.register_encoder(Quantity, codec.encode_quantity)
+    codec.register_encoder(datastructures.UncertainQuantity,
+                           codec.encode_uncertain_quantity)
+    codec.register_encoder(datastructures.BaconInfo, codec.encode_baconinfo)
+    codec.register_encoder(datastructures.PointlistInterpolation,
+                           codec.encode_pointlist)
+    codec.register_encoder(time.struct_time, codec.encode_time)
+    for cls in (datastructures.GeographyData, datastructures.TimeData,
+                datastructures.PublicationList):
+        codec.register_encoder(cls, codec.encode_lipd)
+
+    codec.register_decoder('quantity', codec.decode_quantity)
+    codec.register_decoder('baconinfo', codec.decode_baconinfo)
+    codec.register_decoder('pointlist', codec.decode_pointlist)
+
+    for tag, cls in (('workflow', calculations.Workflow),
+                     ('cplan', calculations.ComputationPlan),
+                     ('run', calculations.Run),
+                     ('view', views.View),
+                     ('attribute', attributes.Attribute),
+                     ('template', paleobase.Template)):
+        codec.register_encoder(cls, getattr(codec, 'encode_' + tag))
+        codec.register_decoder(tag, getattr(codec, 'decode_' + tag))
+
+    #untagged, in the order the old converters checked for them
+    codec.register_untagged('Latitude', codec.decode_site)
+    codec.register_untagged('timeval', codec.decode_timeval)
+    codec.register_untagged('geo', lambda value:
+                datastructures.GeographyData.parse_value(value['geo']))
+    for key in ('timestamp', 'time'):
+        codec.register_untagged(key, lambda value, key=key:
+                datastructures.TimeData.parse_value(value[key]))
+    for key in ('publist', 'pub'):
+        codec.register_untagged(key, lambda value, key=key:
+                datastructures.PublicationList.parse_value(value[key]))
+    return codec
@@ -0,0 +1,797 @@
+"""
+Columnar storage format for core data.
+
+A core file used to be a single JSON list with one entry per sample, which
+meant that looking at any part of a core required parsing (and decoding) all
+of it. This module instead lays a core out as one column per (run, attribute)
+pair, with numeric values and their uncertainties stored as packed NumPy
+arrays. A small JSON header at the front of the file says where every column
+lives, so a reader can pull just the columns it wants.
+
+File layout:
+    MAGIC (8 bytes)
+    header length (4 bytes, little-endian unsigned int)
+    header (utf-8 JSON)
+    payload (column chunks, at offsets given relative to the end of header)
+
+Anything that isn't a plain numeric quantity is stored in a JSON chunk.
+Conversion of values is left to a codec (see cscience.backends.codec)
+supplied by the backend, which needs to provide:
+    encode(value) / decode(data) -- any value to/from JSON-friendly
+    encode_quantities(values, uncertain) / decode_quantities(mags, units,
+        errors) -- a whole column of numeric values to/from arrays
+Probability distributions attached to uncertainties come from the codec
+already packed; each column keeps them in one binary chunk, with a JSON chunk
+saying where each one is.
+"""
+
+import cStringIO
+import heapq
+import itertools
+import json
+import re
+import struct
+
+import numpy as np
+
+MAGIC = 'CSCICORE'
+FORMAT_VERSION = 2
+
+_header_len = struct.Struct('<I')
+
+#dtypes used on disk; always explicit about byte order so files are portable
+DEPTH_DTYPE = '<f8'
+VALUE_DTYPE = '<f8'
+MASK_DTYPE = '|u1'
+
+
+class _Absent(object):
+    def __repr__(self):
+        return '<absent>'
+#placeholder in column lists for samples that have no value for an attribute
+ABSENT = _Absent()
+
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def iter_json_list(fileobj, bufsize=1 << 16):
+    """
+    Yields the items of the JSON list in fileobj one at a time, reading the
+    file bufsize bytes at a time as it goes, so items can be used before the
+    rest of the list has even been read.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    #what comes next: '[', the first item (or ']'), ',' (or ']'), an item
+    expect = '['
+    while True:
+        pos = _whitespace.match(buf, pos).end()
+        if pos == len(buf) or expect == 'item':
+            result = None
+            if pos < len(buf):
+                try:
+                    result = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    if eof:
+                        raise
+                else:
+                    #a number at the end of what's been read so far might
+                    #not be all there yet
+                    if not eof and (result[1] == len(buf) or
+                                    buf[result[1]] not in ' \t\n\r,]'):
+                        result = None
+            if result is None:
+                if eof:
+                    raise ValueError('JSON list ended early')
+                data = fileobj.read(bufsize)
+                eof = not data
+                buf = buf[pos:] + data
+                pos = 0
+                continue
+            item, pos = result
+            expect = ','
+            yield item
+            continue
+
+        char = buf[pos]
+        pos += 1
+        if expect == '[':
+            if char != '[':
+                raise ValueError('Not a JSON list')
+            expect = 'first'
+        elif char == ']' and expect in ('first', ','):
+            return
+        elif expect == 'first':
+            pos -= 1
+            expect = 'item'
+        elif char == ',' and expect == ',':
+            expect = 'item'
+        else:
+            raise ValueError('Unexpected %r in JSON list' % char)
+
+
+def is_columnar(fileobj):
+    """
+    Check whether the given (seekable) file holds columnar core data. The file
+    is left positioned at its start either way.
+    """
+    start = fileobj.read(len(MAGIC))
+    fileobj.seek(0)
+    return start == MAGIC
+
+
+def _quantity_info(value):
+    """
+    Returns (units, uncertain) for a value that can go in a numeric column,
+    or None if the value needs generic encoding.
+    """
+    try:
+        units = value.dimensionality.string
+        magnitude = value.magnitude
+    except AttributeError:
+        return None
+    if getattr(magnitude, 'shape', None) != ():
+        return None
+    return (units, hasattr(value, 'uncertainty'))
+
+
+class ColumnBuilder(object):
+    """
+    Accumulates the chunks for a core file in memory, then writes them out.
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.chunks = []
+        self.size = 0
+
+    def add_array(self, array, dtype):
+        data = np.ascontiguousarray(array, dtype=dtype).tostring()
+        return self._add(data, dtype)
+
+    def add_json(self, values):
+        data = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        return self._add(data, 'json')
+
+    def add_raw(self, data, spec):
+        #used to carry a chunk across from another file without decoding it
+        return self._add(data, spec['dtype'])
+
+    def copy_column(self, reader, col):
+        """
+        Carry a column across unchanged from another core file.
+        """
+        col = dict(col)
+        col['chunks'] = dict((key, self.add_raw(reader.read_raw(spec), spec))
+                             for key, spec in col['chunks'].iteritems())
+        return col
+
+    def _add(self, data, dtype):
+        spec = {'offset': self.size, 'nbytes': len(data), 'dtype': dtype}
+        self.chunks.append(data)
+        self.size += len(data)
+        return spec
+
+    def column(self, run, name, values):
+        """
+        Build the chunks for one column; values is a list aligned with the
+        core's depths, using the ABSENT marker for samples
+        that have no value for this attribute.
+        """
+        mask = np.array([val is not ABSENT for val in values], dtype=bool)
+        present = [val for val in values if val is not ABSENT]
+        info = set(_quantity_info(val) for val in present)
+        if len(info) == 1 and None not in info:
+            units, uncertain = info.pop()
+            return self._quantity_column(run, name, values, mask, units,
+                                         uncertain)
+        return {'run': run, 'name': name, 'kind': 'json',
+                'chunks': {'mask': self.add_array(mask, MASK_DTYPE),
+                           'value': self.add_json(
+                               [None if val is ABSENT else
+                                self.codec.encode(val)
+                                for val in values])}}
+
+    def _quantity_column(self, run, name, values, mask, units, uncertain):
+        count = len(values)
+
+        def spread(array, dtype):
+            #fill in zeros for the samples that don't have a value
+            full = np.zeros(count, dtype=dtype)
+            full[mask] = array
+            return full
+
+        mags, errors = self.codec.encode_quantities(
+                        [val for val in values if val is not ABSENT], uncertain)
+        chunks = {'mask': self.add_array(mask, MASK_DTYPE),
+                  'value': self.add_array(spread(mags, VALUE_DTYPE),
+                                          VALUE_DTYPE)}
+        col = {'run': run, 'name': name, 'kind': 'quantity', 'units': units,
+               'uncertain': uncertain, 'chunks': chunks}
+        if not uncertain:
+            return col
+
+        nerr, plus, minus, dists = errors
+        chunks['nerr'] = self.add_array(spread(nerr, MASK_DTYPE), MASK_DTYPE)
+        chunks['err_plus'] = self.add_array(spread(plus, VALUE_DTYPE),
+                                            VALUE_DTYPE)
+        if (plus != minus).any():
+            chunks['err_minus'] = self.add_array(spread(minus, VALUE_DTYPE),
+                                                 VALUE_DTYPE)
+        if dists is not None:
+            #distributions are packed binary; their info goes in a json
+            #chunk along with where to find each one in the data chunk
+            infos = []
+            blobs = []
+            offset = 0
+            dists = iter(dists)
+            for present in mask:
+                dist = next(dists) if present else None
+                if dist is None:
+                    infos.append(None)
+                    continue
+                info, data = dist
+                info = dict(info, offset=offset, nbytes=len(data))
+                offset += len(data)
+                infos.append(info)
+                blobs.append(data)
+            chunks['dist'] = self.add_json(infos)
+            chunks['dist_data'] = self._add(''.join(blobs), 'bytes')
+        return col
+
+    def write(self, fileobj, header):
+        header['version'] = FORMAT_VERSION
+        header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        fileobj.write(MAGIC)
+        fileobj.write(_header_len.pack(len(header)))
+        fileobj.write(header)
+        for chunk in self.chunks:
+            fileobj.write(chunk)
+
+
+def write_core(fileobj, records, codec, previous=None, dirty=None):
+    """
+    Write a set of samples to fileobj in columnar format.
+
+    records is a list of (depth, sample) pairs, where depth is a float key and
+    sample is a dict of run -> {attribute: value}.
+
+    previous can be a CoreFileReader for the last saved version of the core,
+    with dirty a dict of run -> set of changed attribute names (or None if
+    the whole run has changed). If the depths haven't changed, every column
+    not marked dirty is copied from previous as-is instead of re-encoded.
+    """
+    records = sorted(records, key=lambda rec: rec[0])
+    builder = ColumnBuilder(codec)
+    depthlist = [rec[0] for rec in records]
+    depths = builder.add_array(depthlist, DEPTH_DTYPE)
+
+    reusable = {}
+    if previous is not None and dirty is not None and \
+            previous.rows == len(records) and \
+            np.array_equal(previous.depths(), depthlist):
+        reusable = dict(((col['run'], col['name']), col)
+                        for col in previous.columns())
+
+    colnames = {}
+    for depth, sample in records:
+        for run, data in sample.iteritems():
+            colnames.setdefault(run, set()).update(data.iterkeys())
+
+    columns = []
+    for run in sorted(colnames):
+        for name in sorted(colnames[run]):
+            old = reusable.get((run, name))
+            if old is not None and not (run in dirty and
+                            (dirty[run] is None or name in dirty[run])):
+                columns.append(builder.copy_column(previous, old))
+                continue
+            values = [sample.get(run, {}).get(name, ABSENT)
+                      for depth, sample in records]
+            columns.append(builder.column(run, name, values))
+
+    builder.write(fileobj, {'rows': len(records), 'depths': depths,
+                            'columns': columns})
+
+
+class CoreFileReader(object):
+    """
+    Reads a columnar core file. Only the header is read up front; column data
+    is read (and decoded) on request.
+    """
+
+    def __init__(self, fileobj, codec):
+        self.fileobj = fileobj
+        self.codec = codec
+        magic = fileobj.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError('Not a columnar core file')
+        (length,) = _header_len.unpack(fileobj.read(_header_len.size))
+        self.header = json.loads(fileobj.read(length).decode('utf-8'))
+        if self.header['version'] > FORMAT_VERSION:
+            raise ValueError('Core file format version %s is newer than this '
+                             'version of CScience can read' %
+                             self.header['version'])
+        self.payload = len(MAGIC) + _header_len.size + length
+        self.rows = self.header['rows']
+
+    def read_raw(self, spec):
+        self.fileobj.seek(self.payload + spec['offset'])
+        return self.fileobj.read(spec['nbytes'])
+
+    def read_chunk(self, spec):
+        data = self.read_raw(spec)
+        if spec['dtype'] == 'json':
+            return json.loads(data.decode('utf-8'))
+        return np.fromstring(data, dtype=spec['dtype'])
+
+    def depths(self):
+        return self.read_chunk(self.header['depths'])
+
+    def columns(self, runs=None, names=None):
+        """
+        List the column descriptions in this file, optionally restricted to
+        the given runs and attribute names.
+        """
+        return [col for col in self.header['columns'] if
+                (runs is None or col['run'] in runs) and
+                (names is None or col['name'] in names)]
+
+    def read_column(self, col):
+        """
+        Decode a column to a list aligned with depths(); samples without a
+        value for this attribute get ABSENT.
+        """
+        chunks = col['chunks']
+        mask = self.read_chunk(chunks['mask']).astype(bool)
+        if col['kind'] == 'json':
+            return [self.codec.decode(val) if present else ABSENT
+                    for val, present in zip(self.read_chunk(chunks['value']),
+                                            mask)]
+
+        mags = self.read_chunk(chunks['value'])[mask]
+        errors = None
+        if col['uncertain']:
+            plus = self.read_chunk(chunks['err_plus'])[mask]
+            if 'err_minus' in chunks:
+                minus = self.read_chunk(chunks['err_minus'])[mask]
+            else:
+                minus = plus
+            dists = None
+            if 'dist' in chunks:
+                dists = self._read_dists(chunks, mask)
+            errors = (self.read_chunk(chunks['nerr'])[mask], plus, minus,
+                      dists)
+        values = iter(self.codec.decode_quantities(mags, col['units'],
+                                                   errors))
+        return [next(values) if present else ABSENT for present in mask]
+
+    def _read_dists(self, chunks, mask):
+        #(info, data) for each value present; they're only actually unpacked
+        #if they get used.
+        infos = [info for info, present in
+                 zip(self.read_chunk(chunks['dist']), mask) if present]
+        if 'dist_data' not in chunks:
+            #version 1 files store distributions as plain json
+            return [info and (info, None) for info in infos]
+        data = self.read_raw(chunks['dist_data'])
+        return [info and (info, data[info['offset']:
+                                     info['offset'] + info['nbytes']])
+                for info in infos]
+
+    def iter_samples(self, runs=None):
+        """
+        Yields (depth, {run: {attribute: value}}) for every sample in the file,
+        optionally with only the data for the given runs.
+        """
+        depths = self.depths().tolist()
+        samples = [{} for depth in depths]
+        for col in self.columns(runs):
+            values = self.read_column(col)
+            for sample, value in zip(samples, values):
+                if value is not ABSENT:
+                    sample.setdefault(col['run'], {})[col['name']] = value
+        return zip(depths, samples)
+
+    def lazy_samples(self, runs=None):
+        """
+        Like iter_samples, but only works out which attributes each sample
+        has; values are decoded (a column at a time, for all the samples at
+        once) the first time any of them is asked for.
+
+        The reader has to stay usable as long as the samples are, so it
+        shouldn't be reading straight from a file that might go away.
+        """
+        depths = self.depths().tolist()
+        samples = [{} for depth in depths]
+        sources = {}
+        for col in self.columns(runs):
+            run = col['run']
+            source = sources.get(run)
+            if source is None:
+                source = sources[run] = _ColumnSource(self, len(depths))
+            source.columns[col['name']] = col
+            mask = self.read_chunk(col['chunks']['mask'])
+            for index in np.flatnonzero(mask).tolist():
+                data = source.rows[index]
+                if data is None:
+                    data = source.rows[index] = samples[index][run] = \
+                        LazyData(source)
+                data._pending.add(col['name'])
+        return zip(depths, samples)
+
+
+class _ColumnSource(object):
+    """
+    Decodes the columns for one run of a core file as they're needed, and
+    hands the values out to the LazyData of each sample.
+    """
+
+    def __init__(self, reader, count):
+        self.reader = reader
+        self.columns = {}
+        self.rows = [None] * count
+
+    def load(self, name):
+        col = self.columns.pop(name, None)
+        if col is None:
+            return
+        for data, value in zip(self.rows, self.reader.read_column(col)):
+            if data is not None and value is not ABSENT:
+                data._fill(name, value)
+        if not self.columns:
+            #all done; let go of the file data
+            self.reader = None
+
+
+class LazyData(dict):
+    """
+    The data for one run of one sample, where some attributes may not have
+    been decoded yet. Their names are known (so keys(), len() and 'in' don't
+    need to decode anything), and asking for any of their values decodes it.
+    Setting or deleting a value works as normal, and wins over what's stored.
+
+    Anything that goes through the methods here sees every value, and copy(),
+    copy.copy() and pickling give a plain dict with everything decoded. But
+    dict(data), {}.update(data) and other dict internals read the stored
+    values directly, and miss any that haven't been decoded yet; use
+    data.copy() (or go through keys()) instead.
+    """
+
+    def __init__(self, source):
+        super(LazyData, self).__init__()
+        self._source = source
+        self._pending = set()
+
+    def _fill(self, name, value):
+        if name in self._pending:
+            self._pending.discard(name)
+            dict.__setitem__(self, name, value)
+
+    def _need(self, name):
+        if name in self._pending:
+            self._source.load(name)
+
+    def _need_all(self):
+        for name in list(self._pending):
+            self._source.load(name)
+
+    def __getitem__(self, name):
+        self._need(name)
+        return dict.__getitem__(self, name)
+
+    def get(self, name, default=None):
+        self._need(name)
+        return dict.get(self, name, default)
+
+    def __setitem__(self, name, value):
+        self._pending.discard(name)
+        dict.__setitem__(self, name, value)
+
+    def __delitem__(self, name):
+        if name in self._pending:
+            self._pending.discard(name)
+        else:
+            dict.__delitem__(self, name)
+
+    def __contains__(self, name):
+        return name in self._pending or dict.__contains__(self, name)
+    has_key = __contains__
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._pending)
+
+    def __iter__(self):
+        for name in dict.keys(self):
+            yield name
+        for name in list(self._pending):
+            yield name
+    iterkeys = __iter__
+
+    def keys(self):
+        return dict.keys(self) + list(self._pending)
+
+    def pop(self, name, *default):
+        self._need(name)
+        return dict.pop(self, name, *default)
+
+    def setdefault(self, name, default=None):
+        self._need(name)
+        return dict.setdefault(self, name, default)
+
+    def update(self, *args, **kwargs):
+        #not dict(*args), which skips straight to the stored values of any
+        #dict subclass it's given (like another LazyData)
+        if args and hasattr(args[0], 'keys'):
+            other = args[0]
+            for name in other.keys():
+                self[name] = other[name]
+            args = args[1:]
+        for name, value in dict(*args, **kwargs).iteritems():
+            self[name] = value
+
+    def clear(self):
+        self._pending.clear()
+        dict.clear(self)
+
+    #everything else needs all the values
+    def _loaded(method):
+        def wrapper(self, *args, **kwargs):
+            self._need_all()
+            return method(self, *args, **kwargs)
+        wrapper.__name__ = method.__name__
+        return wrapper
+
+    values = _loaded(dict.values)
+    itervalues = _loaded(dict.itervalues)
+    items = _loaded(dict.items)
+    iteritems = _loaded(dict.iteritems)
+    copy = _loaded(dict.copy)
+    popitem = _loaded(dict.popitem)
+    __repr__ = _loaded(dict.__repr__)
+    del _loaded
+
+    def __eq__(self, other):
+        self._need_all()
+        if isinstance(other, LazyData):
+            other._need_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        return (dict, (self.items(),))
+
+
+class SegmentedCoreTable(object):
+    """
+    Core storage shared by backends that keep each run of a core in its own
+    columnar file (a "segment"), so saving a new run (or loading just one)
+    doesn't mean touching all the others. If chunk_size is set, each run is
+    further split into segments of that many samples, each marked with the
+    range of depths it covers, so a range of depths can be read without
+    touching the rest of the core.
+
+    Subclasses need a codec attribute, and to provide:
+        _open_segments(name, runs=None, depths=None) -- {(run, chunk): file}
+            for the stored segments of the named core, optionally limited to
+            the given runs and to segments overlapping a (low, high) range of
+            depths
+        _replace_segment(name, run, chunk, segment, data, depths) -- replace
+            the stored segment file (None if there isn't one) with the bytes
+            in data (None if it's no longer needed), which hold the samples
+            from the (low, high) range of depths given
+    Backends with cores stored some older way can also override the _legacy
+    methods; by default there's nothing there.
+    """
+    chunk_size = None
+
+    def _open_legacy(self, name):
+        """
+        Returns the pre-segment file holding the named core, or None.
+        """
+        return None
+
+    def _delete_legacy(self, name, legacy):
+        pass
+
+    def _iter_legacy_samples(self, core, runs=None):
+        """
+        Yields (depth or 'all', {run: data}) for each sample of the named
+        core in the old JSON format, in whatever order they were stored.
+        """
+        return iter(())
+
+    def _chunks(self, records):
+        if not self.chunk_size:
+            return [records]
+        return [records[start:start + self.chunk_size] for start in
+                xrange(0, len(records), self.chunk_size)]
+
+    def savemany(self, items, *args, **kwargs):
+        """
+        Save a core's samples, one file per run (or chunk of a run). If dirty
+        is given (as a dict of run -> changed attribute names, or None for a
+        whole run), only the runs it lists are written; anything else stored
+        is left alone.
+        """
+        name = kwargs['name']
+        dirty = kwargs.get('dirty')
+        legacy = self._open_legacy(name)
+        if legacy is not None:
+            #old single-file core; gets split up in full this time through
+            legacy.close()
+            dirty = None
+
+        byrun = {}
+        for key, value in items:
+            for run, data in value.iteritems():
+                byrun.setdefault(run, []).append((float(key), {run: data}))
+        if dirty is None:
+            stored = self._open_segments(name)
+            runs = set(byrun) | set(run for run, chunk in stored)
+        else:
+            runs = set(dirty)
+            stored = self._open_segments(name, runs)
+
+        for run in runs:
+            records = sorted(byrun.get(run, []), key=lambda rec: rec[0])
+            chunks = self._chunks(records) if records else []
+            for chunk, records in enumerate(chunks):
+                #columns that haven't changed can be copied over from the
+                #current file rather than re-encoded. Need to grab it before
+                #it gets replaced, though.
+                previous = None
+                segment = stored.pop((run, chunk), None)
+                if segment is not None and dirty is not None and \
+                        dirty[run] is not None:
+                    previous = CoreFileReader(
+                            cStringIO.StringIO(segment.read()), self.codec)
+                newfile = cStringIO.StringIO()
+                write_core(newfile, records, self.codec, previous, dirty)
+                self._replace_segment(name, run, chunk, segment,
+                                      newfile.getvalue(),
+                                      (records[0][0], records[-1][0]))
+            #anything left over has been deleted, or has shrunk
+            for (segrun, chunk), segment in stored.items():
+                if segrun == run:
+                    del stored[(segrun, chunk)]
+                    self._replace_segment(name, run, chunk, segment,
+                                          None, None)
+
+        if legacy is not None:
+            self._delete_legacy(name, legacy)
+
+    def _readers(self, name, runs=None, buffered=False, depths=None):
+        """
+        Column readers for the stored data of the named core; one per
+        segment asked for, or a single one for a core saved whole in the
+        columnar format. Returns None for cores still stored as one big JSON
+        list.
+
+        If buffered is True, each file is read into memory in full, so the
+        readers can be kept around. If depths is given, only segments that
+        overlap that (low, high) range are read.
+        """
+        def reader(myfile):
+            if buffered:
+                myfile = cStringIO.StringIO(myfile.read())
+            return CoreFileReader(myfile, self.codec)
+
+        legacy = self._open_legacy(name)
+        if legacy is None:
+            return [reader(segment) for segment in
+                    self._open_segments(name, runs, depths).itervalues()]
+        if is_columnar(legacy):
+            return [reader(legacy)]
+        legacy.close()
+        return None
+
+    def load_columns(self, core, names, runs=None):
+        """
+        Read only the given attributes of a core from storage.
+
+        Returns (depths, {(run, name): values}), where each values list is
+        aligned with depths and holds None for samples that have no value for
+        that attribute. Older (all-JSON) core files have to be loaded in full
+        to do this, but the result is the same.
+        """
+        #every sample has input data, so reading that run's depths (just the
+        #depths!) gets us the full list of samples in the core.
+        readers = self._readers(core.name, None if runs is None else
+                                           set(runs) | set(['input']))
+        if readers is not None:
+            rows = [(reader.depths().tolist(), reader) for reader in readers]
+            depths = sorted(set(itertools.chain(*[row[0] for row in rows])))
+            index = dict((depth, ind) for ind, depth in enumerate(depths))
+            columns = {}
+            for rowdepths, reader in rows:
+                for col in reader.columns(runs, names):
+                    values = columns.setdefault((col['run'], col['name']),
+                                                [None] * len(depths))
+                    for depth, val in zip(rowdepths, reader.read_column(col)):
+                        if val is not ABSENT:
+                            values[index[depth]] = val
+            return depths, columns
+
+        samples = sorted([(key, item) for key, item in
+                          self.iter_core_samples(core) if key != 'all'])
+        columns = {}
+        for index, (key, item) in enumerate(samples):
+            for run, data in item.iteritems():
+                if runs is not None and run not in runs:
+                    continue
+                for name in names:
+                    if name in data:
+                        columns.setdefault((run, name),
+                            [None] * len(samples))[index] = data[name]
+        return [key for key, item in samples], columns
+
+    def delete_item(self, key):
+        for (run, chunk), segment in self._open_segments(key).iteritems():
+            self._replace_segment(key, run, chunk, segment, None, None)
+        legacy = self._open_legacy(key)
+        if legacy is not None:
+            self._delete_legacy(key, legacy)
+
+    def _iter_segments(self, segments, runs=None, depths=None):
+        """
+        Yields (depth, {run: data}) from each of a list of segments in turn;
+        each one is only read once the ones before it are used up.
+        """
+        for segment in segments:
+            reader = CoreFileReader(cStringIO.StringIO(segment.read()),
+                                    self.codec)
+            for key, item in reader.lazy_samples(runs):
+                if depths is None or depths[0] <= key <= depths[1]:
+                    yield key, item
+
+    def iter_core_samples(self, core, runs=None, depths=None):
+        """
+        Yields (depth, {run: data}) for each sample in the core, in order of
+        depth, with data for only the given runs if runs is not None, and
+        only samples within the (low, high) range of depths if depths is.
+
+        Samples are yielded as they're read, so only the segment being read
+        (one per run) needs to be in memory at a time. Cores stored in the
+        old JSON format are read bit by bit too, but come in stored order.
+        """
+        legacy = self._open_legacy(core.name)
+        if legacy is None:
+            #each run's chunks are already in order of depth, as is each
+            #chunk, so the runs only need merging as they go
+            byrun = {}
+            for (run, chunk), segment in self._open_segments(
+                                    core.name, runs, depths).iteritems():
+                byrun.setdefault(run, []).append((chunk, segment))
+            streams = [self._iter_segments(
+                            [segment for chunk, segment in sorted(chunks)],
+                            runs, depths)
+                       for chunks in byrun.itervalues()]
+        elif is_columnar(legacy):
+            streams = [self._iter_segments([legacy], runs, depths)]
+        else:
+            legacy.close()
+            for key, item in self._iter_legacy_samples(core, runs):
+                if depths is None or key == 'all' or \
+                        depths[0] <= key <= depths[1]:
+                    yield key, item
+            return
+
+        def tagged(stream, index):
+            #the index breaks ties between runs, so items never get compared
+            for key, item in stream:
+                yield key, index, item
+
+        #values are only decoded as they're used
+        merged = heapq.merge(*[tagged(stream, index)
+                               for index, stream in enumerate(streams)])
+        for key, group in itertools.groupby(merged, lambda entry: entry[0]):
+            sample = {}
+            for key, index, item in group:
+                sample.update(item)
+            yield key, sample
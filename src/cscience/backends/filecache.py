@@ -0,0 +1,52 @@
+"""
+Local on-disk cache for data that's slow to decode from storage.
+
+Entries are keyed by a checksum of the stored form of the data (e.g. the md5
+GridFS keeps for each file), so a cached copy is used only for as long as
+what's stored is unchanged, and never needs invalidating by hand. Anything
+that goes wrong reading or writing the cache just means going back to the
+database.
+"""
+
+import cPickle
+import os
+import tempfile
+
+
+class FileCache(object):
+    #bump this if what gets cached for a given checksum changes
+    version = 1
+
+    def __init__(self, directory):
+        self.directory = os.path.expanduser(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, '%s-%d.pickle' % (key, self.version))
+
+    def get(self, key):
+        """
+        Returns the value cached for key, or None if there isn't one.
+        """
+        if not key:
+            return None
+        try:
+            with open(self._path(key), 'rb') as cachefile:
+                return cPickle.load(cachefile)
+        except Exception:
+            return None
+
+    def put(self, key, value):
+        if not key:
+            return
+        temp = None
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            #write somewhere else first so nobody ever reads half a file
+            handle, temp = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(handle, 'wb') as cachefile:
+                cPickle.dump(value, cachefile, cPickle.HIGHEST_PROTOCOL)
+            os.rename(temp, self._path(key))
+        except Exception:
+            if temp is not None and os.path.exists(temp):
+                os.remove(temp)
@@ -51,6 +51,9 @@ class Table(object):
             raise NameError
         
         
+    def loadmany(self, keys):
+        return dict(self.native_tbl.rows(list(keys)))
+
     #deal with batches...
         
     #NOTE: these are item-level conversion methods, and should be handled more clearly
@@ -133,7 +136,8 @@ class MapTable(Table):
         self.connection.create_table(self.itemtablename, 
                                      {self._colfam:{'max_versions':1}})
     
-    def loadkeys(self):
+    def loadkeys(self, fields=None):
+        #no projection here; everything gets loaded regardless of fields
         def backcompat(value):
             try:
                 return cPickle.loads(value)
@@ -1,6 +1,6 @@
 import cPickle
 import json
-import time
+import os
 import sys
 import traceback
 
@@ -9,9 +9,9 @@ import gridfs
 import pymongo.son_manipulator
 from pymongo.collection import Collection
 
-import scipy.interpolate
-from quantities import Quantity
-from cscience.framework import datastructures
+import config
+from cscience.backends import corefile, filecache
+from cscience.backends.codec import make_codec
 
 
 class Database(object):
@@ -75,14 +75,29 @@ class Table(object):
         cursor = self.native_tbl.find(fields=[self._keyfield])
         return [item[self._keyfield] for item in cursor]
 
+    def loadmany(self, keys):
+        """
+        Returns {key: document} for each of keys that's in the table.
+        """
+        cursor = self.native_tbl.find({self._keyfield: {'$in': list(keys)}})
+        transform = CustomTransformations()
+        return dict([(item[self._keyfield],
+                      transform.transform_outgoing_item(item, None))
+                     for item in cursor])
+
     #NOTE: these are item-level conversion methods, and should be handled more clearly
     def formatsavedata(self, data):
-        return {'pickled_data': unicode(cPickle.dumps(data))}
+        #a versioned record, encoded up front so it can be compared against
+        #what was loaded to see if the item's changed
+        return {'record': CustomTransformations.codec.encode(data)}
 
     def formatsavedict(self, data):
         return data
 
     def loaddataformat(self, data):
+        if 'record' in data:
+            return data['record']
+        #saved before records; gets converted next time it's saved
         return cPickle.loads(str(data['pickled_data']))
 
     def loaddictformat(self, data):
@@ -138,24 +153,25 @@ class LargeTable(Table):
             newfile.close()
 
     def _load_many(self, value):
+        #yields entries as the file is read, rather than parsing it all first
         try:
             myfile = self.fs.get_last_version(**{self._keyfield: value.name})
         except gridfs.NoFile:
-            return []
+            return
 
+        transform = CustomTransformations()
         try:
-            data = json.load(myfile)
-            #same as encoding hack above
-            data = CustomTransformations().transform_outgoing_item(data, None)
-            return data
+            for entry in corefile.iter_json_list(myfile):
+                #same as encoding hack above
+                yield transform.transform_outgoing_item(entry, None)
         finally:
             myfile.close()
 
-        return []
-
 
 class MilieuTable(LargeTable):
     _filetype = 'milieu_files'
+    #decoded milieus, by the md5 of their file
+    cache = filecache.FileCache(os.path.join(config.cache_location, 'milieus'))
 
     def keytransform(self, key, value):
         if not isinstance(key, tuple):
@@ -165,43 +181,115 @@ class MilieuTable(LargeTable):
         return value
 
     def iter_milieu_data(self, milieu):
-        entries = self._load_many(milieu)
-
-        for item in entries:
-            key = tuple(item['_saved_milieu_key'])
-            del item['_saved_milieu_key']
+        try:
+            myfile = self.fs.get_last_version(**{self._keyfield: milieu.name})
+        except gridfs.NoFile:
+            return
+        entries = self.cache.get(myfile.md5)
+        if entries is None:
+            try:
+                data = CustomTransformations().transform_outgoing_item(
+                                                    json.load(myfile), None)
+            finally:
+                myfile.close()
+            entries = []
+            for item in data:
+                key = tuple(item['_saved_milieu_key'])
+                del item['_saved_milieu_key']
+                entries.append((key, item))
+            self.cache.put(myfile.md5, entries)
+
+        for key, item in entries:
             yield key, item
 
 
-class CoreTable(LargeTable):
+class CoreTable(corefile.SegmentedCoreTable, LargeTable):
     _filetype = 'core_files'
+    #each run of a core (or chunk of one) gets its own file in here (see
+    #SegmentedCoreTable). core_files only holds cores saved before that
+    #split, until they're next saved.
+    _segmenttype = 'core_segments'
+    chunk_size = config.core_chunk_size
 
-    def delete_item(self, key):
+    def __init__(self, connection, name):
+        super(CoreTable, self).__init__(connection, name)
+        self.segments = gridfs.GridFS(self.connection,
+                                      collection=self._segmenttype)
+        files = self.segments._GridFS__files
         try:
-            oldversion = self.fs.get_last_version(**{self._keyfield: key})
-        except gridfs.NoFile:
+            #from before runs could be split into chunks
+            files.drop_index([(self._keyfield, pymongo.ASCENDING),
+                              ('run', pymongo.ASCENDING)])
+        except pymongo.errors.OperationFailure:
             pass
-        else:
-            self.fs.delete(oldversion._id)
+        files.ensure_index([(self._keyfield, pymongo.ASCENDING),
+                            ('run', pymongo.ASCENDING),
+                            ('chunk', pymongo.ASCENDING)], unique=True)
+        #for finding the chunks that cover a range of depths
+        files.ensure_index([(self._keyfield, pymongo.ASCENDING),
+                            ('mindepth', pymongo.ASCENDING),
+                            ('maxdepth', pymongo.ASCENDING)])
+
+    @property
+    def codec(self):
+        return CustomTransformations.codec
+
+    def _open_legacy(self, name):
+        try:
+            return self.fs.get_last_version(**{self._keyfield: name})
+        except gridfs.NoFile:
+            return None
+
+    def _delete_legacy(self, name, legacy):
+        self.fs.delete(legacy._id)
+
+    def _open_segments(self, name, runs=None, depths=None):
+        query = {self._keyfield: name}
+        if runs is not None:
+            query['run'] = {'$in': list(runs)}
+        if depths is not None:
+            #segments saved before chunking don't know their depths, so
+            #they always have to be looked at
+            query['$or'] = [{'mindepth': {'$lte': depths[1]},
+                             'maxdepth': {'$gte': depths[0]}},
+                            {'mindepth': {'$exists': False}}]
+        return dict(((segment.run, getattr(segment, 'chunk', 0)), segment)
+                    for segment in self.segments.find(query))
+
+    def _replace_segment(self, name, run, chunk, segment, data, depths):
+        if segment is not None:
+            self.segments.delete(segment._id)
+        if data is None:
+            return
+        newfile = self.segments.new_file(**{self._keyfield: name, 'run': run,
+                                            'chunk': chunk,
+                                            'mindepth': depths[0],
+                                            'maxdepth': depths[1]})
+        try:
+            newfile.write(data)
+        finally:
+            newfile.close()
 
     def keytransform(self, key, value):
         value['_precise_sample_depth'] = unicode(key)
         return value
 
-    def iter_core_samples(self, core):
-        entries = self._load_many(core)
-
-        #need to make sure all is first! (this does so hackily)
-        entries.sort(
-            key=lambda item: item['_precise_sample_depth'], reverse=True)
-
-        for item in entries:
+    def _iter_legacy_samples(self, core, runs=None):
+        #cores saved before the columnar format was introduced are one big
+        #json list, and need the old handling.
+        for item in self._load_many(core):
             if item['_precise_sample_depth'] == 'all':
                 #this stays to allow loading of cores that got saved pre-properties switchover
+                #(only once, along with the rest of the input data)
+                if runs is not None and 'input' not in runs:
+                    continue
                 key = 'all'
             else:
                 key = float(item['_precise_sample_depth'])
             del item['_precise_sample_depth']
+            if runs is not None and key != 'all':
+                item = dict((run, data) for run, data in item.iteritems()
+                            if run in runs)
             yield key, item
 
 
@@ -213,193 +301,40 @@ class MapTable(Table):
         super(MapTable, self).__init__(connection, itemtablename)
         self.itemtablename = itemtablename
 
-    def loadkeys(self):
-        cursor = self.native_tbl.find()
+    def loadkeys(self, fields=None):
+        """
+        Returns {key: document} for everything in the table; if fields is
+        given, documents only have those fields (and the key) filled in.
+        """
+        if fields is None:
+            cursor = self.native_tbl.find()
+        else:
+            cursor = self.native_tbl.find(
+                            fields=[self._keyfield] + list(fields))
         return dict([(item[self._keyfield], item) for item in cursor])
 
     def delete_item(self, key):
         self.native_tbl.remove({self._keyfield: key})
 
 
-class PointLists(object):
-    def transform_item_in(self, value):
-        #TODO: capture other types of stored funcs (eg bacon fuzz)
-        if hasattr(value, 'csv_data'):
-            return {'_datatype': 'baconinfo', 'csv_data': value.csv_data}
-
-        if hasattr(value, 'xpoints') and hasattr(value, 'ypoints'):
-            return {
-                '_datatype': 'pointlist',
-                'xpoints': list(value.xpoints),
-                'ypoints': list(value.ypoints)
-            }
-        return value
-
-    def transform_dict_out(self, value):
-        if value.get('_datatype', None) == 'baconinfo':
-            return datastructures.BaconInfo(value['csv_data'])
-
-        if value.get('_datatype', None) == 'pointlist':
-            return datastructures.PointlistInterpolation(
-                value['xpoints'], value['ypoints'])
-        return None
-
-
-class HandleQtys(object):
-    def handle_uncert_save(self, uncert):
-        if uncert.distribution:
-            return {
-                'dist': {
-                    'x': list(uncert.distribution.x),
-                    'y': list(uncert.distribution.y),
-                    'avg': uncert.distribution.average,
-                    'rng': uncert.distribution.range
-                }
-            }
-        else:
-            if not uncert.magnitude:
-                return {}
-            return {
-                'mag': [unicode(mag.magnitude) for mag in uncert.magnitude]
-            }
-
-    def handle_uncert_load(self, value):
-        if 'dist' in value:
-            try:
-                return datastructures.ProbabilityDistribution(
-                    value['dist']['x'], value['dist']['y'],
-                    value['dist']['avg'], value['dist']['rng'], False)
-            except TypeError:
-                return None
-        elif value:
-            if len(value['mag']) == 1:
-                return float(value['mag'][0])
-            else:
-                return [float(val) for val in value['mag']]
-        else:
-            return 0
-
-    def transform_item_in(self, value):
-        if hasattr(value, 'units'):
-            val = {
-                '_datatype': 'quantity',
-                'magnitude': unicode(value.magnitude),
-                'units': unicode(value.units.dimensionality)
-            }
-            if hasattr(value, 'uncertainty'):
-                val['uncertainty'] = self.handle_uncert_save(value.uncertainty)
-            return val
-        return value
-
-    def transform_dict_out(self, value):
-        if value.get('_datatype', None) == 'quantity':
-            if 'uncertainty' in value:
-                return datastructures.UncertainQuantity(
-                    value['magnitude'], value['units'],
-                    self.handle_uncert_load(value['uncertainty']))
-            else:
-                return Quantity(value['magnitude'], value['units'])
-        return None
-
-
-class ConversionEncoder(object):
-    def transform_item_in(self, value):
-        if isinstance(value, time.struct_time):
-            print 'still running into outgoing times...'
-            return {'timeval': list(value)}
-        return value
-
-    def transform_dict_out(self, value):
-        if 'Latitude' in value and 'Longitude' in value:
-            val = value.copy()
-            lat = val.pop('Latitude')
-            lon = val.pop('Longitude')
-            elev = val.pop('Elevation', None)
-            val['Core Site'] = datastructures.GeographyData(lat, lon, elev)
-            return val
-        if 'timeval' in value:
-            #Switch to using new, awesome times!
-            return datastructures.TimeData(time.struct_time(value['timeval']))
-        return None
-
-
-class LiPDObjEncoder(object):
-    #It's important that this guy go last, since *some* data types that we know
-    #how to send to LiPD have different mongodb formats, and are handled by
-    #other parsers.
-    def transform_item_in(self, value):
-        if hasattr(value, 'LiPD_tuple'):
-            return dict([value.LiPD_tuple()])
-        return value
-
-    def transform_dict_out(self, value):
-        #TODO: build a slightly better switch for this
-        if 'geo' in value:
-            return datastructures.GeographyData.parse_value(value['geo'])
-        elif 'timestamp' in value:
-            return datastructures.TimeData.parse_value(value['timestamp'])
-        elif 'time' in value:
-            return datastructures.TimeData.parse_value(value['time'])
-        elif 'publist' in value:
-            return datastructures.PublicationList.parse_value(value['publist'])
-        elif 'pub' in value:
-            return datastructures.PublicationList.parse_value(value['pub'])
-        return None
-
-
 class CustomTransformations(pymongo.son_manipulator.SONManipulator):
-    def __init__(self):
-        self.transformers = [
-            HandleQtys(),
-            PointLists(),
-            ConversionEncoder(),
-            LiPDObjEncoder()
-        ]
+    #all the actual conversion work is done by the codec; this just lets
+    #pymongo use it.
+    codec = make_codec()
 
     def will_copy(self):
         return True
 
-    def do_item_incoming(self, value):
-        for trans in self.transformers:
-            value = trans.transform_item_in(value)
-        return value
-
     def transform_incoming_item(self, value, collection):
-        if isinstance(value, dict):
-            return self.transform_incoming(value, collection)
-        elif isinstance(value, list) or isinstance(value, tuple):
-            return [
-                self.transform_incoming_item(item, collection)
-                for item in value
-            ]
-        else:
-            return self.do_item_incoming(value)
+        return self.codec.encode(value)
 
     def transform_incoming(self, son, collection):
-        son = son.copy()
-        for key, value in son.iteritems():
-            son[key] = self.transform_incoming_item(value, collection)
-        return son
-
-    def do_item_outgoing(self, value, collection):
-        for trans in self.transformers:
-            val = trans.transform_dict_out(value)
-            if val is not None:
-                return val
-        return self.transform_outgoing(value, collection)
+        return self.codec.encode_dict(son)
 
     def transform_outgoing_item(self, value, collection):
-        if isinstance(value, dict):
-            return self.do_item_outgoing(value, collection)
-        elif isinstance(value, list):
-            return [
-                self.transform_outgoing_item(item, collection)
-                for item in value
-            ]
-        else:
-            return value
+        return self.codec.decode(value)
 
     def transform_outgoing(self, son, collection):
         for key, value in son.iteritems():
-            son[key] = self.transform_outgoing_item(value, collection)
+            son[key] = self.codec.decode(value)
         return son
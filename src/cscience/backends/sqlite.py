@@ -0,0 +1,460 @@
+"""
+Single-file backend, for single-user installs that shouldn't need a database
+server running. The data source is the path to an SQLite database file (which
+gets created if it doesn't exist yet); the port is ignored.
+
+Every collection is a table of (name, JSON document), with values converted
+by the same codec the mongodb backend uses (the core and milieu maps also keep
+the few fields read at startup in a column of their own). Core samples are kept as columnar
+segments, one per run, and milieus as one JSON list each, just as they are in
+mongodb's GridFS collections, so data moves between the two as-is (see
+convert_from_mongo).
+"""
+
+import cPickle
+import cStringIO
+import hashlib
+import json
+import os
+import sqlite3
+
+import config
+from cscience.backends import corefile, filecache
+from cscience.backends.codec import make_codec
+
+codec = make_codec()
+
+
+class Database(object):
+    def __init__(self, data_source, port=None):
+        data_source = os.path.expanduser(data_source)
+        directory = os.path.dirname(os.path.abspath(data_source))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        #the app only ever has one thread at the data at a time, but that
+        #isn't always the thread that opened it. Batch runs can have several
+        #processes saving at once, though, so wait a good while for the lock.
+        self.connection = sqlite3.connect(data_source,
+                                          check_same_thread=False,
+                                          timeout=120)
+        #readers don't block the writer (or vice versa) in WAL mode, and
+        #it only needs to sync on checkpoints, not every commit.
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+    def table(self, tablename):
+        return Table(self.connection, tablename)
+
+    def ctable(self, tablename):
+        return CoreTable(self.connection, tablename)
+
+    def mtable(self, tablename):
+        return MilieuTable(self.connection, tablename)
+
+    def maptable(self, maptablename, itemtablename):
+        return MapTable(self.connection, maptablename, itemtablename)
+
+    def close(self):
+        self.connection.close()
+
+
+def quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def dumpdoc(value):
+    return json.dumps(codec.encode(value), separators=(',', ':'))
+
+
+def loaddoc(data):
+    return codec.decode(json.loads(data))
+
+
+class Table(object):
+    _keyfield = 'name'
+
+    def __init__(self, connection, name):
+        self.name = name
+        self.connection = connection
+        self.native_tbl = quote(name)
+
+    def exists(self):
+        return self.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                (self.name,)).fetchone() is not None
+
+    def do_create(self):
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS %s '
+                '(name TEXT PRIMARY KEY, data TEXT NOT NULL)' % self.native_tbl)
+
+    def _fetch(self, key):
+        row = self.connection.execute(
+                'SELECT data FROM %s WHERE name=?' % self.native_tbl,
+                (key,)).fetchone()
+        if row is None:
+            return None
+        value = loaddoc(row[0])
+        value[self._keyfield] = key
+        return value
+
+    def loadone(self, key):
+        try:
+            return self._fetch(key)
+        except sqlite3.OperationalError:
+            #no table, no items
+            return None
+
+    def savemany(self, items, *args, **kwargs):
+        if not items:
+            return
+        self.do_create()
+        docs = []
+        for key, value in items:
+            #like a mongo $set, this only replaces the fields given
+            doc = self._fetch(key) or {}
+            doc.update(value)
+            doc.pop(self._keyfield, None)
+            docs.append((key, doc))
+        self._write(docs)
+
+    def _write(self, docs):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO %s (name, data) VALUES (?, ?)' %
+                self.native_tbl, [(key, dumpdoc(doc)) for key, doc in docs])
+
+    # query is a dict filter.  Will delete the 1st that matches.
+    def delete_one(self, query):
+        if set(query) != set([self._keyfield]):
+            raise NotImplementedError('can only delete by %s' % self._keyfield)
+        if not self.exists():
+            return
+        with self.connection:
+            self.connection.execute('DELETE FROM %s WHERE name=?' %
+                                    self.native_tbl, (query[self._keyfield],))
+
+    def loadkeys(self):
+        if not self.exists():
+            raise NameError(self.name)
+        return [row[0] for row in self.connection.execute(
+                            'SELECT name FROM %s' % self.native_tbl)]
+
+    def loadmany(self, keys):
+        """
+        Returns {key: document} for each of keys that's in the table.
+        """
+        keys = list(keys)
+        result = {}
+        if not self.exists():
+            return result
+        #sqlite only takes so many parameters per query
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            for key, data in self.connection.execute(
+                    'SELECT name, data FROM %s WHERE name IN (%s)' %
+                    (self.native_tbl, ', '.join('?' * len(batch))), batch):
+                value = loaddoc(data)
+                value[self._keyfield] = key
+                result[key] = value
+        return result
+
+    #NOTE: these are item-level conversion methods, and should be handled more clearly
+    def formatsavedata(self, data):
+        return {'record': codec.encode(data)}
+
+    def formatsavedict(self, data):
+        return data
+
+    def loaddataformat(self, data):
+        if 'record' in data:
+            return data['record']
+        return cPickle.loads(str(data['pickled_data']))
+
+    def loaddictformat(self, data):
+        return data
+
+
+class MilieuTable(Table):
+    #one JSON list per milieu, same as in mongo's milieu_files, with its md5
+    #to key the local cache of decoded milieus
+    _filetype = 'milieu_files'
+    cache = filecache.FileCache(os.path.join(config.cache_location, 'milieus'))
+
+    def __init__(self, connection, name):
+        super(MilieuTable, self).__init__(connection, self._filetype)
+
+    def do_create(self):
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS %s '
+                '(name TEXT PRIMARY KEY, md5 TEXT, data BLOB NOT NULL)' %
+                self.native_tbl)
+
+    def loadone(self, key):
+        raise NotImplementedError
+
+    def save_raw(self, name, data):
+        """
+        Store an already-encoded milieu.
+        """
+        self.do_create()
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO %s (name, md5, data) VALUES (?, ?, ?)' %
+                self.native_tbl,
+                (name, hashlib.md5(data).hexdigest(), sqlite3.Binary(data)))
+
+    def savemany(self, items, *args, **kwargs):
+        if not items:
+            return
+        entries = []
+        for key, value in items:
+            if not isinstance(key, tuple):
+                key = (key, )
+            value = value.copy()
+            value['_saved_milieu_key'] = key
+            entries.append(value)
+        self.save_raw(kwargs['name'], dumpdoc(entries))
+
+    def iter_milieu_data(self, milieu):
+        try:
+            row = self.connection.execute(
+                    'SELECT md5 FROM %s WHERE name=?' % self.native_tbl,
+                    (milieu.name,)).fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row is None:
+            return
+        md5 = row[0]
+        entries = self.cache.get(md5)
+        if entries is None:
+            data, = self.connection.execute(
+                    'SELECT data FROM %s WHERE name=?' % self.native_tbl,
+                    (milieu.name,)).fetchone()
+            entries = []
+            for item in loaddoc(str(data)):
+                key = tuple(item['_saved_milieu_key'])
+                del item['_saved_milieu_key']
+                entries.append((key, item))
+            self.cache.put(md5, entries)
+
+        for key, item in entries:
+            yield key, item
+
+
+class Segment(object):
+    """
+    A stored core segment, which is only fetched when it's read.
+    """
+
+    def __init__(self, table, rowid):
+        self.table = table
+        self.rowid = rowid
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            data, = self.table.connection.execute(
+                    'SELECT data FROM %s WHERE rowid=?' % self.table.segments,
+                    (self.rowid,)).fetchone()
+            self._file = cStringIO.StringIO(str(data))
+        return self._file
+
+    def read(self, *args):
+        return self._open().read(*args)
+
+    def seek(self, *args):
+        return self._open().seek(*args)
+
+
+class CoreTable(corefile.SegmentedCoreTable, Table):
+    #each run of a core (or chunk of one) is its own columnar segment; see
+    #SegmentedCoreTable
+    _segmenttype = 'core_segments'
+    codec = codec
+    chunk_size = config.core_chunk_size
+
+    def __init__(self, connection, name):
+        super(CoreTable, self).__init__(connection, name)
+        self.segments = quote(self._segmenttype)
+        self.do_create()
+
+    def do_create(self):
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS %s (name TEXT NOT NULL, '
+                'run TEXT NOT NULL, chunk INTEGER NOT NULL, '
+                'mindepth REAL NOT NULL, maxdepth REAL NOT NULL, '
+                'data BLOB NOT NULL, PRIMARY KEY (name, run, chunk))' %
+                self.segments)
+            #for finding the chunks that cover a range of depths
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS %s ON %s (name, mindepth, maxdepth)'
+                % (quote(self._segmenttype + '_depths'), self.segments))
+
+    def loadone(self, key):
+        raise NotImplementedError
+
+    def _open_segments(self, name, runs=None, depths=None):
+        query = 'SELECT run, chunk, rowid FROM %s WHERE name=?' % self.segments
+        args = [name]
+        if runs is not None:
+            runs = list(runs)
+            query += ' AND run IN (%s)' % ', '.join('?' * len(runs))
+            args.extend(runs)
+        if depths is not None:
+            query += ' AND mindepth <= ? AND maxdepth >= ?'
+            args.extend([depths[1], depths[0]])
+        return dict(((run, chunk), Segment(self, rowid))
+                    for run, chunk, rowid in self.connection.execute(query, args))
+
+    def _replace_segment(self, name, run, chunk, segment, data, depths):
+        with self.connection:
+            if data is None:
+                self.connection.execute(
+                    'DELETE FROM %s WHERE name=? AND run=? AND chunk=?' %
+                    self.segments, (name, run, chunk))
+            else:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO %s (name, run, chunk, mindepth, '
+                    'maxdepth, data) VALUES (?, ?, ?, ?, ?, ?)' % self.segments,
+                    (name, run, chunk, depths[0], depths[1],
+                     sqlite3.Binary(data)))
+
+
+class MapTable(Table):
+    #the fields read for every item when the app starts (see Cores.loadkeys
+    #and Milieus.loadkeys) are also kept in a column of their own, so that
+    #doesn't mean reading everything else (like core properties) too
+    light_fields = {'cores': ('runs', 'summary'),
+                    'milieus': ('template', 'size')}
+
+    def __init__(self, connection, myname, itemtablename):
+        super(MapTable, self).__init__(connection, itemtablename)
+        self.itemtablename = itemtablename
+        self.light = self.light_fields.get(itemtablename, ())
+
+    def _has_light(self):
+        return any(row[1] == 'light' for row in self.connection.execute(
+                                'PRAGMA table_info(%s)' % self.native_tbl))
+
+    def do_create(self):
+        super(MapTable, self).do_create()
+        if self.light and not self._has_light():
+            #from before there was one; filled in as items are saved
+            with self.connection:
+                self.connection.execute('ALTER TABLE %s ADD COLUMN light TEXT'
+                                        % self.native_tbl)
+
+    def _write(self, docs):
+        if not self.light:
+            return super(MapTable, self)._write(docs)
+        rows = [(key, dumpdoc(doc), dumpdoc(dict(
+                    (field, doc[field]) for field in self.light
+                    if field in doc))) for key, doc in docs]
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO %s (name, data, light) '
+                'VALUES (?, ?, ?)' % self.native_tbl, rows)
+
+    def loadkeys(self, fields=None):
+        """
+        Returns {key: document} for everything in the table; if fields is
+        given, documents only have those fields (and the key) filled in.
+        """
+        if not self.exists():
+            raise NameError(self.name)
+        if fields is not None and set(fields) <= set(self.light) and \
+                self._has_light():
+            #items saved before there was a light column need the lot
+            query = 'SELECT name, COALESCE(light, data) FROM %s'
+        else:
+            query = 'SELECT name, data FROM %s'
+        result = {}
+        for key, data in self.connection.execute(query % self.native_tbl):
+            value = json.loads(data)
+            if fields is not None:
+                #skip decoding anything we don't need
+                value = dict((field, value[field]) for field in fields
+                             if field in value)
+            value = codec.decode(value)
+            value[self._keyfield] = key
+            result[key] = value
+        return result
+
+    def delete_item(self, key):
+        self.delete_one({self._keyfield: key})
+
+
+def convert_from_mongo(repo, data_source):
+    """
+    Copy everything in a mongodb repository (a pymongo Database) into the
+    SQLite file at data_source. Cores are written as per-run segments however
+    they were stored in mongo.
+    """
+    from cscience.backends import mongodb
+
+    target = Database(data_source)
+    gridcollections = ('core_files', 'core_segments', 'milieu_files')
+    for name in repo.collection_names():
+        if name.startswith('system.') or name.split('.')[0] in gridcollections:
+            continue
+        table = target.table(name)
+        table.do_create()
+        items = []
+        for doc in repo[name].find():
+            doc.pop('_id', None)
+            key = doc.pop(Table._keyfield, None)
+            if key is None:
+                continue
+            if name == 'milieus' and 'keys' in doc:
+                #milieu keys come with their data now
+                doc['size'] = len(doc.pop('keys'))
+            doc = codec.decode(doc)
+            if 'pickled_data' in doc:
+                doc['record'] = cPickle.loads(str(doc.pop('pickled_data')))
+            items.append((key, doc))
+        table.savemany(items)
+
+    milieus = target.mtable('milieus')
+    source = mongodb.MilieuTable(repo, 'milieus')
+    milieumap = target.table('milieus')
+    for name in (milieumap.loadkeys() if milieumap.exists() else []):
+        data = source.fs.find_one({'name': name})
+        if data is not None:
+            milieus.save_raw(name, data.read())
+
+    class Named(object):
+        def __init__(self, name):
+            self.name = name
+
+    cores = target.ctable('cores')
+    coremap = target.table('cores')
+    source = mongodb.CoreTable(repo, 'cores')
+    for name in (coremap.loadkeys() if coremap.exists() else []):
+        samples = []
+        for key, value in source.iter_core_samples(Named(name)):
+            if key == 'all':
+                #pre-properties data; same move into properties a load does
+                properties = dict((run, dict(data)) for run, data in
+                                  value.iteritems())
+                properties.get('input', {}).pop('depth', None)
+                properties.get('input', {}).pop('core', None)
+                coremap.savemany([(name, {'properties': properties})])
+            else:
+                samples.append((key, value))
+        cores.savemany(samples, name=name)
+    target.close()
+
+
+if __name__ == '__main__':
+    import sys
+    import pymongo
+
+    if len(sys.argv) != 2:
+        print 'usage: python -m cscience.backends.sqlite <database file>'
+        sys.exit(1)
+    convert_from_mongo(pymongo.MongoClient()['repository'], sys.argv[1])
+    print 'repository copied to', sys.argv[1]
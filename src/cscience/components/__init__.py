@@ -2,7 +2,6 @@ import os
 import sys
 import config
 
-import wx
 import quantities
 
 library = {}
@@ -26,6 +25,10 @@ class BaseComponent(object):
 
     __metaclass__ = _ComponentType
 
+    #name -> value for everything user_inputs would ask for, when there's no
+    #one around to ask (see Workflow.execute)
+    answers = None
+
     def __init__(self):
         self.connections = dict.fromkeys(self.output_ports())
         self.workflow = None
@@ -63,14 +66,56 @@ class BaseComponent(object):
 
     def user_inputs(self, core, input_data):
         #TODO: attributes?
-        inputdlg = InputQuery(core, input_data)
-        if inputdlg.ShowModal() == wx.ID_OK:
-            result = inputdlg.result
-            for name, input in result.iteritems():
-                self.set_value(core, name, input)
-        inputdlg.Destroy()
+        if self.answers is not None:
+            result = dict([(details[0], self.answer(details))
+                           for details in input_data])
+        else:
+            #only ask if there's someone to ask; keeps wx out of batch runs
+            import wx
+            from cscience.GUI.dialogs import InputQuery
+            result = {}
+            inputdlg = InputQuery(core, input_data)
+            if inputdlg.ShowModal() == wx.ID_OK:
+                result = inputdlg.result
+            inputdlg.Destroy()
+        for name, input in result.iteritems():
+            self.set_value(core, name, input)
         return result
 
+    def answer(self, details):
+        """
+        The value given in self.answers for one user_inputs entry, as the
+        same type InputQuery would have returned. Numbers can be given bare,
+        or as [value, error] (or {'value':..., 'error':...}) for inputs that
+        take an error; the entry's default is used if there's no answer.
+        """
+        name, attdata = details[0], details[1]
+        try:
+            value = self.answers[name]
+        except KeyError:
+            if len(details) < 3:
+                raise KeyError("No answer given for '%s'" % name)
+            value = details[2]
+
+        if attdata[0] == 'boolean':
+            return bool(value)
+        elif attdata[0] == 'string':
+            return value
+        type_ = int if attdata[0] == 'integer' else float
+        if attdata[2]:
+            if isinstance(value, dict):
+                value, error = value['value'], value.get('error')
+            elif isinstance(value, (list, tuple)):
+                value, error = value[0], list(value[1:]) or None
+            else:
+                error = None
+            if isinstance(error, list) and len(error) == 1:
+                error = error[0]
+            return UncertainQuantity(type_(value), attdata[1], error)
+        elif attdata[1]:
+            return quantities.Quantity(type_(value), attdata[1])
+        return type_(value)
+
     def set_value(self, core, name, value):
         core.properties[name] = value
         core.partial_run.addvalue(name, value)
@@ -114,172 +159,3 @@ class ComponentAttribute(object):
         self.type_ = kwargs.get('type', 'float')
         self.unit = kwargs.get('unit', None)
         self.error = kwargs.get('error', False)
-        
-
-#TODO: better error checking!
-class InputQuery(wx.Dialog):
-    class BooleanInput(wx.RadioBox):
-        def __init__(self, parent):
-            super(InputQuery.BooleanInput, self).__init__(parent, wx.ID_ANY, label="",
-                                               choices=['Yes', 'No'])
-        def get_value(self):
-            #not, since we have No in the 1 position
-            return not self.GetSelection()
-
-    class StringInput(wx.TextCtrl):
-        def get_value(self):
-            return self.GetValue()
-
-    class NumericInput(wx.TextCtrl):
-        def __init__(self, parent, type_=float, unit=None, defval=0, minmax=(None, None)):
-            super(InputQuery.NumericInput, self).__init__(parent, wx.ID_ANY)
-
-            self.type_ = type_
-            self.minmax = minmax
-            self.unit = unit
-            self.defval = defval
-            if minmax[0] and self.defval < minmax[0]:
-                self.defval = minmax[0]
-            if minmax[1] and self.defval > minmax[1]:
-                self.defval = minmax[1]
-            self.defval = str(self.defval)
-            self.SetValue(self.defval)
-            self.SetSelection(-1, -1)
-
-            self.Bind(wx.EVT_KILL_FOCUS, self.check_input)
-            self.Bind(wx.EVT_SET_FOCUS, self.highlight)
-
-        def show_error(self, err):
-            if err:
-                self.SetValue(self.defval)
-                self.SetBackgroundColour('red')
-                self.SetSelection(-1, -1)
-            else:
-                self.SetBackgroundColour('white')
-
-        def check_input(self, event):
-            try:
-                val = self.type_(self.GetValue())
-            except ValueError:
-                self.show_error(True)
-            else:
-                if self.minmax[0] is not None and val < self.minmax[0]:
-                    self.show_error(True)
-                elif self.minmax[1] is not None and val > self.minmax[1]:
-                    self.show_error(True)
-                else:
-                    self.show_error(False)
-
-            event.Skip()
-
-        def highlight(self, event):
-            #wait till all selections are actually finshed, then select
-            wx.CallAfter(self.SetSelection, -1, -1)
-            event.Skip()
-
-        def get_value(self):
-            val = self.type_(self.GetValue())
-            if self.unit:
-                return quantities.Quantity(val, self.unit)
-            else:
-                return val
-
-    class ErrorInput(wx.Panel):
-        def __init__(self, parent, type_=float, unit=None, minmax=(None, None)):
-            super(InputQuery.ErrorInput, self).__init__(parent, wx.ID_ANY)
-            self.main_input = InputQuery.NumericInput(self, type_, None, minmax)
-            self.err_input = InputQuery.NumericInput(self, type_)
-
-            self.unit = unit
-
-            sizer = wx.BoxSizer(wx.HORIZONTAL)
-            sizer.Add(self.main_input, flag=wx.EXPAND | wx.TOP | wx.BOTTOM | wx.RIGHT,
-                      border=2, proportion=1)
-            sizer.Add(wx.StaticText(self, label='+/-'), flag=wx.ALL, border=2)
-            sizer.Add(self.err_input, flag=wx.EXPAND | wx.TOP | wx.BOTTOM | wx.LEFT,
-                      border=2, proportion=1)
-            self.SetSizer(sizer)
-
-        def get_value(self):
-            return UncertainQuantity(self.main_input.get_value(), self.unit,
-                                     self.err_input.get_value())
-
-    class LabelledInput(wx.Panel):
-        def __init__(self, parent, label, control_type, params=[], extra={}):
-            super(InputQuery.LabelledInput, self).__init__(parent)
-
-            tooltip = extra.pop('helptip', '')
-            self.control = control_type(self, *params, **extra)
-            if tooltip:
-                helplabel = wx.StaticText(self, wx.ID_ANY, tooltip)
-                helplabel.SetFont(helplabel.GetFont().Scale(.9))
-                
-
-            sizer = wx.BoxSizer(wx.HORIZONTAL)
-            sizer.Add(wx.StaticText(self, label=label), flag=wx.ALL, border=2)
-            if tooltip:
-                csizer = wx.BoxSizer(wx.VERTICAL)
-                csizer.Add(self.control, flag=wx.EXPAND, proportion=1)
-                csizer.Add(helplabel, flag=wx.LEFT, border=10)
-                sizer.Add(csizer, flag=wx.EXPAND | wx.ALL, border=2, proportion=1)
-            else:
-                sizer.Add(self.control, flag=wx.EXPAND | wx.ALL, border=2, proportion=1)
-            if params[1]: #unit
-                sizer.Add(wx.StaticText(self, label=params[1]), flag=wx.ALL, border=2)
-            self.SetSizer(sizer)
-
-        def get_value(self):
-            return self.control.get_value()
-
-    def __init__(self, core, dataneeded):
-        #TODO: the sizing on these is really freaking annoying; I should get that
-        #fixed.
-        super(InputQuery, self).__init__(None, title='Please Provide Input', style=wx.CAPTION)
-
-        self.dataneeded = dataneeded
-        self.controls = {}
-
-        scrolledwindow = wx.ScrolledWindow(self)
-        sizer = wx.BoxSizer(wx.VERTICAL)
-
-        #TODO set control default values as appropriate from core
-        for details in self.dataneeded:
-            sizer.Add(self.create_control(details[0], details[1:], scrolledwindow),
-                      flag=wx.EXPAND | wx.ALL, border=3)
-
-        scrolledwindow.SetSizer(sizer)
-        scrolledwindow.SetScrollRate(20, 20)
-        scrolledwindow.EnableScrolling(True, True)
-
-        sizer = wx.BoxSizer(wx.VERTICAL)
-        sizer.Add(scrolledwindow, flag=wx.EXPAND | wx.ALL, border=2, proportion=1)
-        sizer.Add(wx.Button(self, wx.ID_OK), flag=wx.CENTER|wx.ALL, border=5)
-        self.SetSizer(sizer)
-
-        scrolledwindow.Layout()
-        self.Centre()
-        self.Layout()
-
-    def create_control(self, name, details, parent):
-        attdata = details[0]
-        otherparms = details[2] if len(details) > 2 else {}
-        defval = details[1] if len(details) > 1 else 0
-        params = []
-        if attdata[0] == 'boolean':
-            ctrl = InputQuery.BooleanInput
-        elif attdata[0] == 'string':
-            ctrl = InputQuery.StringInput
-        else:
-            ctrl = InputQuery.ErrorInput if attdata[2] else InputQuery.NumericInput
-            type_ = int if attdata[0] == 'integer' else float
-            params = [type_, attdata[1], defval] #unit
-
-        ctrl = InputQuery.LabelledInput(parent, name, ctrl, params, otherparms)
-        self.controls[name] = ctrl
-        return ctrl
-
-    @property
-    def result(self):
-        return dict([(name, ctrl.get_value()) for name, ctrl in self.controls.items()])
-
-
@@ -11,8 +11,6 @@ import scipy.interpolate
 import tempfile
 import operator
 import quantities
-import wx.lib.agw.pybusyinfo as PBI
-import wx.lib.delayedresult as delayedresult
 
 warnings.filterwarnings(
     "always", category=ImportWarning)  # remove filter on ImportWarning
@@ -30,6 +28,37 @@ def warning_on_one_line(message,
 
 warnings.formatwarning = warning_on_one_line
 
+
+def read_output(reader, mindepth, truethick, sections):
+    """
+    Reads the rows of a Bacon output file into ([depths, path, path, ...],
+    mean age at each depth). Each path gives the age at every depth for one
+    saved iteration; depths are every truethick (cm) from mindepth.
+    """
+    sums = [0] * (sections + 1)
+    total_info = [[mindepth + (truethick * i) for i in range(sections + 1)]]
+    total = 0
+    for it in reader:
+        if not it:
+            continue
+        path_ls = [0] * (sections + 1)
+        total += 1
+        #as read by csv, the bacon output file has an empty entry as its
+        #first column, so we ignore that. 1st real column is a special case,
+        #a set value instead of accumulation: the age at the top of the core
+        cumage = float(it[1])
+        sums[0] += cumage
+        path_ls[0] = cumage
+        #last 2 cols are not acc rates; they are "w" and "U"; currently
+        #ignored, but related to it probability
+        for ind, acc in enumerate(it[2:-2]):
+            cumage += truethick * float(acc)
+            sums[ind + 1] += cumage
+            path_ls[ind + 1] += cumage
+        total_info.append(path_ls)
+    return total_info, [sum / total for sum in sums]
+
+
 try:
     import cfiles.baconc
 except ImportError as ie:
@@ -103,8 +132,9 @@ else:
                 return float(core[key]['depth'].rescale('cm').magnitude)
 
             thickguess = 5
-            mindepth = scaledepth(min(core.keys()))
-            maxdepth = scaledepth(max(core.keys()))
+            depths = core.depths()
+            mindepth = scaledepth(depths[0])
+            maxdepth = scaledepth(depths[-1])
             sections = (maxdepth - mindepth) / thickguess
             if sections < 10:
                 thickguess = min(
@@ -122,7 +152,7 @@ else:
                   ('float', None, False), 0.7), ('Bacon Memory: Strength',
                                                  ('float', None, False), 4),
                  ('Bacon Difference',
-                  ('float', None, False), max(core.keys()) - min(core.keys())),
+                  ('float', None, False), depths[-1] - depths[0]),
                  ('Bacon Sections', ('float', None, False), sections),
                  ('Bacon t_a', ('integer', None, False), 4, {
                      'helptip': 't_b = t_a + 1'
@@ -167,10 +197,14 @@ else:
             #            double firstguess, double secondguess, double mindepth, double maxdepth,
             #            char* outfile, int numsamples)
             time_change = 30
-            computation_progress = PBI.PyBusyInfo(
-                "Please Be Patient. \n" + "Time Remaining: " +
-                str(time_change),
-                title="Runnning Computation")
+            computation_progress = None
+            if self.answers is None:
+                #nobody to show it to in a batch run
+                import wx.lib.agw.pybusyinfo as PBI
+                computation_progress = PBI.PyBusyInfo(
+                    "Please Be Patient. \n" + "Time Remaining: " +
+                    str(time_change),
+                    title="Runnning Computation")
             cfiles.baconc.run_simulation(
                 len(data),
                 [cfiles.baconc.PreCalDet(*sample)
@@ -188,33 +222,8 @@ else:
             reader = csv.reader(
                 self.tempfile, dialect='excel-tab', skipinitialspace=True)
             truethick = float(maxdepth - mindepth) / sections
-            sums = [0] * (sections + 1)
-            total_info = []
-
-            depth = [mindepth + (truethick * i) for i in range(sections + 1)]
-
-            total_info.append(depth)
-
-            total = 0
-
-            for it in reader:
-                if not it:
-                    continue
-                path_ls = [0] * (sections + 1)
-                total += 1
-                #as read by csv, the bacon output file has an empty entry as its
-                #first column, so we ignore that. 1st real column is a special case,
-                #a set value instead of accumulation
-                cumage = float(it[1])
-                sums[0] += cumage
-                #last 2 cols are not acc rates; they are "w" and "U"; currently
-                #ignored, but related to it probability
-                for ind, acc in enumerate(it[2:-2]):
-                    cumage += truethick * float(acc)
-                    sums[ind + 1] += cumage
-                    path_ls[ind + 1] += cumage
-                total_info.append(path_ls)
-            sums = [sum / total for sum in sums]
+            total_info, sums = read_output(reader, mindepth, truethick,
+                                           sections)
             self.tempfile.close()
 
             core.properties[
@@ -5,10 +5,6 @@ For more on creating components see writing_components.txt in src/ .
 
 """
 
-import urllib2
-import httplib
-import wx
-import wx.html
 import numpy as np
 from scipy import integrate
 
@@ -50,8 +46,16 @@ class ReservoirCorrection(cscience.components.BaseComponent):
             raise AttributeError("Core Site Not Found!")
         else:
             adj_point = self.get_closest_adjustment(geo)
-            dlg = ReservoirCorrection.MapDialog(geo, adj_point)
-            if dlg.ShowModal() == wx.ID_OK:
+            if self.answers is not None:
+                #batch runs take the closest point unless given a correction
+                accepted = 'Reservoir Correction' not in self.answers
+            else:
+                import wx
+                from cscience.GUI.dialogs import ReservoirMapDialog
+                dlg = ReservoirMapDialog(geo, adj_point)
+                accepted = dlg.ShowModal() == wx.ID_OK
+                dlg.Destroy()
+            if accepted:
                 self.set_value(core, 'Reservoir Correction',
                                datastructures.UncertainQuantity(
                                    adj_point.get('Delta R', 0),
@@ -60,9 +64,15 @@ class ReservoirCorrection(cscience.components.BaseComponent):
             else:
                 self.user_inputs(core, [('Reservoir Correction', ('float', 'years', True))])
                 self.set_value(core, 'Manual Reservoir Correction', True)
-            dlg.Destroy()
-        for sample in core:
-            sample['Corrected 14C Age'] = sample['14C Age'] + (-sample['Reservoir Correction'])
+        #correct the whole core at once
+        samples = list(core)
+        ages = datastructures.UncertainArray.from_quantities(
+                            [sample['14C Age'] for sample in samples])
+        corrections = datastructures.UncertainArray.from_quantities(
+                            [sample['Reservoir Correction'] for sample in samples])
+        corrected = (ages - corrections).to_quantities()
+        for sample, age in zip(samples, corrected):
+            sample['Corrected 14C Age'] = age
 
     def get_closest_adjustment(self, core_loc):
 
@@ -78,62 +88,6 @@ class ReservoirCorrection(cscience.components.BaseComponent):
 
         return closest_point
 
-    class MapDialog(wx.Dialog):
-        """
-        A nice user-friendly map to show where the reservoir correction point
-        we're using from our database turns out to be
-        """
-        MAP_FORMAT = """<html xmlns="http://www.w3.org/1999/xhtml">
-            <img src="http://maps.googleapis.com/maps/api/staticmap?size=400x300&markers=color:blue|label:S|{0},{1}&markers=color:red|label:R|{2},{3}"
-            </img></html>"""
-
-        def __init__(self, core_loc, closest_data):
-            super(ReservoirCorrection.MapDialog, self).__init__(
-                None, title="Reservoir Location Map", style=wx.CAPTION)
-
-            sizer = wx.BoxSizer(wx.VERTICAL)
-            try:
-                urllib2.urlopen('http://www.google.com', timeout=1)
-            except (urllib2.URLError, httplib.BadStatusLine):
-                # No network connection, fallback to textual display (no map)
-                sizer.Add(wx.StaticText(self, label="Selected Reservoir Coordinates:"),
-                          flag=wx.EXPAND | wx.CENTER | wx.ALL, border=5)
-                sizer.Add(wx.StaticText(self, label="{0}, {1}".\
-                            format(closest_data['Latitude'], closest_data['Longitude'])),
-                          flag=wx.EXPAND | wx.CENTER | wx.ALL, border=5)
-                sizer.Add(wx.StaticText(self, label="Reservoir Age: {0}, Error: {1}".\
-                            format(closest_data['Delta R'], closest_data['Error'])),
-                          flag=wx.EXPAND | wx.CENTER | wx.ALL, border=5)
-            else:
-                #google works, anyway...
-                self.browser = wx.html.HtmlWindow(self, wx.ID_ANY, size=(400, 300))
-                sizer.Add(self.browser, flag=wx.EXPAND | wx.ALL, border=0)
-
-                h_sizer = wx.BoxSizer(wx.HORIZONTAL)
-                h_sizer.Add(wx.StaticText(self, label="R = Reservoir Location"),
-                            flag=wx.EXPAND | wx.CENTER | wx.ALL, border=5)
-                h_sizer.Add(wx.StaticText(self, label="S = Sample Location"),
-                            flag=wx.EXPAND | wx.CENTER | wx.ALL, border=5)
-                sizer.Add(h_sizer)
-
-                html_string = self.MAP_FORMAT.format(core_loc.lat, core_loc.lon,
-                                                     closest_data['Latitude'],
-                                                     closest_data['Longitude'])
-                self.browser.SetPage(html_string)
-
-            button_sizer = wx.BoxSizer(wx.HORIZONTAL)
-            button_sizer.Add(wx.Button(self, wx.ID_CANCEL,
-                                       label="Reject Selection (Input Manual Correction)"),
-                             flag=wx.CENTER | wx.ALL, border=5)
-            button_sizer.Add(wx.Button(self, wx.ID_OK, label="Accept Selection"),
-                             flag=wx.CENTER | wx.ALL, border=5)
-
-            sizer.Add(button_sizer, flag=wx.CENTER | wx.TOP, border=5)
-
-            self.SetSizer(sizer)
-            self.Centre()
-            self.SetSize((420, 400))
-
 class IntCalCalibrator(cscience.components.BaseComponent):
     visible_name = 'Carbon 14 Calibration (CALIB Style)'
     inputs = [Att('14C Age'),
@@ -181,49 +135,22 @@ class IntCalCalibrator(cscience.components.BaseComponent):
         unnormed_density = self.density(*age.unitless_normal())
 
         #unnormed_density is mostly zeros so need to remove but need to know years removed.
-        nz_ages = []
-        nz_density = []
-
-        for calage, dens in zip(self.calib_age_ref, unnormed_density):
-            if dens:
-                nz_ages.append(calage)
-                nz_density.append(dens)
-
-        calib_age_ref = np.array(nz_ages)
-        unnormed_density = np.array(nz_density)
+        nonzero = np.flatnonzero(unnormed_density)
+        calib_age_ref = self.calib_age_ref[nonzero]
+        unnormed_density = unnormed_density[nonzero]
         # interpolate unnormed density to annual resolution
-        annual_calib_ages = np.array(range(int(calib_age_ref[0]), int(calib_age_ref[-1]+1)))
+        first_year = int(calib_age_ref[0])
+        annual_calib_ages = np.arange(first_year, int(calib_age_ref[-1]) + 1)
         unnormed_density = np.interp(annual_calib_ages, calib_age_ref, unnormed_density)
-        calib_age_ref = np.array(range(int(calib_age_ref[0]), int(calib_age_ref[-1]+1)))
 
         #Calculate norm of density and then divide unnormed density to normalize.
-        norm = integrate.simps(unnormed_density, calib_age_ref)
+        norm = integrate.simps(unnormed_density, annual_calib_ages)
         normed_density = unnormed_density / norm
-        #Calculate mean which is the "best" true age of the sample.
-
-        weighted_density = np.array([year*dens for year, dens in 
-                                     zip(calib_age_ref, normed_density)])
-
-        mean = integrate.simps(weighted_density, calib_age_ref)
-
-        #The HDR is used to determine the error for the mean calculated above.
-        calib_age_error = hdr(normed_density, calib_age_ref, interval)
 
-        distr = datastructures.ProbabilityDistribution(calib_age_ref, normed_density,
-                                                       mean, calib_age_error)
+        #The mean is the "best" true age of the sample, and the HDR is used to
+        #determine its error; the distribution works both out.
+        distr = datastructures.ProbabilityDistribution.on_grid(
+                    first_year, 1, normed_density, interval=interval)
 
-        return datastructures.UncertainQuantity(data=mean, units='years',
+        return datastructures.UncertainQuantity(data=distr.average, units='years',
                                                 uncertainty=distr)
-
-#calcuate highest density region
-def hdr(density, years, interval):
-    #Need to approximate integration by summation so need all years in range
-
-    yearly_pdensity = np.array([years, density])
-    yearly_pdensity = np.fliplr(yearly_pdensity[:, yearly_pdensity[1, :].argsort()])
-
-    summation_array = np.cumsum(yearly_pdensity[1, :])
-
-    index_of_win = np.searchsorted(summation_array, interval)
-    good_years = yearly_pdensity[0, :index_of_win]
-    return (min(good_years), max(good_years))
@@ -53,6 +53,7 @@ class HerronLangway (cscience.components.BaseComponent):
         for sample in core:
             # Convert depth to meters
             sample['depth'].units = 'm'
+            sample.touch('depth')
            # print sample['depth']
             h = sample['depth'].unitless_normal()[0]
             
@@ -117,6 +118,7 @@ class DansgaardJohnsen(cscience.components.BaseComponent):
         for sample in core:
             # Convert depth to meters
             sample['depth'].units = 'm'
+            sample.touch('depth')
             z = sample['depth'].unitless_normal()[0]
             #z = H - depth
 
@@ -6,6 +6,12 @@ import scipy.stats
 
 from cscience.framework import datastructures    
     
+def depth_units(core):
+    #models keep depths as plain numbers, so they need to know what units
+    #those numbers were in
+    for sample in core:
+        return str(sample['depth'].dimensionality)
+    return 'cm'
 
 class InterpolateModelLinear(cscience.components.BaseComponent):
     visible_name = 'Interpolate Age/Depth Model (Linear Spline)'
@@ -13,12 +19,13 @@ class InterpolateModelLinear(cscience.components.BaseComponent):
     outputs = [Att('Age/Depth Model', type='age model', core_wide=True)]
 
     def run_component(self, core, progress_dialog):
-        #need to have x monotonically increasing...
-        xyvals = zip(*sorted([(sample['depth'].magnitude,
-                               sample['Calibrated 14C Age'].magnitude)
-                              for sample in core]))
+        #need to have x monotonically increasing, which it is, as samples
+        #come in depth order
+        xyvals = zip(*[(sample['depth'].magnitude,
+                        sample['Calibrated 14C Age'].magnitude)
+                       for sample in core])
         core.properties['Age/Depth Model'] = datastructures.PointlistInterpolation(*xyvals,
-                run = core.run)
+                run = core.run, xunits=depth_units(core))
 
 class InterpolateModelSpline(cscience.components.BaseComponent):
     visible_name = 'Interpolate Age/Depth Model (B-Spline)'
@@ -26,14 +33,14 @@ class InterpolateModelSpline(cscience.components.BaseComponent):
     outputs = [Att('Age/Depth Model', type='age model', core_wide=True)]
 
     def run_component(self, core, progress_dialog):
-        xyvals = zip(*sorted([(sample['depth'].magnitude,
-                               sample['Calibrated 14C Age'].magnitude)
-                              for sample in core]))
+        xyvals = zip(*[(sample['depth'].magnitude,
+                        sample['Calibrated 14C Age'].magnitude)
+                       for sample in core])
         tck, u = scipy.interpolate.splprep(xyvals, s=200000)
         x_i, y_i = scipy.interpolate.splev(np.linspace(0, 1, 100), tck)
         xyvals = zip(*sorted([(x_i, y_i)]))
         core.properties['Age/Depth Model'] = datastructures.PointlistInterpolation(*xyvals,
-                run = core.run)
+                run = core.run, xunits=depth_units(core))
 
 class InterpolateModelRegression(cscience.components.BaseComponent):
     visible_name = 'Interpolate Age/Depth Model (Linear Regression)'
@@ -47,7 +54,7 @@ class InterpolateModelRegression(cscience.components.BaseComponent):
         xyvals = zip(*sorted([(i, y_intcpt + slope * i)
                               for i in x]))
         core.properties['Age/Depth Model'] = datastructures.PointlistInterpolation(*xyvals,
-                run = core.run)
+                run = core.run, xunits=depth_units(core))
 
 class InterpolateModelCubic(cscience.components.BaseComponent):
     visible_name = 'Interpolate Age/Depth Model (Cubic)'
@@ -59,10 +66,11 @@ class InterpolateModelCubic(cscience.components.BaseComponent):
         y = [sample['Calibrated 14C Age'] for sample in core]
         interp_func = scipy.interpolate.interp1d([float(i) for i in x], [float(i) for i in y],
                                bounds_error=False, fill_value=0, kind='cubic')
-        new_x = np.arange(min(x), max(x), abs(max(x)-min(x))/100.0)
+        #samples come in depth order
+        new_x = np.arange(x[0], x[-1], abs(x[-1]-x[0])/100.0)
         xyvals = zip(*sorted([(i, interp_func(i)) for i in new_x]))
         core.properties['Age/Depth Model'] = datastructures.PointlistInterpolation(*xyvals,
-                run = core.run) 
+                run = core.run, xunits=depth_units(core)) 
 
 class InterpolateModelQuadratic(cscience.components.BaseComponent):
     visible_name = 'Interpolate Age/Depth Model (Quadratic)'
@@ -74,21 +82,28 @@ class InterpolateModelQuadratic(cscience.components.BaseComponent):
         y = [sample['Calibrated 14C Age'] for sample in core]
         interp_func = scipy.interpolate.interp1d([float(i) for i in x], [float(i) for i in y],
                                bounds_error=False, fill_value=0, kind='quadratic')
-        new_x = np.arange(min(x), max(x), abs(max(x)-min(x))/100.0)
+        #samples come in depth order
+        new_x = np.arange(x[0], x[-1], abs(x[-1]-x[0])/100.0)
         xyvals = zip(*sorted([(i, interp_func(i)) for i in new_x]))
-        core.properties['Age/Depth Model'] = datastructures.PointlistInterpolation(*xyvals) 
+        core.properties['Age/Depth Model'] = datastructures.PointlistInterpolation(*xyvals,
+                xunits=depth_units(core))
 
 class UseModel(cscience.components.BaseComponent):
 
     visible_name = 'Assign Ages Using Age-Depth Model'
-    inputs = [Att('Age/Depth Model', core_wide=True, required=True)]
+    inputs = [Att('Age/Depth Model', core_wide=True, required=True),
+              Att('Bacon Model Uncertainty', core_wide=True, required=False)]
     outputs = [Att('Age from Model', type='float', unit='years', error=True)]
 
     def run_component(self, core, progress_dialog):
         #so this component is assuming that the age-depth model has already
         #been interpolated using some method, and is now associating ages
         #based on that model with all points along the depth curve.
-        age_model = core.properties['Age/Depth Model']
-        for sample in core:
-            sample['Age from Model'] = age_model(sample['depth'])
+        #A Bacon run leaves its whole ensemble, which gives us errors too.
+        age_model = core.properties['Bacon Model Uncertainty'] or \
+                    core.properties['Age/Depth Model']
+        samples = list(core)
+        ages = age_model.valueat_many([sample['depth'] for sample in samples])
+        for sample, age in zip(samples, ages.to_quantities()):
+            sample['Age from Model'] = age
         
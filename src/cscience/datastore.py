@@ -108,6 +108,7 @@ class Datastore(object):
             backend_loc = config.installer_db_location
 
 
+        framework.Core.cache.budget = config.core_cache_size
         self.set_data_source(backend_name, backend_loc, backend_port)
 
     def set_data_source(self, backend_name, source, port):
@@ -146,6 +147,11 @@ class Datastore(object):
 
         self._logger = logging.getLogger()
         self._logger.debug("Setting up the database...")
+        if config.installer_db_type == 'sqlite':
+            #nothing to start; the file gets created when it's first opened.
+            #an existing mongo repository can be copied in with
+            #cscience.backends.sqlite.convert_from_mongo
+            return
         is_windows = sys.platform.startswith('win')
         db_port = config.installer_db_port
 
@@ -26,6 +26,9 @@ __init__.py
 * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 * SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
+import collections
+
+
 #TODO: this is really a metaclass!
 class Collection(object):
     """
@@ -41,15 +44,19 @@ class Collection(object):
         instance = super(Collection, cls).__new__(cls, *args, **kwargs)
         instance._data = {}
         instance._updated = set()
+        instance._snapshots = {}
         return instance
 
     def __init__(self, keyset):
-        #cached/memoized data that's already been loaded once.
-        #TODO: keep this cache a reasonable size when applicable!
+        #cached/memoized data that's already been loaded once. Collections
+        #that can get big keep theirs in check with a LoadCache.
         self._data = dict.fromkeys(tuple(keyset))
-        #keep a list of what keys have been updated to make saving operations
-        #more sane -- currently not used.
+        #keep a list of what keys have been added or replaced since the last
+        #save, so we only write out what we need to.
         self._updated = set()
+        #saved form of each item as it was last loaded or saved; items that
+        #get edited in place are found by comparing against this.
+        self._snapshots = {}
 
     def __contains__(self, name):
         return name in self._data
@@ -71,11 +78,27 @@ class Collection(object):
     def saveitem(self, key, value):
         return (key, self._table.formatsavedata(value))
 
+    def preload(self):
+        """
+        Load everything that isn't loaded yet, in one query.
+        """
+        names = [name for name, value in self._data.iteritems()
+                 if value is None]
+        if not names:
+            return
+        for name, stored in self._table.loadmany(names).iteritems():
+            val = self._data[name] = self._table.loaddataformat(stored)
+            self._snapshots[name] = dict(self.saveitem(name, val)[1])
+
     def __getitem__(self, name):
         val = self._data[name]
         if val is None:
-            self._data[name] = self.loaditem(name)
-            return self._data[name]
+            #these collections are small, and whoever wants one item usually
+            #wants the rest too (to list them, say), so get them all at once
+            self.preload()
+            val = self._data[name]
+            if val is None:
+                raise KeyError(name) # this really shouldn't happen
         return val
 
     def __setitem__(self, name, item):
@@ -93,6 +116,8 @@ class Collection(object):
 
     def delete_one(self, member):
         self._data.pop(member.name)
+        self._updated.discard(member.name)
+        self._snapshots.pop(member.name, None)
         result = self._table.delete_one({'name':member.name})
 
     def keys(self):
@@ -123,12 +148,31 @@ class Collection(object):
         cls._table.do_create()
         return cls([])
 
+    def changed_items(self):
+        """
+        Returns save-formatted (key, value) pairs for every item that has been
+        added, replaced, or edited since it was last loaded or saved. Items
+        that were never loaded can't have changed.
+        """
+        items = []
+        for key, value in self._data.iteritems():
+            if value is None:
+                continue
+            item = self.saveitem(key, value)
+            if key in self._updated or \
+                    self._snapshots.get(key, item[1]) != item[1]:
+                items.append(item)
+        return items
+
     def save(self, *args, **kwargs):
-        #TODO: only save actually changed records; for now, we're just resaving
-        #everything that's been in memory ever.
-        self._table.savemany([self.saveitem(key, value) for key, value in
-                              self._data.iteritems() if value is not None],
-                             *args, **kwargs)
+        items = self.changed_items()
+        #copy, as the backend may add its own bookkeeping to value
+        snapshots = [(key, dict(value)) for key, value in items]
+        #only once it's safely written, or a failed save would look like it
+        #had nothing left to save
+        self._table.savemany(items, *args, **kwargs)
+        self._snapshots.update(snapshots)
+        self._updated = set()
 
     @classmethod
     def load(cls, connection):
@@ -141,18 +185,62 @@ class Collection(object):
             cls.loadkeys(connection)
             cls._is_loaded = True
         return cls.instance
-    
+
+
+class LoadCache(object):
+    """
+    Keeps track of how much data a set of lazily-loaded objects has in memory,
+    and unloads the least recently used of them whenever the total goes over
+    budget. Objects in the cache need an unload() method, and should call
+    use() whenever they're loaded or used, with their size when it changes.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.total = 0
+        #item -> size, least recently used first
+        self._sizes = collections.OrderedDict()
+
+    def __contains__(self, item):
+        return item in self._sizes
+
+    def use(self, item, size=None):
+        old = self._sizes.pop(item, 0)
+        if size is None:
+            size = old
+        self._sizes[item] = size
+        self.total += size - old
+        self.shrink(item)
+
+    def discard(self, item):
+        self.total -= self._sizes.pop(item, 0)
+
+    def shrink(self, keep=None):
+        """
+        Unload items, oldest first, until we're within budget; keep is never
+        unloaded (as it's presumably what's being used right now).
+        """
+        for item in list(self._sizes):
+            if self.total <= self.budget:
+                break
+            #unloading one item can mean another gets loaded (and this
+            #shrinks again), so it may have gone already
+            if item is not keep and item in self._sizes:
+                self.discard(item)
+                item.unload()
+
+
 import datastructures
 
 from calculations import ComputationPlan, ComputationPlans, Workflow, \
     Workflows, Run, Runs, Selector, Selectors
 from paleobase import Milieu, Milieus, Template, Templates
 from samples import Attribute, Attributes, CoreAttributes, Core, VirtualCore, Cores, Sample
-from samples import VirtualSample
+from samples import VirtualSample, CoreFrame
 from views import View, Views, forced_view
 
-__all__ = ('Attribute', 'Attributes', 'Milieu', 'Milieus', 
+__all__ = ('Attribute', 'Attributes', 'Milieu', 'Milieus', 'LoadCache',
            'ComputationPlan', 'ComputationPlans', 'Run', 'Runs',
-           'Selector', 'Selectors', 'Core', 'Cores', 
+           'Selector', 'Selectors', 'Core', 'Cores', 'CoreFrame',
            'Sample', 'Template', 'Templates',
            'View', 'Views', 'VirtualSample', 'Workflow', 'Workflows')
@@ -29,7 +29,10 @@ workflows.py
 
 import collections
 import itertools
+import multiprocessing.pool
+import Queue
 import re
+import sys
 import time
 
 import cscience.components
@@ -138,63 +141,192 @@ class Workflow(object):
                 components[component_name].connect(components[target_name], port)
         return components
 
-    def create_apply(self, core, dialog):
-        def apply_component(component):
-            req = [att.name for att in getattr(component, 'inputs', []) if att.required]
-            core_iter = core.__class__.__iter__
-            def restricted_iter(self):
-                for sample in core_iter(core):
-                    if all(sample[key] is not None for key in req):
-                        yield sample
-            try:
-                #this is how we can override __iter__ on a class at runtime,
-                #apparently. See
-                #http://stackoverflow.com/questions/11687653/method-overriding-by-monkey-patching
-                core.__class__.__iter__ = restricted_iter
-                # Passing the dialog into the component, and also kee
-                return component(core, dialog)
-            finally:
-                #make sure __iter__ gets properly put back no matter what,
-                #silly girl.
-                core.__class__.__iter__ = core_iter
-        return apply_component
-
-    def execute(self, cplan, core, progress_dialog):
+    def compile(self):
+        """
+        Works out what each component in this workflow has to wait for before
+        it can run: the components connected to it, and any others in the
+        workflow that output one of its inputs. Returns (first component,
+        {component: set of components it waits for}).
+
+        Raises KeyError if there's no clear first component, and ValueError
+        if the components end up waiting on each other in a circle.
+        """
+        first = self.find_first_component()
+        library = cscience.components.library
+        producers = collections.defaultdict(set)
+        for name in self.connections:
+            for att in getattr(library.get(name), 'outputs', []):
+                producers[att.name].add(name)
+
+        waits = dict((name, set()) for name in self.connections)
+        for name, ports in self.connections.iteritems():
+            for target in ports.itervalues():
+                waits[target].add(name)
+        for name in self.connections:
+            for att in getattr(library.get(name), 'inputs', []):
+                waits[name].update(producers[att.name] - set([name]))
+
+        #peel off components with nothing left to wait for; whatever can't
+        #be peeled off is in (or stuck behind) a cycle
+        remaining = dict((name, set(deps)) for name, deps in waits.iteritems())
+        ready = [name for name, deps in remaining.iteritems() if not deps]
+        while ready:
+            done = ready.pop()
+            del remaining[done]
+            for name, deps in remaining.iteritems():
+                if done in deps:
+                    deps.discard(done)
+                    if not deps:
+                        ready.append(name)
+        if remaining:
+            raise ValueError("Workflow has a cycle among: %s" %
+                             ', '.join(sorted(remaining)))
+        return first, waits
+
+    def apply_component(self, component, core, dialog):
+        """
+        Run one component on the samples in core that have all its required
+        inputs. Returns (the component's (next component, core) pairs, how
+        long it took in seconds, sys.exc_info() if it failed).
+        """
+        req = [att.name for att in getattr(component, 'inputs', []) if att.required]
+        start = time.time()
+        try:
+            pending = component(core.restricted(req), dialog)
+        except Exception:
+            return None, time.time() - start, sys.exc_info()
+        return pending, time.time() - start, None
+
+    def execute(self, cplan, core, progress_dialog, answers=None, workers=1):
+        """
+        Run this workflow on core with the given plan. answers, if given,
+        is a dict of values for anything the components would otherwise ask
+        the user for (see BaseComponent.user_inputs); with it, nothing
+        interactive is shown.
+
+        Components run as soon as everything they wait for (see compile) is
+        done, up to workers of them at a time on a thread pool; with only one
+        worker they all run in the calling thread, which any component that
+        shows a dialog needs. A component handed samples by more than one
+        other runs once on each set it's handed. Returns {component: seconds
+        it took}, in the order they finished.
+        """
+        first, waits = self.compile()
+
         #Grab this from the created time on the in-progress run so they agree!
         core.properties['Calculated On'] = datastructures.TimeData(core.partial_run.created_time)
         core.properties.setdefault('Required Citations', datastructures.PublicationList())
         citation_list = core.properties['Required Citations']
         
         components = self.instantiate(cplan)
-        first_component = components[self.find_first_component()]
-
-        # bad ass pythonic execution algorithm written by Evan Sheehan
-        # gist:
-        #       1. create a queue that contains a tuple of the first
-        #          component of the workflow and the set of samples
-        #          to process
-        #       2. pull the first tuple off the queue, get its component
-        #          and pass the set of samples to it.
-        #       3. When a component is invoked, it processes the set of
-        #          samples handed to it and returns a tuple of the next
-        #          component to execute and the samples it needs to process
-        #       4. This tuple gets added to the queue and we continue
-        #          to invoke components and add tuples to the queue until
-        #          the queue is empty.
-        #       Note: we only add a tuple to the queue if it a) has greater
-        #             than zero samples to process and 2) is not already in
-        #             the queue. This ensures that the queue eventually
-        #             empties out.
-        q = collections.deque([([first_component], core)])
-        while q:
-            components, c = q.popleft()
-            for component in components:
-                citation_list.addpubs(getattr(component, 'citations', []))
-            for pending in map(self.create_apply(c, progress_dialog), components):
-                for pair in pending:
-                    if pair[0] and pair[1] and pending not in q:
-                        q.append(([pair[0]], pair[1]))
-        return True
+        if answers is not None:
+            for component in components.itervalues():
+                component.answers = answers
+        names = dict((id(component), name)
+                     for name, component in components.iteritems())
+
+        #a component starts once all it waits for have finished (or been
+        #skipped), and runs on each set of samples handed to it by whatever's
+        #connected to it; one that never gets handed any is skipped.
+        blocking = dict((name, len(deps)) for name, deps in waits.iteritems())
+        waiting_on = collections.defaultdict(list)
+        for name, deps in waits.iteritems():
+            for dep in deps:
+                waiting_on[dep].append(name)
+        given = collections.defaultdict(list)
+        given[first].append(core)
+        ready = collections.deque([first])
+        #(name, component, samples) for each run waiting to go; name is None
+        #for components the workflow doesn't know about
+        jobs = collections.deque()
+        started = set()
+        released = set()
+        outstanding = collections.Counter()
+        cited = set()
+        timings = collections.OrderedDict()
+
+        def release(name):
+            released.add(name)
+            for waiting in waiting_on[name]:
+                blocking[waiting] -= 1
+                if not blocking[waiting]:
+                    ready.append(waiting)
+
+        def start(name):
+            started.add(name)
+            sets = given.pop(name, [])
+            if not sets:
+                release(name)
+            for samples in sets:
+                jobs.append((name, components[name], samples))
+                outstanding[name] += 1
+
+        def deliver(pending):
+            for target, samples in pending:
+                if not (target and samples):
+                    continue
+                name = names.get(id(target))
+                if name is not None and name not in started:
+                    given[name].append(samples)
+                    continue
+                #already going (or not part of the workflow at all), so
+                #nothing's waiting for it; just run it on these too
+                jobs.append((name, target, samples))
+                if name is not None:
+                    outstanding[name] += 1
+
+        results = Queue.Queue()
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.pool.ThreadPool(workers)
+            #load what the components will use before they all go after it
+            #at once
+            core.core.load_runs(('input', core.run))
+        running = 0
+        error = None
+        try:
+            while ready or jobs or running:
+                while (ready or jobs) and error is None:
+                    if ready:
+                        start(ready.popleft())
+                        continue
+                    name, component, samples = jobs.popleft()
+                    if id(component) not in cited:
+                        cited.add(id(component))
+                        citation_list.addpubs(getattr(component, 'citations', []))
+                    args = (component, samples, progress_dialog)
+                    label = name or type(component).__name__
+                    if pool is None:
+                        results.put((name, label) + self.apply_component(*args))
+                    else:
+                        pool.apply_async(self.apply_component, args,
+                            callback=lambda result, name=name, label=label:
+                                        results.put((name, label) + result))
+                    running += 1
+                    if pool is None:
+                        #see how it went before starting anything else
+                        break
+                if not running:
+                    break
+                name, label, pending, elapsed, exc_info = results.get()
+                running -= 1
+                if exc_info is not None:
+                    #let whatever's already going finish, then give up
+                    error = error or exc_info
+                    continue
+                timings[label] = timings.get(label, 0) + elapsed
+                deliver(pending)
+                if name is not None:
+                    outstanding[name] -= 1
+                    if not outstanding[name] and name not in released:
+                        release(name)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if error is not None:
+            raise error[0], error[1], error[2]
+        return timings
 
     def find_first_component(self):
         first_set = set(self.connections.keys())
@@ -227,9 +359,13 @@ class Run(object):
     """
     An instance of run a computation plan, including all applicable data.
     """
-    def __init__(self, cplan):
+    def __init__(self, cplan, tag=None):
         self._created_time = time.time()
         self.name = time.strftime('%Y-%m-%d_%H:%M:%S', self.created_time)
+        if tag:
+            #runs started in the same second (by a batch run, say) need
+            #something else to tell them apart
+            self.name = '%s_%s' % (self.name, tag)
         self.user_name = None
         self.rundata = {}
         self.computation_plan = cplan
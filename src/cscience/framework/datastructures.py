@@ -1,6 +1,7 @@
 import quantities as pq
 import numpy as np
 import csv
+import scipy.integrate as integrate
 import scipy.interpolate
 import time
 from dateutil import parser as timeparser
@@ -29,6 +30,64 @@ def is_numeric(type_):
     return type_.lower() in ('float', 'integer')
 
 
+#parsing units and working out conversion factors are both slow in quantities,
+#and there are only ever a handful of different units about, so each is only
+#ever done the once.
+_dimensionalities = {}
+_conversion_factors = {}
+
+
+def dimensionality(units):
+    """
+    The Dimensionality for units, given as a string, Quantity or
+    Dimensionality. Strings are only parsed the first time they're seen, so
+    what's returned may be shared, and shouldn't be changed.
+    """
+    if isinstance(units, basestring):
+        try:
+            return _dimensionalities[units]
+        except KeyError:
+            dims = pq.quantity.validate_dimensionality(units)
+            _dimensionalities[units] = dims
+            return dims
+    if isinstance(units, pq.Quantity):
+        return units._dimensionality
+    return units
+
+
+def _units_key(units):
+    if isinstance(units, basestring):
+        return units
+    return dimensionality(units).string
+
+
+def conversion_factor(from_units, to_units):
+    """
+    What to multiply a magnitude in from_units by to get it in to_units
+    (either can be anything dimensionality() takes). Raises ValueError if
+    the two aren't compatible.
+    """
+    key = (_units_key(from_units), _units_key(to_units))
+    try:
+        return _conversion_factors[key]
+    except KeyError:
+        pass
+    from_dims = dimensionality(from_units)
+    to_dims = dimensionality(to_units)
+    if from_dims == to_dims:
+        factor = 1.0
+    else:
+        try:
+            factor = pq.quantity.get_conversion_factor(
+                pq.Quantity(1.0, from_dims), pq.Quantity(1.0, to_dims))
+        except AssertionError:
+            raise ValueError(
+                'Unable to convert between units of "%s" and "%s"' %
+                (from_dims, to_dims))
+    _conversion_factors[key] = factor
+    return factor
+
+
 def get_conv_units(unit):
     """
     Returns a list of units that can be converted to/from the passed unit
@@ -42,7 +101,8 @@ def get_conv_units(unit):
 
 class UncertainQuantity(pq.Quantity):
     def __new__(cls, data, units='', uncertainty=0, dtype='d', copy=True):
-        ret = pq.Quantity.__new__(cls, data, units, dtype, copy)
+        ret = pq.Quantity.__new__(cls, data, dimensionality(units), dtype,
+                                  copy)
         ret.uncertainty = Uncertainty(uncertainty, units)
         return ret
 
@@ -111,20 +171,14 @@ class UncertainQuantity(pq.Quantity):
             assert self.flags.writeable
         except AssertionError:
             raise ValueError('array is not writeable')
-        to_dims = pq.quantity.validate_dimensionality(new_unit)
+        to_dims = dimensionality(new_unit)
         if self._dimensionality == to_dims:
             return
-        to_u = pq.Quantity(1.0, to_dims)
-        from_u = pq.Quantity(1.0, self._dimensionality)
-        try:
-            cf = pq.quantity.get_conversion_factor(from_u, to_u)
-        except AssertionError:
-            raise ValueError(
-                'Unable to convert between units of "%s" and "%s"' %
-                (from_u._dimensionality, to_u._dimensionality))
+        #(except that the conversion factor is cached)
+        cf = conversion_factor(self._dimensionality, new_unit)
         mag = self.magnitude
         mag *= cf
-        self._dimensionality = to_u.dimensionality
+        self._dimensionality = to_dims.copy()
         #END copy paste
         self.uncertainty.units(
             new_unit
@@ -188,7 +242,43 @@ class Uncertainty(object):
                         mag = uncert
             else:
                 self.distribution = uncert
-            self.magnitude = [pq.Quantity(val, units) for val in mag]
+            dims = dimensionality(units)
+            self.magnitude = [pq.Quantity(val, dims) for val in mag]
+
+    #distributions can be big, and are only needed by a few things, so the
+    #backend may hand us a way to get one instead of the thing itself.
+    @property
+    def distribution(self):
+        if self._loader is not None:
+            self._distribution = self._loader()
+            self._loader = None
+        return self._distribution
+
+    @distribution.setter
+    def distribution(self, value):
+        self._distribution = value
+        self._loader = None
+
+    def defer_distribution(self, loader):
+        """
+        Make this uncertainty's distribution be whatever loader() returns,
+        without calling loader until the distribution is actually used.
+        """
+        self._distribution = None
+        self._loader = loader
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_distribution'] = self.distribution
+        state['_loader'] = None
+        return state
+
+    def __setstate__(self, state):
+        #uncertainties pickled before distributions could be deferred
+        if 'distribution' in state:
+            state['_distribution'] = state.pop('distribution')
+        state.setdefault('_loader', None)
+        self.__dict__.update(state)
 
     def __add__(self, other):
         # TODO make add much more robust
@@ -196,8 +286,12 @@ class Uncertainty(object):
         return (Uncertainty(mag, self._units))
 
     def units(self, new_unit):
+        dims = dimensionality(new_unit)
         for quant in self.magnitude:
-            quant.units = new_unit
+            #what setting quant.units does, but with a cached factor
+            mag = quant.magnitude
+            mag *= conversion_factor(quant._dimensionality, new_unit)
+            quant._dimensionality = dims.copy()
         self._units = new_unit
 
     def __float__(self):
@@ -240,6 +334,171 @@ class Uncertainty(object):
                             rstrip('0').rstrip('.') for mag in self.magnitude])
 
 
+class UncertainArray(object):
+    """
+    A whole column of uncertain values in one set of units, with the values
+    and their errors kept as arrays, so arithmetic on (say) all the samples
+    in a core is a handful of numpy operations rather than one set of
+    quantities objects per sample.
+
+    Errors follow Uncertainty: each value has no error, a single (symmetric)
+    error, or a (plus, minus) pair, as counted by nerr, and can have a
+    distribution attached. Arithmetic propagates errors the same way
+    UncertainQuantity does, and to_quantities gives back UncertainQuantities
+    equal to the ones the array was made from.
+    """
+
+    def __init__(self, values, units='', err_minus=None, err_plus=None,
+                 nerr=None, distributions=None):
+        self.magnitude = np.array(values, dtype=float, ndmin=1)
+        count = len(self.magnitude)
+        self.units = dimensionality(units).string
+        self.err_minus = np.zeros(count) if err_minus is None else \
+                         np.array(err_minus, dtype=float, ndmin=1)
+        self.err_plus = self.err_minus.copy() if err_plus is None else \
+                        np.array(err_plus, dtype=float, ndmin=1)
+        if nerr is None:
+            nerr = np.where(self.err_minus == self.err_plus, 1, 2)
+            if err_minus is None:
+                nerr[:] = 0
+        self.nerr = np.array(nerr, dtype=np.uint8, ndmin=1)
+        #None, or a list with a ProbabilityDistribution (or a function that
+        #returns one, for ones that haven't been loaded) or None per value
+        self.distributions = distributions
+
+    @classmethod
+    def from_quantities(cls, values, units=None):
+        """
+        Make an UncertainArray from a list of (Uncertain)Quantities, or plain
+        numbers, which are taken as dimensionless. Everything is converted to
+        units, if given, or else to the units of the first value.
+        """
+        count = len(values)
+        mags = np.zeros(count)
+        minus = np.zeros(count)
+        plus = np.zeros(count)
+        nerr = np.zeros(count, dtype=np.uint8)
+        dists = None
+        for index, value in enumerate(values):
+            if isinstance(value, pq.Quantity):
+                dims = value.dimensionality.string
+                mag = value.magnitude.item()
+            elif isinstance(value, (int, long, float)):
+                dims = 'dimensionless'
+                mag = value
+            else:
+                raise TypeError('%r is not a number' % (value,))
+            if units is None:
+                units = dims
+            factor = conversion_factor(dims, units)
+            mags[index] = mag * factor
+
+            uncert = getattr(value, 'uncertainty', None)
+            if uncert is None:
+                continue
+            errs = [err.magnitude.item() for err in uncert.magnitude]
+            nerr[index] = len(errs)
+            if errs:
+                #same order as Uncertainty: plus first
+                plus[index] = errs[0] * factor
+                minus[index] = errs[-1] * factor
+            #no need to load a distribution just to pass it along
+            dist = uncert._loader or uncert._distribution
+            if dist is not None:
+                if dists is None:
+                    dists = [None] * count
+                dists[index] = dist
+        return cls(mags, units or 'dimensionless', minus, plus, nerr, dists)
+
+    def to_quantities(self):
+        """
+        A list of UncertainQuantities, one per value.
+        """
+        result = []
+        for index, mag in enumerate(self.magnitude):
+            nerr = self.nerr[index]
+            if nerr == 0:
+                errs = 0
+            elif nerr == 1:
+                errs = [self.err_minus[index]]
+            else:
+                errs = [self.err_plus[index], self.err_minus[index]]
+            value = UncertainQuantity(mag, self.units, errs)
+            dist = self.distributions and self.distributions[index]
+            if callable(dist):
+                value.uncertainty.defer_distribution(dist)
+            elif dist is not None:
+                value.uncertainty.distribution = dist
+            result.append(value)
+        return result
+
+    def __len__(self):
+        return len(self.magnitude)
+
+    def __repr__(self):
+        return '%s(%s, %s, %s, %s)' % (self.__class__.__name__,
+                                       repr(self.magnitude), self.units,
+                                       repr(self.err_minus),
+                                       repr(self.err_plus))
+
+    def _coerce(self, other):
+        if isinstance(other, UncertainArray):
+            return other
+        if isinstance(other, pq.Quantity) or not hasattr(other, '__len__'):
+            other = [other] * len(self)
+        return UncertainArray.from_quantities(other)
+
+    def rescale(self, units):
+        """
+        A copy of this array in different units.
+        """
+        factor = conversion_factor(self.units, units)
+        return UncertainArray(self.magnitude * factor, units,
+                              self.err_minus * factor, self.err_plus * factor,
+                              self.nerr, self.distributions)
+
+    def __add__(self, other):
+        other = self._coerce(other).rescale(self.units)
+        mags = self.magnitude + other.magnitude
+        #same rules as UncertainQuantity.__add__, a value at a time: if other
+        #has no error, ours carries over as-is; two symmetric errors give a
+        #symmetric one; anything else gets each side added separately
+        mine = self.nerr == 1
+        single = (self.nerr == 0) | mine
+        minus = np.hypot(self.err_minus, other.err_minus)
+        plus = np.hypot(np.where(single, self.err_minus, self.err_plus),
+                        np.where(other.nerr == 1, other.err_minus,
+                                 other.err_plus))
+        nerr = np.where(mine & (other.nerr == 1), 1, 2)
+        keep = other.nerr == 0
+        minus = np.where(keep, self.err_minus, minus)
+        plus = np.where(keep, self.err_plus, plus)
+        nerr = np.where(keep, self.nerr, nerr)
+        return UncertainArray(mags, self.units, minus, plus, nerr)
+
+    def __radd__(self, other):
+        return self._coerce(other) + self
+
+    def __neg__(self):
+        return UncertainArray(-self.magnitude, self.units, self.err_minus,
+                              self.err_plus, self.nerr)
+
+    def __sub__(self, other):
+        return self + (-self._coerce(other))
+
+    def __rsub__(self, other):
+        return self._coerce(other) + (-self)
+
+    def unitless_normal(self):
+        """
+        Values and one-dimensional errors, without units; the array version
+        of UncertainQuantity.unitless_normal.
+        """
+        errors = np.where(self.nerr == 0, 0,
+                          (self.err_minus + self.err_plus) / 2)
+        return (self.magnitude.copy(), errors)
+
+
 class GeographyData(object):
     typename = 'geo'
 
@@ -483,6 +742,24 @@ class PublicationList(object):
         return ('pub', [pub.LiPD_dict() for pub in self.publications])
 
 
+def _magnitudes(values, units):
+    """
+    A float array of values in units, from a Quantity array, a list of
+    Quantities, or plain numbers (which are assumed to be in units already).
+    With units None, magnitudes are taken as they are.
+    """
+    if units is None:
+        return np.array([float(getattr(value, 'magnitude', value))
+                         for value in values], dtype=float)
+    if isinstance(values, pq.Quantity):
+        return values.magnitude.astype(float) * \
+               conversion_factor(values._dimensionality, units)
+    return np.array([float(value.magnitude) *
+                     conversion_factor(value._dimensionality, units)
+                     if isinstance(value, pq.Quantity) else float(value)
+                     for value in values], dtype=float)
+
+
 class GraphableData(object):
     '''
     Interface for graphable data.
@@ -564,33 +841,145 @@ class PointlistInterpolation(GraphableData):
 
     def valueat(self, xval):
         #TODO: figure out uncertainty...
-        return UncertainQuantity(self.spline(xval), self.yunits)
-
+        return UncertainQuantity(
+                    self.spline(_magnitudes([xval], self.xunits)[0]),
+                    self.yunits)
 
-class BaconInfo(GraphableData):
-    def __init__(self, data, run):
-        self.csv_data = data
-        depths = self.csv_data[0]
-        data = self.csv_data[1:]
-        xs = []
-        ys = []
+    def valueat_many(self, xvals):
+        """
+        Evaluate the model at a whole list (or array) of depths at once;
+        returns an UncertainArray. Depths are converted to xunits, the units
+        the model was built in; depths without units are taken to be in
+        xunits already. Models saved before xunits was kept have None, and
+        use depths' magnitudes as they are.
+        """
+        return UncertainArray(self.spline(_magnitudes(xvals, self.xunits)),
+                              self.yunits)
 
-        for ages in data:
-            for (d, a) in zip(depths, ages):
-                xs.append(d)
-                ys.append(a)
 
-        bacon_hist, xedges, yedges = np.histogram2d(xs, ys, bins=100)
+class BaconInfo(GraphableData):
+    """
+    The ensemble of age-depth paths a Bacon run saved: ages for every saved
+    iteration at each of a grid of depths, held as one float32 array (one row
+    per path). The histogram, mean and quantiles used to show and use it are
+    only worked out when asked for, and then kept.
 
-        self.bacon_hist = bacon_hist
-        # removing first element
-        # maybe it's better to take the midpoints somehow
-        self.xcenters = xedges[:-1] + 0.5 * (xedges[1:] - xedges[:-1])
-        self.ycenters = yedges[:-1] + 0.5 * (yedges[1:] - yedges[:-1])
+    A run that's being archived can keep just a summary (mean and a few
+    quantiles at each depth) instead; see summarized().
+    """
+    #what Bacon gets run with
+    xunits = 'cm'
+    yunits = 'years'
+    #fraction of the ensemble inside the error bounds valueat gives
+    HDR_MASS = 0.95
+    #quantiles kept by a summary
+    SUMMARY_LEVELS = (0.025, 0.05, 0.25, 0.5, 0.75, 0.95, 0.975)
+
+    def __init__(self, data, run, summary=None):
+        """
+        data is [depths, path, path, ...], as read from Bacon's output. For a
+        summary-only model, data is None and summary is (depths, mean,
+        {level: quantiles}).
+        """
+        self.run = run
+        if data is not None:
+            self.depths = np.asarray(data[0], dtype=float)
+            self.ensemble = np.asarray(data[1:], dtype=np.float32).reshape(
+                                                    -1, len(self.depths))
+            self._quantiles = {}
+            self._mean = None
+        else:
+            depths, mean, quantiles = summary
+            self.depths = np.asarray(depths, dtype=float)
+            self.ensemble = None
+            self._quantiles = dict((level, np.asarray(values, dtype=float))
+                                   for level, values in quantiles.iteritems())
+            self._mean = None if mean is None else \
+                         np.asarray(mean, dtype=float)
+        self._histogram = None
+        self._node_stats = None
         self.label = 'Bacon Model' + " (" + run + ")"
         self.independent_var_name = 'Depth'
         self.variable_name = 'Bacon Model Uncertainty'
 
+    @classmethod
+    def from_ensemble(cls, depths, ensemble, run):
+        """
+        Build a model from depths and an array of ages (one row of ages per
+        path, or all the rows run together).
+        """
+        model = cls(None, run, (depths, None, {}))
+        model.ensemble = np.asarray(ensemble, dtype=np.float32).reshape(
+                                                    -1, len(model.depths))
+        return model
+
+    @property
+    def summary_only(self):
+        return self.ensemble is None
+
+    @property
+    def csv_data(self):
+        #the old list-of-lists form
+        if self.summary_only:
+            return None
+        return [self.depths.tolist()] + self.ensemble.astype(float).tolist()
+
+    def summarized(self):
+        """
+        A summary-only copy of this model, without the ensemble.
+        """
+        return BaconInfo(None, self.run,
+                         (self.depths, self.mean(),
+                          dict((level, self.quantile(level))
+                               for level in self.SUMMARY_LEVELS)))
+
+    def mean(self):
+        """
+        The mean age at each depth.
+        """
+        if self._mean is None:
+            self._mean = self.ensemble.mean(axis=0, dtype=float)
+        return self._mean
+
+    def quantile(self, level):
+        """
+        The given quantile (0-1) of the ages at each depth. A summary-only
+        model only knows SUMMARY_LEVELS.
+        """
+        if level not in self._quantiles:
+            if self.summary_only:
+                raise KeyError('quantile %s not kept in summary' % level)
+            self._quantiles[level] = np.percentile(
+                        self.ensemble, 100 * level, axis=0).astype(float)
+        return self._quantiles[level]
+
+    def histogram(self):
+        """
+        Returns (counts, xcenters, ycenters) for a 2-d histogram of the
+        ensemble over depth and age. Needs the ensemble.
+        """
+        if self._histogram is None:
+            xs = np.tile(self.depths, len(self.ensemble))
+            counts, xedges, yedges = np.histogram2d(
+                            xs, self.ensemble.ravel(), bins=100)
+            # maybe it's better to take the midpoints somehow
+            self._histogram = (counts,
+                    xedges[:-1] + 0.5 * (xedges[1:] - xedges[:-1]),
+                    yedges[:-1] + 0.5 * (yedges[1:] - yedges[:-1]))
+        return self._histogram
+
+    @property
+    def bacon_hist(self):
+        return self.histogram()[0]
+
+    @property
+    def xcenters(self):
+        return self.histogram()[1]
+
+    @property
+    def ycenters(self):
+        return self.histogram()[2]
+
     @classmethod
     def parse_value(cls, value):
         # Needs to do the same as PoinListInterpolation
@@ -606,8 +995,49 @@ class BaconInfo(GraphableData):
         return self.valueat(xval)
 
     def valueat(self, xval):
-        #TODO: make this actually work
-        return None
+        return self.valueat_many([xval]).to_quantities()[0]
+
+    def node_stats(self):
+        """
+        Returns (depths, mean, low, high) arrays, for each depth Bacon gave
+        ages at: the mean age over the whole ensemble of age-depth paths, and
+        the bounds of the highest density region holding HDR_MASS of them.
+        A summary-only model uses its 2.5% and 97.5% quantiles instead.
+        """
+        if self._node_stats is None:
+            if self.summary_only:
+                #the central 95%, which is the closest a summary has
+                self._node_stats = (self.depths, self.mean(),
+                                    self.quantile(0.025), self.quantile(0.975))
+                return self._node_stats
+            paths = np.sort(self.ensemble, axis=0)
+            count = len(paths)
+            #the narrowest window of sorted ages that holds enough of them
+            inside = max(int(np.ceil(self.HDR_MASS * count)), 1)
+            widths = paths[inside - 1:] - paths[:count - inside + 1]
+            start = np.argmin(widths, axis=0)
+            columns = np.arange(paths.shape[1])
+            self._node_stats = (self.depths, self.mean(),
+                                paths[start, columns].astype(float),
+                                paths[start + inside - 1, columns].astype(float))
+        return self._node_stats
+
+    def valueat_many(self, xvals):
+        """
+        Ages at a whole list (or array) of depths at once, as an
+        UncertainArray with the ensemble mean and (minus, plus) errors out
+        to the edges of its highest density region. Statistics are worked
+        out at the depths Bacon gave ages for, and interpolated in between.
+        Depths without units are taken to be in cm.
+        """
+        depths, mean, low, high = self.node_stats()
+        xvals = _magnitudes(xvals, self.xunits)
+        ages = np.interp(xvals, depths, mean)
+        #a skewed enough ensemble can put the mean outside the region
+        return UncertainArray(ages, self.yunits,
+                    np.maximum(ages - np.interp(xvals, depths, low), 0),
+                    np.maximum(np.interp(xvals, depths, high) - ages, 0),
+                    np.repeat(2, len(ages)))
 
     def graph_self(self, plot, options, errorbars=None, ignored=None):
         # np.log to make the variables scale better
@@ -627,6 +1057,16 @@ class BaconInfo(GraphableData):
                 color="#eeeeee",
                 markersize=options.point_size)
 
+        if self.summary_only:
+            #no ensemble to draw a histogram from; show the quantile bands
+            plot.fill_between(self.depths, self.quantile(0.025),
+                              self.quantile(0.975), color=options.color,
+                              alpha=0.2)
+            plot.fill_between(self.depths, self.quantile(0.25),
+                              self.quantile(0.75), color=options.color,
+                              alpha=0.4)
+            plot.plot(self.depths, self.mean(), color=options.color)
+            return
         plot.contourf(
             self.xcenters,
             self.ycenters,
@@ -635,14 +1075,65 @@ class BaconInfo(GraphableData):
             alpha=0.5)
 
 
+def _grid_step(xs):
+    """
+    The spacing of xs if they're evenly spaced (as they almost always are),
+    else None.
+    """
+    if len(xs) < 2:
+        return 0 if len(xs) else None
+    step = (xs[-1] - xs[0]) / float(len(xs) - 1)
+    grid = xs[0] + step * np.arange(len(xs))
+    if np.allclose(grid, xs, rtol=0, atol=abs(step) * 1e-6):
+        return step
+    return None
+
+
 class ProbabilityDistribution(object):
-    #TODO: convert this to also use a PointlistInterpolation for storing x/y
-    #values, so we can use the same code all over.
+    """
+    A probability density over x values (years, for calibrated ages).
+
+    x is nearly always a regular grid (annual, from calibration), so then only
+    its start and step are kept (and x is worked out when asked for);
+    otherwise start and step are None and x is kept as given. avg and range
+    (the best value and its error bounds) are worked out from the density if
+    they aren't given, as the mean and the highest density region holding
+    interval of the probability.
+    """
     THRESHOLD = .0000001
+    #how much of the probability the range covers, if we work it out
+    INTERVAL = 0.683
+
+    def __init__(self, years, density, avg=None, range=None, trim=True,
+                 interval=INTERVAL):
+        years = np.asarray(years)
+        step = _grid_step(years)
+        if step is None:
+            self.start = self.step = None
+            self._x = years
+        else:
+            self.start = years[0]
+            self.step = step
+            self._x = None
+        self._setup(density, avg, range, trim, interval)
 
-    def __init__(self, years, density, avg, range, trim=True):
+    @classmethod
+    def on_grid(cls, start, step, density, avg=None, range=None, trim=True,
+                interval=INTERVAL):
+        """
+        Build a distribution with density given at start, start + step, ...
+        """
+        dist = cls.__new__(cls)
+        dist.start = start
+        dist.step = step
+        dist._x = None
+        dist._setup(density, avg, range, trim, interval)
+        return dist
+
+    def _setup(self, density, avg, range, trim, interval):
+        density = np.array(density, dtype=float)
         minvalid = 0
-        maxvalid = len(years)
+        maxvalid = len(density)
 
         if trim:
             #trim out values w/ probability density small enough it might as well be 0.
@@ -650,30 +1141,100 @@ class ProbabilityDistribution(object):
             #be essentially negligible
             #only trims the long tails at either end; 0-like values mid-distribution
             #will be conserved
-
-            #first, find the sets of indices where the values are sub-threshold
-            for index, prob in enumerate(density):
-                if prob >= self.THRESHOLD:
-                    minvalid = index
-                    break
-            for index, prob in enumerate(reversed(density)):
-                if prob >= self.THRESHOLD:
-                    maxvalid = len(years) - index
-                    break
+            valid = np.flatnonzero(density >= self.THRESHOLD)
+            if len(valid):
+                minvalid = valid[0]
+                maxvalid = valid[-1] + 1
 
             #make sure we have 0s at the ends of our "real" distribution for my
             #own personal sanity.
             if minvalid > 0:
                 minvalid -= 1
                 density[minvalid] = 0
-            if maxvalid < len(years):
+            if maxvalid < len(density):
                 density[maxvalid] = 0
                 maxvalid += 1
 
         #TODO: do this as part of a component, and allow long tails (a smaller
         #threshold) on samples we are less confident in the goodness of
-        self.x = years[minvalid:maxvalid]
+        if self._x is None:
+            self.start = self.start + self.step * minvalid
+        else:
+            self._x = self._x[minvalid:maxvalid]
         self.y = density[minvalid:maxvalid]
+        self._cumulative = None
+        if avg is None:
+            avg = self.mean()
+        if range is None:
+            range = self.hdr(interval)
         self.average = avg
         self.range = range
         self.error = (range[1] - avg, avg - range[0])
+
+    def __setstate__(self, state):
+        #pickled before x was kept as a grid
+        if 'x' in state:
+            xs = np.asarray(state.pop('x'))
+            step = _grid_step(xs)
+            state['start'] = xs[0] if step is not None else None
+            state['step'] = step
+            state['_x'] = xs if step is None else None
+            state['y'] = np.asarray(state['y'], dtype=float)
+        state.setdefault('_cumulative', None)
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return len(self.y)
+
+    @property
+    def x(self):
+        if self._x is None:
+            return self.start + self.step * np.arange(len(self.y))
+        return self._x
+
+    def mean(self):
+        """
+        The mean of the distribution.
+        """
+        xs = self.x
+        return integrate.simps(xs * self.y, xs) / integrate.simps(self.y, xs)
+
+    def hdr(self, interval):
+        """
+        (low, high) bounds of the highest density region holding interval of
+        the probability: the most likely x values, taken in order until they
+        add up to interval.
+        """
+        xs = self.x
+        if self.step is not None:
+            weights = self.y * abs(self.step or 1)
+        else:
+            weights = self.y * np.abs(np.gradient(xs))
+        order = self.y.argsort()[::-1]
+        count = np.searchsorted(np.cumsum(weights[order]), interval)
+        inside = xs[order[:max(count, 1)]]
+        return (inside.min(), inside.max())
+
+    def _cdf_points(self):
+        if self._cumulative is None:
+            xs = self.x
+            areas = (self.y[1:] + self.y[:-1]) * np.diff(xs) / 2.0
+            cumulative = np.concatenate(([0.0], np.cumsum(areas)))
+            if len(cumulative) > 1 and cumulative[-1] > 0:
+                cumulative /= cumulative[-1]
+            self._cumulative = cumulative
+        return self._cumulative
+
+    def cdf(self, xvals):
+        """
+        The probability of a value at or below each of xvals.
+        """
+        return np.interp(xvals, self.x, self._cdf_points(), left=0.0,
+                         right=1.0)
+
+    def quantile(self, levels):
+        """
+        The x value(s) below which the given fraction(s) of the probability
+        lies.
+        """
+        return np.interp(levels, self._cdf_points(), self.x)
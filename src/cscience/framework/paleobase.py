@@ -129,8 +129,8 @@ class Template(collections.OrderedDict):
                     print self[att], row[att]
                 raise
 
-        milieu.sortedkeys = sorted(milieu.keys())
         milieu.loaded = True
+        milieu.sortedkeys = sorted(milieu.keys())
         return milieu
 
 class Templates(Collection):
@@ -143,7 +143,7 @@ class Milieu(Collection):
     def connect(cls, backend):
         cls._table = backend.mtable(cls.tablename())
 
-    def __init__(self, template, name='[NONE]', keyset=[]):
+    def __init__(self, template, name='[NONE]', keyset=[], size=None):
         self.name = name
         self.loaded = False
         try:
@@ -153,6 +153,9 @@ class Milieu(Collection):
         keyset = [tuple(item) for item in keyset]
         super(Milieu, self).__init__(keyset)
         self.sortedkeys = keyset
+        #how many items are stored, if known; lets us answer len() without
+        #reading them all in
+        self.size = size
 
     def preload(self):
         if not self.loaded:
@@ -160,13 +163,49 @@ class Milieu(Collection):
 
     def _forceload(self):
         for key, val in self._table.iter_milieu_data(self):
-            self._data[key] = self._table.loaddictformat(val)
-        self.sortedkeys = sorted(self.keys())
+            #anything set before we got here is newer than what's stored
+            if key not in self._updated:
+                self._data[key] = self._table.loaddictformat(val)
+        self.sortedkeys = sorted(self._data.keys())
         self.loaded = True
 
+    #keys are stored with the data, so anything that needs them loads it all
+    def __contains__(self, key):
+        self.preload()
+        return key in self._data
+
+    def __iter__(self):
+        self.preload()
+        return iter(self._data)
+
+    def __len__(self):
+        if not self.loaded and self.size is not None:
+            return self.size
+        self.preload()
+        return len(self._data)
+
+    def __getitem__(self, key):
+        self.preload()
+        return self._data[key]
+
+    def keys(self):
+        self.preload()
+        return self._data.keys()
+
     def saveitem(self, key, value):
         return (key, self._table.formatsavedict(value))
 
+    def save(self, *args, **kwargs):
+        #a milieu is stored as one file, so if anything in it has changed it
+        #all needs writing out again.
+        if self._updated:
+            self.preload()
+            self._table.savemany([self.saveitem(key, value) for key, value in
+                                  self._data.iteritems() if value is not None],
+                                 *args, **kwargs)
+            self._updated = set()
+            self.size = len(self._data)
+
     def iteritems(self):
         self.preload()
         for key in self.sortedkeys:
@@ -192,21 +231,32 @@ class Milieus(Collection):
     @classmethod
     def loadkeys(cls, backend):
         try:
-            data = cls._table.loadkeys()
+            #older map entries also list every key in the milieu, which can
+            #be a lot to read in; those come with the milieu's data instead
+            data = cls._table.loadkeys(['template', 'size'])
         except NameError:
             cls.instance = cls.bootstrap(backend)
         else:
             instance = cls([])
             Milieu.connect(backend)
             for key, value in data.iteritems():
-                instance[key] = Milieu(value['template'], key, value.get('keys', []))
+                instance._data[key] = Milieu(value['template'], key,
+                                             size=value.get('size'))
 
             cls.instance = instance
 
     def saveitem(self, key, value):
+        #(no need to load a milieu just to count it)
+        if value.loaded or value._updated:
+            size = len(value)
+        else:
+            size = value.size
         return (key, self._table.formatsavedict({'template':value._template,
-                                                 'keys':sorted(value.keys())}))
+                                                 'size':size}))
     def save(self, *args, **kwargs):
+        #a milieu's size changes along with its data
+        self._updated.update(key for key, milieu in self._data.iteritems()
+                             if milieu is not None and milieu._updated)
         super(Milieus, self).save(*args, **kwargs)
         for milieu in self._data.itervalues():
             kwargs['name'] = milieu.name
@@ -31,5 +31,6 @@ samples.py
 from attributes import Attribute, Attributes, CoreAttributes, VirtualAttribute
 from samples import Sample, VirtualSample
 from cores import Core, Cores, VirtualCore
+from coreframe import Column, CoreFrame
 
 
@@ -74,11 +74,29 @@ class VirtualAttribute(Attribute):
     you'll have in basically any case here anyway, that's not to be worried
     about)
     """
+    #bumped whenever any virtual attribute (or the set of attributes)
+    #changes, so anything built from them knows to rebuild
+    revision = 0
+
     def __init__(self, name, type_='string', aggatts=[]):
         self.name = name
         self.type_ = type_.lower()
         self.aggatts = aggatts
 
+    def __setstate__(self, state):
+        #pickled before aggatts was a property
+        if 'aggatts' in state:
+            state['_aggatts'] = state.pop('aggatts')
+        self.__dict__.update(state)
+
+    @property
+    def aggatts(self):
+        return self._aggatts
+
+    @aggatts.setter
+    def aggatts(self, aggatts):
+        self._aggatts = aggatts
+        VirtualAttribute.revision += 1
 
     def is_numeric(self):
         return self.type_ in ('float', 'integer')
@@ -106,6 +124,8 @@ class AttributeCollection(Collection):
     def __new__(self, *args, **kwargs):
         instance = super(AttributeCollection, self).__new__(self, *args, **kwargs)
         instance.sorted_keys = self.base_atts[:]
+        #a whole new set of attributes (say, from another repository)
+        VirtualAttribute.revision += 1
         return instance
     def __init__(self, *args, **kwargs):
         super(AttributeCollection, self).__init__(*args, **kwargs)
@@ -169,6 +189,41 @@ class Attributes(AttributeCollection):
     def indexof(self, key):
         return self.sorted_keys.index(key)
 
+    def __setitem__(self, index, item):
+        VirtualAttribute.revision += 1
+        return super(Attributes, self).__setitem__(index, item)
+
+    def delete_one(self, member):
+        VirtualAttribute.revision += 1
+        return super(Attributes, self).delete_one(member)
+
+    def virtual_map(self):
+        """
+        Returns {name: names} for every virtual attribute, where names are the
+        real (non-virtual) attributes it shows the first non-null value of,
+        in order; virtual attributes made from other virtual attributes are
+        flattened out. Kept until an attribute changes.
+        """
+        if getattr(self, '_virtual_revision', None) != VirtualAttribute.revision:
+            virtual = dict((att.name, att) for att in self if att.is_virtual)
+
+            def flatten(name, seen):
+                if name not in virtual:
+                    return [name]
+                if name in seen:
+                    #made from itself somehow; nothing to show
+                    return []
+                names = []
+                for agg in virtual[name].aggatts:
+                    names.extend(flatten(agg, seen | set([name])))
+                return names
+
+            self._virtual_map = dict((name, tuple(flatten(name, set())))
+                                     for name in virtual)
+            #after loading them all, which can bump it
+            self._virtual_revision = VirtualAttribute.revision
+        return self._virtual_map
+
     def add_virtual_att(self, name, aggregate):
         if aggregate:
             type_ = aggregate[0].type_
@@ -183,7 +238,7 @@ class Attributes(AttributeCollection):
     @classmethod
     def bootstrap(cls, connection):
         instance = super(Attributes, cls).bootstrap(connection)
-        instance.sorted_keys = base_atts[:]
+        instance.sorted_keys = cls.base_atts[:]
         instance['depth'] = Attribute('depth', 'float', 'centimeters')
         instance['run'] = Attribute('run')
         return instance
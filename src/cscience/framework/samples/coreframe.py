@@ -0,0 +1,168 @@
+"""
+Column-at-a-time access to the numeric data in a core.
+
+Working through a core sample by sample means going through several Python
+objects for every value (Sample -> run dict -> UncertainQuantity ->
+Uncertainty -> list of Quantities). A CoreFrame holds the same numbers as
+plain arrays instead: the core's depths, sorted, and for each (run, attribute)
+asked for, arrays of values and errors lined up with them, all in one set of
+units. Cores build (and keep) these on request; see Core.frame.
+"""
+
+import numpy as np
+import quantities as pq
+
+
+class Column(object):
+    """
+    One numeric attribute of a core, as arrays lined up with the depths of the
+    frame it's in. Samples with no value have NaN for it (and 0 for errors),
+    and False in present.
+    """
+
+    def __init__(self, units, values, err_low, err_high, present):
+        self.units = units
+        self.values = values
+        self.err_low = err_low
+        self.err_high = err_high
+        self.present = present
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Build a column from a list of values (None where a sample has none).
+        Returns None if they aren't all numbers, or can't be put in the same
+        units.
+        """
+        count = len(values)
+        mags = np.empty(count)
+        mags.fill(np.nan)
+        low = np.zeros(count)
+        high = np.zeros(count)
+        present = np.zeros(count, dtype=bool)
+        units = None
+        for index, value in enumerate(values):
+            if value is None:
+                continue
+            if isinstance(value, pq.Quantity):
+                dims = value.dimensionality
+                errors = getattr(value, 'uncertainty', None)
+                errors = [err.magnitude.item() for err in errors.magnitude] \
+                         if errors is not None else []
+                mag = value.magnitude.item()
+            elif isinstance(value, (int, long, float)) and \
+                    not isinstance(value, bool):
+                dims = pq.dimensionless.dimensionality
+                errors = []
+                mag = value
+            else:
+                return None
+
+            if units is None:
+                units = dims
+            if dims != units:
+                try:
+                    factor = pq.quantity.get_conversion_factor(
+                            pq.Quantity(1.0, dims), pq.Quantity(1.0, units))
+                except AssertionError:
+                    return None
+                mag *= factor
+                errors = [err * factor for err in errors]
+            mags[index] = mag
+            if errors:
+                #same order as Uncertainty.get_mag_tuple
+                low[index] = errors[0]
+                high[index] = errors[-1]
+            present[index] = True
+        if units is None:
+            units = pq.dimensionless.dimensionality
+        return cls(units.string, mags, low, high, present)
+
+    def __len__(self):
+        return len(self.values)
+
+    def quantities(self):
+        """
+        The values as a single Quantity array (with NaN for missing values).
+        """
+        return pq.Quantity(self.values, self.units)
+
+    def merged(self, other):
+        """
+        A column with this column's values where it has them, and other's
+        everywhere else (converted to this column's units).
+        """
+        factor = 1.0
+        if other.units != self.units:
+            factor = pq.quantity.get_conversion_factor(
+                        pq.Quantity(1.0, other.units),
+                        pq.Quantity(1.0, self.units))
+        fill = other.present & ~self.present
+        values = self.values.copy()
+        low = self.err_low.copy()
+        high = self.err_high.copy()
+        values[fill] = other.values[fill] * factor
+        low[fill] = other.err_low[fill] * factor
+        high[fill] = other.err_high[fill] * factor
+        return Column(self.units, values, low, high, self.present | fill)
+
+
+class CoreFrame(object):
+    """
+    A sorted array of depths (in mm, same as Core keys), with numeric
+    Columns for some set of (run, attribute) pairs.
+    """
+
+    def __init__(self, depths, columns=None):
+        self.depths = np.asarray(depths, dtype=float)
+        self.columns = columns or {}
+
+    @classmethod
+    def from_lists(cls, depths, columns):
+        """
+        Build a frame from (depths, {(run, att): values}), as returned by
+        Core.load_columns. Columns that aren't numeric are left out.
+        """
+        frame = cls(depths)
+        for key, values in columns.iteritems():
+            column = Column.from_values(values)
+            if column is not None:
+                frame.columns[key] = column
+        return frame
+
+    def __len__(self):
+        return len(self.depths)
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def column(self, run, att):
+        """
+        The Column for att in run; KeyError if the frame doesn't have it
+        (because it isn't numeric, or wasn't asked for).
+        """
+        return self.columns[(run, att)]
+
+    def resolved(self, att, runs):
+        """
+        A Column for att taking each sample's value from the first of runs
+        that has one, the same way a VirtualSample looks values up. Returns
+        None if none of the runs have a numeric column for att.
+        """
+        result = None
+        for run in runs:
+            column = self.columns.get((run, att))
+            if column is None:
+                continue
+            result = column if result is None else result.merged(column)
+        return result
+
+    def index_of(self, depth):
+        """
+        Index of the given depth (in mm) in this frame; KeyError if the core
+        has no sample there.
+        """
+        index = np.searchsorted(self.depths, depth)
+        if index == len(self.depths) or self.depths[index] != depth:
+            raise KeyError(depth)
+        return int(index)
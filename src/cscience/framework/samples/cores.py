@@ -1,11 +1,83 @@
-from samples import Sample, VirtualSample
-
-from cscience.framework import Collection, Run
-from cscience.framework.datastructures import UncertainQuantity
+import bisect
+import copy
+import tempfile
+
+import numpy as np
+import quantities as pq
+
+from coreframe import CoreFrame
+from samples import Resolution, Sample, VirtualSample
+
+from cscience.framework import Collection, LoadCache, Run
+from cscience.framework.datastructures import conversion_factor
+
+
+def summarize(items):
+    """
+    Summary statistics for one run of a core, from (depth key, data) for each
+    sample, in order of depth. Returns {att: stats}, where stats has:
+        count: how many samples have the attribute at all
+        present: how many of those have a value other than None
+        depths: [shallowest, deepest] key with a value
+    and, if every value is a number (or a single Quantity, all in compatible
+    units), min, max and mean of them, in units (a unit string).
+    """
+    stats = {}
+    #att -> [total, number of numeric values], or None if not all numeric
+    totals = {}
+    for key, data in items:
+        for att, value in data.iteritems():
+            entry = stats.get(att)
+            if entry is None:
+                entry = stats[att] = {'count': 0, 'present': 0}
+                totals[att] = [0.0, 0]
+            entry['count'] += 1
+            if value is None:
+                continue
+            entry['present'] += 1
+            entry.setdefault('depths', [key, key])[1] = key
+
+            total = totals[att]
+            if total is None:
+                continue
+            if isinstance(value, pq.Quantity) and value.size == 1:
+                if 'units' not in entry:
+                    entry['units'] = value.dimensionality.string
+                try:
+                    mag = float(value.magnitude) * conversion_factor(
+                                    value._dimensionality, entry['units'])
+                except ValueError:
+                    mag = None
+            elif isinstance(value, (int, long, float)) and \
+                    not isinstance(value, bool):
+                entry.setdefault('units', pq.dimensionless.dimensionality.string)
+                mag = float(value) if entry['units'] == \
+                        pq.dimensionless.dimensionality.string else None
+            else:
+                mag = None
+            if mag is None:
+                totals[att] = None
+                continue
+            total[0] += mag
+            total[1] += 1
+            entry['min'] = mag if 'min' not in entry else min(entry['min'], mag)
+            entry['max'] = mag if 'max' not in entry else max(entry['max'], mag)
+
+    for att, total in totals.iteritems():
+        entry = stats[att]
+        if total is None or not total[1]:
+            for field in ('min', 'max', 'units'):
+                entry.pop(field, None)
+        else:
+            entry['mean'] = total[0] / total[1]
+    return stats
 
 
 class Core(Collection):
     _tablename = 'cores'
+    #sample data for all the cores that are loaded; the budget is a rough
+    #count of attribute values, and gets set from config by the datastore.
+    cache = LoadCache(1000000)
 
     @classmethod
     def connect(cls, backend):
@@ -21,21 +93,142 @@ class Core(Collection):
         self.runs.add('input')
         self.properties = Sample()
         self.properties.update(properties)
+        #whether all of this core's sample data has been read in; if not,
+        #_loaded_runs says which runs have been
         self.loaded = False
+        self._loaded_runs = set()
         super(Core, self).__init__([])
+        #what's changed since this core was last loaded or saved:
+        #run -> set of attribute names changed in that run (None if we don't
+        #know which, and so need to treat the whole run as changed)
+        self._dirty = {}
+        #runs deleted since the last save; whatever's still stored for them
+        #is out of date, and mustn't be read back in
+        self._deleted = set()
+        #whether core-level data (properties, list of runs) has changed
+        self.meta_modified = False
+        #where unsaved changes went if this core got unloaded before they
+        #could be saved, and which runs they were for
+        self._spilled = None
+        self._spilled_runs = set()
+        #numeric columns built so far by frame(), and which (run, att) pairs
+        #have been asked for (numeric or not); dropped whenever data changes
+        self._frame = None
+        self._frame_keys = set()
+        #sorted list of the keys in _data; built when first needed and kept
+        #up to date as samples are added (or thrown out when lots are)
+        self._depths = None
+        #keys of the samples the user has said to leave out
+        self._ignored = set()
+        #run -> {att: stats} (see summarize), as of the last save, so there's
+        #something to say about a core without reading its samples in
+        self.summary = {}
+
+    @property
+    def properties(self):
+        if self._properties is None:
+            #core-wide data can be big (whole Bacon runs, age models...), so
+            #it's read in when first needed rather than with the core list
+            stored = Cores._table.loadone(self.name) or {}
+            sample = Sample()
+            sample.update(Cores._table.loaddictformat(
+                                    stored.get('properties', {})))
+            sample.owner = self
+            self._properties = sample
+        return self._properties
+
+    @properties.setter
+    def properties(self, sample):
+        sample.owner = self
+        self._properties = sample
+        self.meta_modified = True
+
+    def sample_changed(self, sample, run, key=None):
+        """
+        Called by samples owned by this core when their data changes.
+        """
+        if sample is self._properties:
+            self.meta_modified = True
+            return
+        self._frame = None
+        if key is None:
+            self._dirty[run] = None
+        elif self._dirty.get(run, ()) is not None:
+            self._dirty.setdefault(run, set()).add(key)
+
+    def sample_ignored(self, sample, ignored):
+        """
+        Called by samples owned by this core when they're ignored or
+        un-ignored.
+        """
+        if sample is self._properties or 'depth' not in sample.get('input', {}):
+            return
+        key = self._unitkey(sample['input']['depth'])
+        if ignored:
+            self._ignored.add(key)
+        else:
+            self._ignored.discard(key)
+
+    def is_ignored(self, key):
+        return key in self._ignored
+
+    def summary_for(self, run):
+        """
+        {att: stats} for the given run, as of when it was last saved; None if
+        we don't have that, or the run has changed since.
+        """
+        if run in self._dirty:
+            return None
+        return self.summary.get(run)
+
+    def update_summary(self):
+        """
+        Work out summaries again for any runs that have changed; should be
+        done just before saving.
+        """
+        if not self._dirty:
+            return
+        self.load_runs(self._dirty)
+        for run in self._dirty:
+            if run in self.runs:
+                self.summary[run] = summarize(
+                        (key, dict.__getitem__(self._data[key], run))
+                        for key in self._index()
+                        if dict.__contains__(self._data[key], run))
+            else:
+                self.summary.pop(run, None)
+        self.meta_modified = True
+
+    def summary_text(self):
+        """
+        A line or two about this core from its saved summary (for tooltips
+        and such), or None if there isn't one.
+        """
+        depth = (self.summary_for('input') or {}).get('depth')
+        if not depth:
+            return None
+        text = '%d samples' % depth['count']
+        if 'min' in depth:
+            text += ', %g to %g %s' % (depth['min'], depth['max'],
+                                       depth['units'])
+        runs = len(self.runs) - 1
+        return '%s\n%d run%s' % (text, runs, '' if runs == 1 else 's')
+
+    @property
+    def modified(self):
+        return bool(self._updated or self._dirty)
 
     def _dbkey(self, key):
-        try:
-            key = key.rescale('mm')
-        except AttributeError:
-            key = key
-        return float(key)
+        return self._unitkey(key)
 
     def _unitkey(self, depth):
+        #same as float(depth.rescale('mm')), but with the conversion factor
+        #cached, as this happens for every sample lookup
         try:
-            return float(depth.rescale('mm').magnitude)
+            units = depth._dimensionality
         except AttributeError:
             return float(depth)
+        return float(depth.magnitude) * conversion_factor(units, 'mm')
 
     @classmethod
     def makesample(cls, data):
@@ -46,13 +239,14 @@ class Core(Collection):
     def saveitem(self, key, value):
         return (self._dbkey(key), self._table.formatsavedict(value))
 
-    def new_computation(self, cplan):
+    def new_computation(self, cplan, tag=None):
         """
         Add a new computation plan to this core, and return a VirtualCore
         with the requested plan set.
         """
-        run = Run(cplan)
+        run = Run(cplan, tag)
         self.runs.add(run.name)
+        self.meta_modified = True
         vc = VirtualCore(self, run.name)
         #convenience for this specific case -- the run is still in-creation,
         #so we need to keep the object around until it's done.
@@ -83,19 +277,44 @@ class Core(Collection):
         if key == 'all':
             print "Warning: use of 'all' key is deprecated. Use core.properties instead"
             return self.properties
-        return self._data[self._unitkey(key)]
+        if isinstance(key, slice):
+            return [self._data[depth] for depth in self.depths()[key]]
+        key = self._unitkey(key)
+        try:
+            return self._data[key]
+        except KeyError:
+            if self.loaded or (self._spilled is None and
+                               'input' in self._loaded_runs):
+                #every sample has input data, so with that read in we know
+                #all the depths there are
+                raise
+            #may not have been read in yet (or unloaded to save memory); read
+            #in just what's stored for this depth
+            self.range(key, key)
+            return self._data[key]
 
     def __setitem__(self, depth, sample):
         if depth == 'all':
             print "Warning: use of 'all' key is deprecated. Use core.properties instead"
             self.properties = sample
             return
-        super(Core, self).__setitem__(self._unitkey(depth), sample)
-        try:
+        key = self._unitkey(depth)
+        old = self._data.get(key)
+        if self._depths is not None and key not in self._data:
+            bisect.insort(self._depths, key)
+        super(Core, self).__setitem__(key, sample)
+        sample.owner = self
+        if sample.ignored:
+            self._ignored.add(key)
+        else:
+            self._ignored.discard(key)
+        self._frame = None
+        #any runs this sample has (or replaces) have changed as a whole
+        for run in set(sample) | set(old or ()):
+            self._dirty[run] = None
+        if not self.runs.issuperset(sample.keys()):
             self.runs.update(sample.keys())
-        except AttributeError:
-            #not actually a run, just some background
-            pass
+            self.meta_modified = True
 
     def add(self, sample):
         sample['input']['core'] = self.name
@@ -109,38 +328,386 @@ class Core(Collection):
             self.add(s)
             return s
 
+    def load_columns(self, atts, runs=None):
+        """
+        Get only the given attributes for every sample in this core, without
+        loading (or decoding) the rest of the core's data.
+
+        Returns (depths, {(run, att): values}); depths are in mm, sorted, and
+        each list of values lines up with them, with None where a sample has
+        no value for that attribute.
+        """
+        if self._dirty or self._spilled is not None:
+            #unsaved changes are only in memory
+            self._load(runs)
+        if not (self.loaded or (runs is not None and
+                                self._loaded_runs.issuperset(runs))):
+            return self._table.load_columns(self, atts, runs)
+        depths = sorted(self._data)
+        columns = {}
+        for index, depth in enumerate(depths):
+            for run, data in self._data[depth].iteritems():
+                if runs is not None and run not in runs:
+                    continue
+                for att in atts:
+                    if att in data:
+                        columns.setdefault((run, att),
+                            [None] * len(depths))[index] = data[att]
+        return depths, columns
+
+    def frame(self, atts, runs=None):
+        """
+        Returns a CoreFrame with the core's depths and a numeric Column for
+        each of the given attributes in each of the given runs (or all of
+        them) that has any numbers for it. Columns are built from stored data
+        where possible, without loading whole samples, and kept until the
+        core's data changes.
+        """
+        if runs is None:
+            runs = self.runs
+        wanted = [(run, att) for run in runs for att in atts]
+        if self._frame is None:
+            self._frame_keys = set()
+        missing = [key for key in wanted if key not in self._frame_keys]
+        if missing:
+            newruns = set(run for run, att in missing)
+            newatts = set(att for run, att in missing)
+            new = CoreFrame.from_lists(*self.load_columns(newatts, newruns))
+            if self._frame is None or \
+                    not np.array_equal(self._frame.depths, new.depths):
+                self._frame = new
+                self._frame_keys = set()
+            else:
+                self._frame.columns.update(new.columns)
+            self._frame_keys.update((run, att) for run in newruns
+                                    for att in newatts)
+        return CoreFrame(self._frame.depths,
+                         dict((key, self._frame.columns[key]) for key in
+                              wanted if key in self._frame.columns))
+
     def force_load(self):
-        #not my favorite hack, but wevs.
-        if not self.loaded:
-            for sample in self:
-                pass
+        self._load()
+
+    def load_runs(self, runs):
+        """
+        Make sure the data for the given runs is loaded, without reading in
+        any of the other runs stored for this core.
+        """
+        self._load(runs)
+
+    def runkeys(self, run):
+        """
+        Returns the keys for this core, in order, loading only as much of it
+        as is needed to work with the given run.
+        """
+        self.load_runs(('input', run))
+        return list(self._index())
+
+    def _index(self):
+        if self._depths is None:
+            self._depths = sorted(self._data)
+        return self._depths
+
+    def _between(self, depth_lo, depth_hi):
+        index = self._index()
+        start = 0 if depth_lo is None else \
+                bisect.bisect_left(index, self._unitkey(depth_lo))
+        end = len(index) if depth_hi is None else \
+              bisect.bisect_right(index, self._unitkey(depth_hi))
+        if start == 0 and end == len(index):
+            return index
+        return index[start:end]
+
+    def depths(self, depth_lo=None, depth_hi=None):
+        """
+        Returns the keys (depths in mm) of this core's samples in order, or
+        just those from depth_lo to depth_hi (inclusive) if given. The full
+        list is shared, so shouldn't be changed.
+        """
+        #every sample has input data, so that's all it takes to know them all
+        self.load_runs(['input'])
+        return self._between(depth_lo, depth_hi)
+
+    def index_of(self, depth):
+        """
+        Returns the position of the sample at depth, in order of depth;
+        KeyError if there isn't one.
+        """
+        key = self._unitkey(depth)
+        index = self.depths()
+        position = bisect.bisect_left(index, key)
+        if position == len(index) or index[position] != key:
+            raise KeyError(depth)
+        return position
+
+    def nearest(self, depth):
+        """
+        Returns the sample closest to depth (the shallower one, if two are
+        equally close), or None if the core has no samples.
+        """
+        key = self._unitkey(depth)
+        index = self.depths()
+        if not index:
+            return None
+        position = bisect.bisect_left(index, key)
+        closest = min(index[max(position - 1, 0):position + 1],
+                      key=lambda depth: abs(depth - key))
+        return self._data[closest]
+
+    def _load(self, runs=None):
+        if self.loaded:
+            self.cache.use(self)
+            return
+        if self._spilled is not None:
+            #the spill has the changed runs, but merging it in properly means
+            #having everything else too
+            runs = None
+        elif runs is not None:
+            runs = set(runs) - self._loaded_runs
+            if not runs:
+                self.cache.use(self)
+                return
+        fresh = None
+        if self._spilled is not None:
+            #anything put in since the unload is newer than both the spill and
+            #what's stored, so goes on top of them
+            fresh, self._data = self._data, {}
+        self._add_stored(self._table.iter_core_samples(self, runs))
+        if self._spilled is not None:
+            self._unspill(fresh)
+        if runs is None:
+            self.loaded = True
+        else:
+            self._loaded_runs.update(runs)
+        self._account()
+
+    def _account(self):
+        self.cache.use(self, sum(len(data) for sample in self._data.itervalues()
+                                 for data in dict.itervalues(sample)))
+
+    def _add_stored(self, items):
+        """
+        Put (depth, {run: data}) items read from storage into this core.
+        """
+        for key, value in items:
+            if key == 'all':
+                #if we've got a core that used to have data in 'all', we want
+                #to put that data nicely in properties for great justice on
+                #load (should only happen on first load...)
+                sam = self.makesample(value)
+                #since it's not a "normal" sample anymore, it doesn't need
+                #depth and core, and life will be easier without them...
+                try:
+                    del sam['input']['depth']
+                    del sam['input']['core']
+                except KeyError:
+                    pass
+                self.properties = sam
+                continue
+            value = self._table.loaddictformat(value)
+            sample = self._data.get(key)
+            if sample is None:
+                sample = self._data[key] = Sample()
+                #which samples are ignored isn't stored, but outlasts unload
+                sample.ignored = key in self._ignored
+                sample.owner = self
+                self._depths = None
+            for run, data in value.iteritems():
+                if run in self._deleted:
+                    continue
+                #anything already set in memory for this run (say, a value
+                #written before the run was loaded) wins over what's stored
+                if run in self._dirty:
+                    _overlay(data, dict.get(sample, run, {}))
+                dict.__setitem__(sample, run, data)
+
+    def range(self, depth_lo, depth_hi, runs=None):
+        """
+        Returns the samples in this core from depth_lo to depth_hi (inclusive),
+        in order of depth. If the core isn't loaded, only the stored data that
+        covers those depths is read, for the given runs (or all of them).
+        """
+        lo, hi = self._unitkey(depth_lo), self._unitkey(depth_hi)
+        if self._spilled is not None:
+            self._load()
+        elif not (self.loaded or (runs is not None and
+                                  self._loaded_runs.issuperset(runs))):
+            self._add_stored(self._table.iter_core_samples(self, runs,
+                                                           (lo, hi)))
+            self._account()
+        return [self._data[key] for key in self._between(lo, hi)]
+
+    def _codec(self):
+        from cscience.backends.codec import make_codec
+        return make_codec()
+
+    def unload(self):
+        """
+        Drop this core's sample data from memory, to be read back in whenever
+        it's next needed. Unsaved changes are written out to a temporary file
+        first, and merged back in on load.
+
+        Samples from before the unload are no longer part of the core, so
+        anything still holding on to one should look it up again. Samples
+        that were ignored stay that way.
+        """
+        from cscience.backends import corefile
+
+        if self._dirty and self._data:
+            #a run has to be all in memory for it to be written out, as it
+            #replaces whatever's stored for that run when it's read back in
+            self.load_runs(self._dirty)
+        self.cache.discard(self)
+        if self._dirty and self._data:
+            records = []
+            for key, sample in self._data.iteritems():
+                data = dict((run, dict.__getitem__(sample, run)) for run in
+                            self._dirty if dict.__contains__(sample, run))
+                if data:
+                    records.append((key, data))
+            if self._spilled is not None:
+                self._spilled.close()
+            self._spilled = tempfile.TemporaryFile()
+            self._spilled_runs = set(self._dirty)
+            corefile.write_core(self._spilled, records, self._codec())
+        self._data = {}
+        self._updated = set()
+        self._frame = None
+        self._depths = None
+        self.loaded = False
+        self._loaded_runs = set()
+
+    def _unspill(self, fresh):
+        """
+        Merge the changes unload wrote out back in, over the stored data just
+        read; fresh is {key: sample} for samples put in since the unload,
+        which replace whatever was there.
+        """
+        from cscience.backends import corefile
+
+        spilled, self._spilled = self._spilled, None
+        spilled.seek(0)
+        reader = corefile.CoreFileReader(spilled, self._codec())
+        #what was spilled replaces whatever was stored for those runs
+        for sample in self._data.itervalues():
+            for run in self._spilled_runs:
+                dict.pop(sample, run, None)
+        for key, value in reader.iter_samples():
+            sample = self._data.get(key)
+            if sample is None:
+                sample = self._data[key] = Sample()
+                sample.ignored = key in self._ignored
+                sample.owner = self
+                self._depths = None
+            for run, data in value.iteritems():
+                dict.__setitem__(sample, run, data)
+        spilled.close()
+        for key, sample in fresh.iteritems():
+            old = self._data.get(key)
+            if old is None:
+                self._depths = None
+            else:
+                #replaced while unloaded; as in __setitem__, the runs the old
+                #sample had go with it
+                for run in dict.iterkeys(old):
+                    self._dirty[run] = None
+            self._data[key] = sample
 
     def __iter__(self):
         #if I'm getting all the keys, I'm going to want the values too, so
         #I might as well pull everything. Whee!
-        if self.loaded:
-            for key in self._data:
+        if self.loaded or self._spilled is not None:
+            self._load()
+            for key in self._data.keys():
+                yield key
+            return
+        #samples are read in as they're yielded, so whoever's iterating can
+        #get going before the whole core has been read
+        seen = set()
+        for key, value in self._table.iter_core_samples(self):
+            self._add_stored([(key, value)])
+            if key != 'all':
+                seen.add(key)
+                yield key
+        self.loaded = True
+        self._account()
+        #plus anything new that hasn't been saved yet
+        for key in self._data.keys():
+            if key not in seen:
                 yield key
-        else:
-            for key, value in self._table.iter_core_samples(self):
-                if key == 'all':
-                    #if we've got a core that used to have data in 'all', we want
-                    #to put that data nicely in properties for great justice on
-                    #load (should only happen on first load...)
-                    sam = self.makesample(value)
-                    #since it's not a "normal" sample anymore, it doesn't need
-                    #depth and core, and life will be easier without them...
-                    try:
-                        del sam['input']['depth']
-                        del sam['input']['core']
-                    except KeyError:
-                        pass
-                    self.properties = sam
-                    continue  #not actually part of our iteration, lulz
-                numeric = UncertainQuantity(key, 'mm')
-                self._data[self._unitkey(numeric)] = self.makesample(value)
-                yield numeric
-            self.loaded = True
+
+    def delete_run(self, run):
+        """
+        Remove all data for the given run from this core, core-wide data
+        included.
+        """
+        self.load_runs([run])
+        for sample in self._data.itervalues():
+            if sample is not None:
+                dict.pop(sample, run, None)
+        dict.pop(self.properties, run, None)
+        self._frame = None
+        self.runs.discard(run)
+        self._dirty[run] = None
+        self._deleted.add(run)
+        self.meta_modified = True
+
+    def save(self, *args, **kwargs):
+        """
+        Write out this core's sample data, if any of it has changed. Only the
+        runs that have been edited are written, and within those only the
+        columns that have actually changed are re-encoded.
+        """
+        if not self.modified:
+            return
+        #a run has to be all in memory for it to be written out
+        self.load_runs(self._dirty)
+        kwargs['dirty'] = self._dirty
+        self._table.savemany([self.saveitem(key, value) for key, value in
+                              self._data.iteritems() if value is not None],
+                             *args, **kwargs)
+        self._updated = set()
+        self._dirty = {}
+        self._deleted = set()
+
+
+def _overlay(data, newer):
+    """
+    Set everything in newer over data, and return it. Run data read in from
+    storage may be a corefile.LazyData, which dict.update (or dict()) doesn't
+    see all of, so this goes through keys() instead.
+    """
+    for name in newer.keys():
+        data[name] = newer[name]
+    return data
+
+
+def _merge_stats(first, second):
+    #coarse: a sample with values in both counts twice
+    merged = {'count': first['count'] + second['count'],
+              'present': first['present'] + second['present']}
+    depths = [entry['depths'] for entry in (first, second) if 'depths' in entry]
+    if depths:
+        merged['depths'] = [min(lo for lo, hi in depths),
+                            max(hi for lo, hi in depths)]
+    if 'min' in first and 'min' in second:
+        try:
+            factor = conversion_factor(second['units'], first['units'])
+        except ValueError:
+            return merged
+        merged['units'] = first['units']
+        merged['min'] = min(first['min'], second['min'] * factor)
+        merged['max'] = max(first['max'], second['max'] * factor)
+        merged['mean'] = (first['mean'] * first['present'] +
+                          second['mean'] * factor * second['present']) / \
+                         (first['present'] + second['present'])
+    elif 'min' in first or 'min' in second:
+        #still all numbers, as long as the other has no values at all
+        numeric, other = (first, second) if 'min' in first else (second, first)
+        if not other['present']:
+            for field in ('units', 'min', 'max', 'mean'):
+                merged[field] = numeric[field]
+    return merged
 
 
 class VirtualCore(object):
@@ -149,32 +716,139 @@ class VirtualCore(object):
     def __init__(self, core, run):
         self.core = core
         self.run = run
+        self.resolution = Resolution(run, core.properties)
         #make sure properties is at the right level!
-        self.properties = VirtualSample(core.properties, run, core.properties)
+        self.properties = self._virtual(core.properties)
+        #key -> VirtualSample, for the samples the core has right now
+        self._views = {}
+        self._views_of = None
+        #attributes a sample must have to be iterated over (see restricted)
+        self.required = ()
+
+    def _virtual(self, sample):
+        return VirtualSample(sample, self.run, self.core.properties,
+                             self.resolution)
+
+    def _view(self, key):
+        if self._views_of is not self.core._data:
+            #the core's been unloaded (and maybe read back in) since
+            self._views = {}
+            self._views_of = self.core._data
+        sample = self.core[key]
+        view = self._views.get(key)
+        if view is None or view.sample is not sample:
+            view = self._views[key] = self._virtual(sample)
+        return view
+
+    def partition(self):
+        """
+        Returns (samples, ignored samples), each in order of depth, in one
+        pass over the core.
+        """
+        samples = []
+        ignored = []
+        for key in self.core.runkeys(self.run):
+            view = self._view(key)
+            if self.core.is_ignored(key):
+                ignored.append(view)
+            else:
+                samples.append(view)
+        return samples, ignored
 
     def __iter_ignored__(self):
-        for key in self.core:
-            if self[key].sample.ignored:
-                yield self[key]
+        for key in self.core.runkeys(self.run):
+            if self.core.is_ignored(key):
+                yield self._view(key)
 
     def __iter__(self):
-        for key in self.core:
-            if not self[key].sample.ignored:
-                yield self[key]
+        for key in self.core.runkeys(self.run):
+            if not self.core.is_ignored(key):
+                view = self._view(key)
+                if all(view[att] is not None for att in self.required):
+                    yield view
+
+    def restricted(self, required):
+        """
+        A copy of this VirtualCore, sharing everything with it, that only
+        iterates over the samples that have values for all of required.
+        """
+        view = copy.copy(self)
+        view.required = tuple(required)
+        return view
 
     def __getitem__(self, key):
         if key == 'run':
             return self.run
-        return VirtualSample(self.core[key], self.run, self.core.properties)
+        return self._view(self.core._unitkey(key))
 
     def keys(self):
         return self.core.keys()
 
+    def depths(self, depth_lo=None, depth_hi=None):
+        return self.core.depths(depth_lo, depth_hi)
+
+    def range(self, depth_lo, depth_hi):
+        """
+        Returns the (non-ignored) samples from depth_lo to depth_hi, reading
+        only as much of the core as that needs.
+        """
+        return [self._virtual(sample) for sample in
+                self.core.range(depth_lo, depth_hi, ('input', self.run))
+                if not sample.ignored]
+
+    def column(self, att):
+        """
+        Returns (depths, Column) for a numeric attribute, with values from
+        this run where it has them and from input otherwise (as each
+        VirtualSample would give them). The Column is None if the attribute
+        has no numeric values in either.
+        """
+        runs = [self.run] if self.run == 'input' else [self.run, 'input']
+        frame = self.core.frame([att], runs)
+        return frame.depths, frame.resolved(att, runs)
+
+    def summary(self, att):
+        """
+        Saved summary statistics for att (see summarize) over this run and
+        input, the same places a VirtualSample looks for it. For a virtual
+        attribute, covers all the attributes it's made of. None if this isn't
+        known without going through the samples (no summary was saved, or
+        the core has changed since).
+        """
+        result = None
+        runs = [self.run] if self.run == 'input' else [self.run, 'input']
+        for run in runs:
+            stats = self.core.summary_for(run)
+            if stats is None:
+                if run in self.core.runs:
+                    return None
+                continue
+            for name in self.resolution.names(att):
+                entry = stats.get(name)
+                if entry is None:
+                    continue
+                if result is None:
+                    result = dict(entry)
+                    continue
+                result = _merge_stats(result, entry)
+        return result or {'count': 0, 'present': 0}
+
+    def has_values(self, att):
+        """
+        Whether any sample (or the core as a whole) has a value for att, from
+        the saved summaries; None if that's not known without looking.
+        """
+        stats = self.summary(att)
+        if stats is None:
+            return None
+        return bool(stats['present']) or self.properties[att] is not None
+
     def createvalue(self, depth, key, value):
         sample = self.core.forcesample(depth)
         sample.setdefault(self.run, {})
         sample[self.run][key] = value
-        return VirtualSample(sample, self.run, self.core.properties)
+        sample.touch(self.run, key)
+        return self._view(self.core._unitkey(depth))
 
 
 class Cores(Collection):
@@ -187,37 +861,54 @@ class Cores(Collection):
     @classmethod
     def loadkeys(cls, backend):
         try:
-            data = cls._table.loadkeys()
+            #properties get loaded by each core as needed
+            data = cls._table.loadkeys(['runs', 'summary'])
         except NameError:
             cls.instance = cls.bootstrap(backend)
         else:
             instance = cls([])
             Core.connect(backend)
             for key, value in data.iteritems():
-                instance[key] = Core(
-                    key,
-                    value.get('runs', []),
-                    #TODO: does this need any formatting?
-                    value.get('properties', {}))
+                core = Core(key, value.get('runs', []))
+                for stats in value.get('summary', []):
+                    stats = dict(stats)
+                    run, att = stats.pop('run'), stats.pop('att')
+                    core.summary.setdefault(run, {})[att] = stats
+                core._properties = None
+                core.meta_modified = False
+                instance._data[key] = core
 
             cls.instance = instance
 
     def delete_core(self, core):
         Core._table.delete_item(core.name)
+        Core.cache.discard(core)
         del self._data[core.name]
 
     def saveitem(self, key, value):
-        runs = list(value.runs)
-        properties = self._table.formatsavedict(value.properties)
-        new_val = self._table.formatsavedict({
-            'runs': runs,
-            'properties': properties
-        })
-        return (key, new_val)
+        #as a list, as attribute names may not make good keys everywhere
+        new_val = {'runs': list(value.runs),
+                   'summary': [dict(stats, run=run, att=att) for run, atts in
+                               value.summary.iteritems()
+                               for att, stats in atts.iteritems()]}
+        #properties that were never loaded can't have changed
+        if value._properties is not None:
+            new_val['properties'] = self._table.formatsavedict(
+                                                    value.properties)
+        return (key, self._table.formatsavedict(new_val))
 
     def save(self, *args, **kwargs):
-        super(Cores, self).save(*args, **kwargs)
+        #only cores whose runs or properties have changed need their map
+        #entries rewritten; sample data is saved (or not) by each core.
+        for core in self._data.itervalues():
+            if core is not None:
+                core.update_summary()
+        self._table.savemany([self.saveitem(key, core) for key, core in
+                              self._data.iteritems() if core is not None and
+                              (key in self._updated or core.meta_modified)],
+                             *args, **kwargs)
+        self._updated = set()
         for core in self._data.itervalues():
-            if core.loaded:
-                kwargs['name'] = core.name
-                core.save(*args, **kwargs)
+            core.meta_modified = False
+            kwargs['name'] = core.name
+            core.save(*args, **kwargs)
@@ -1,4 +1,5 @@
 import cscience.datastore
+from attributes import VirtualAttribute
 
 class Sample(dict):
     """
@@ -9,9 +10,40 @@ class Sample(dict):
     """
 
     def __init__(self, experiment='input', exp_data={}):
+        #whoever holds this sample (usually its Core) and wants to hear about
+        #changes to it; see touch()
+        self.owner = None
         self[experiment] = exp_data.copy()
         self.ignored = False
 
+    def __setitem__(self, run, data):
+        super(Sample, self).__setitem__(run, data)
+        self.touch(run)
+
+    def touch(self, run, key=None):
+        """
+        Note that data for the given run (and attribute, if known) in this
+        sample has changed, so it will be included in the next save.
+        """
+        if self.owner is not None:
+            self.owner.sample_changed(self, run, key)
+
+    @property
+    def ignored(self):
+        return self._ignored
+
+    @ignored.setter
+    def ignored(self, ignored):
+        self._ignored = ignored
+        if self.owner is not None:
+            self.owner.sample_ignored(self, ignored)
+
+    def __setstate__(self, state):
+        #pickled before ignored was a property
+        if 'ignored' in state:
+            state['_ignored'] = state.pop('ignored')
+        self.__dict__.update(state)
+
     @property
     def name(self):
         return '%s:%d' % (self['input'].get('core', 'Core Unset'), 
@@ -23,22 +55,77 @@ class Sample(dict):
 
 
 
+#marks a value that isn't there at all, as opposed to one that's None
+_MISSING = object()
+_NOTHING = {}
+
+
+class Resolution(object):
+    """
+    How VirtualSamples for one run of one core find their values: the layers
+    of data to look through, in order (the run, then input, then the same
+    two in the core-wide data), and the real attributes behind each virtual
+    one. Built once per VirtualCore and shared by all its samples.
+    """
+    __slots__ = ('run', 'runs', 'core_wide', 'virtual', 'revision')
+
+    def __init__(self, run, core_wide):
+        self.run = run
+        self.runs = (run,) if run == 'input' else (run, 'input')
+        self.core_wide = core_wide
+        #virtual attributes are looked up when first needed, and again
+        #whenever they change
+        self.virtual = None
+        self.revision = None
+
+    def lookup(self, sample, key):
+        for run in self.runs:
+            value = sample.get(run, _NOTHING).get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+        for run in self.runs:
+            value = self.core_wide.get(run, _NOTHING).get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+        return None
+
+    def names(self, key):
+        """
+        The real attributes to look for when asked for key: key itself, or
+        what it's made of if it's a virtual attribute.
+        """
+        if self.revision != VirtualAttribute.revision:
+            self.virtual = cscience.datastore.Datastore(). \
+                                sample_attributes.virtual_map()
+            self.revision = VirtualAttribute.revision
+        return self.virtual.get(key, (key,))
+
+    def value(self, sample, key):
+        #the first non-null value, if key is virtual and stands for several
+        for name in self.names(key):
+            value = self.lookup(sample, name)
+            if value is not None:
+                return value
+        return None
+
+
 class VirtualSample(object):
     """
     A VirtualSample is a view of a sample with only one run. This allows
     viewing of sample data generated by multiple runs (e.g. 'age') as
     distinct entities. Input data is available under all runs.
     """
-    #PERF: this is not a terribly efficient class/abstraction; if it turns out
-    #to be a memory or performance bottleneck various elements can be made faster
+    #there are a lot of these made (one per sample, each time a core is gone
+    #through), so they're kept small, and share how they look values up
+    __slots__ = ('sample', 'run', 'core_wide', 'resolution')
 
-    def __init__(self, sample, run, core_wide={}):
+    def __init__(self, sample, run, core_wide={}, resolution=None):
         self.sample = sample
         self.run = run
         self.core_wide = core_wide
+        self.resolution = resolution or Resolution(run, core_wide)
         #Make sure the run specified is a working entry in the sample
         self.sample.setdefault(self.run, {})
-        self.dst = cscience.datastore.Datastore()
 
     def __getitem__(self, key):
         if key == 'run':
@@ -46,30 +133,26 @@ class VirtualSample(object):
             #run object? It might, but some testing is needed to make sure
             #that doesn't break various things....
             return self.run
-        try:
-            att = self.dst.sample_attributes[key]
-        except KeyError:
-            pass
-        else:
-            if att.is_virtual:
-                return att.compose_value(self)
-        try:
-            return self.sample[self.run][key]
-        except KeyError:
-            try:
-                return self.sample['input'][key]
-            except KeyError:
-                try:
-                    return self.core_wide[self.run][key]
-                except KeyError:
-                    try:
-                        return self.core_wide['input'][key]
-                    except KeyError:
-                        return None
+        return self.resolution.value(self.sample, key)
+
     def __setitem__(self, key, item):
         self.sample[self.run][key] = item
+        self.sample.touch(self.run, key)
     def __delitem__(self, key):
         del self.sample[self.run][key]
+        self.sample.touch(self.run, key)
+
+    def touch(self, key):
+        """
+        Note that the value for key has been changed in place (say, had its
+        units changed), in whichever run of the sample it came from, so it
+        gets saved.
+        """
+        for name in self.resolution.names(key):
+            for run in self.resolution.runs:
+                if self.sample.get(run, _NOTHING).get(name) is not None:
+                    self.sample.touch(run, name)
+                    return
 
     def __contains__(self, key):
         return key in self.keys()
@@ -98,11 +181,12 @@ class VirtualSample(object):
         return keys
 
     def setdefault(self, key, value):
-        self.sample[self.run].setdefault(key, value)
+        if key not in self.sample[self.run]:
+            self[key] = value
 
     def search(self, value, view=None, exact=False):
         if not view:
-            view = self.dst.views['All']
+            view = cscience.datastore.Datastore().views['All']
         for att in view:
             val = str(self[att] or '')
             if val == value or (not exact and value in val):
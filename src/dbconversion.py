@@ -29,6 +29,12 @@ def convert_data(repo):
         newfile.close()
         del mil['entries']
         milieus.save(mil)
+
+    #milieu_map entries used to list every key in the milieu; now the keys
+    #are only read along with the milieu's data.
+    for mil in milieus.find({'keys': {'$exists': True}}):
+        mil['size'] = len(mil.pop('keys'))
+        milieus.save(mil)
         
 
 if __name__ == '__main__':
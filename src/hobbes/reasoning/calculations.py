@@ -29,6 +29,7 @@ calculations.py
 
 #forces all division to be floating-point
 from __future__ import division
+import bisect
 import numpy as np
 import scipy.integrate as integrate
 import os
@@ -184,11 +185,11 @@ def get_normal_peak_behavior(core, depths):
     # get current peak dict
     depthlist, proxylist = depths
 
-    alldepths = sorted(core.keys())
+    alldepths = core.depths()
     length = len(depthlist)
     # get the index of the depth halfway up
     smallestdepth = alldepths[0]
-    i = next(x[0] for x in enumerate(alldepths) if x[1] > (smallestdepth + depthlist[0])/2)
+    i = bisect.bisect_right(alldepths, (smallestdepth + depthlist[0])/2)
 
     depthlist1 = alldepths[i-length:i]
     depthlist2 = alldepths[i:i+length]
@@ -267,18 +268,37 @@ def known_depth_proxies(core,depth_interval):
     #print 'hey'
     #print core.keys()
     #print '\n'
-    depthlist = sorted(core.keys())
-    #print depthlist
-    #print depthlist
-    #print min(depthlist)
-    #print max(depthlist)
     #print depth_interval[0], depth_interval[1]
-    depthlist = [a for a in depthlist if a >= depth_interval[0] and a <= depth_interval[1]]
+    depthlist = core.depths(depth_interval[0], depth_interval[1])
     #print 'depthlist is now ', depthlist
     proxylist = sorted(core[depthlist[0]].keys())
     proxylist = ["nh4","hno3","BCconc30","BCgeom30","Mg","nssS","nssS_Na","Cl","nssCa","Mn","Na","Sr","I","LightREE"]
     return depthlist,proxylist
 
+def has_values(core, att):
+    """
+    Whether any sample in the core has a value for att; uses the core's saved
+    summary when there is one.
+    """
+    known = core.has_values(att)
+    if known is None:
+        known = any(sample[att] is not None for sample in core)
+    return known
+
+def value_range(core, att):
+    """
+    (min, max) of the values of att in the core, in the units of the first
+    one; uses the core's saved summary when there is one.
+    """
+    stats = core.summary(att)
+    if stats is not None and 'min' in stats:
+        return stats['min'], stats['max']
+    depths, column = core.column(att)
+    if column is None or not column.present.any():
+        return None
+    values = column.values[column.present]
+    return np.min(values), np.max(values)
+
 #TODO: make a useful auto-currier thing
 def min(core, *args):
     return np.min(*args)
@@ -0,0 +1,75 @@
+"""
+Micro-benchmark for core encoding and decoding.
+
+Compares converting a core one value at a time (what happens for anything
+stored as generic JSON) against converting it a column at a time, through
+the columnar core file format. Uses the largest core in database_dump,
+optionally repeated to make a bigger one:
+
+    python -m tests.bench_codec [copies]
+"""
+
+import cStringIO
+import json
+import sys
+import timeit
+
+import cscience.datastore
+from cscience.backends import corefile
+from cscience.backends.codec import make_codec
+from tests.test_codec import stored_cores
+
+
+def build_core(copies):
+    records = max(stored_cores().itervalues(), key=len)
+    records = [record for record in records
+               if record['_precise_sample_depth'] != 'all']
+    core = []
+    for copy in range(copies):
+        for record in records:
+            record = dict(record)
+            depth = float(record.pop('_precise_sample_depth'))
+            core.append((depth + copy * 1e6, record))
+    return core
+
+
+def best(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main(copies=1):
+    codec = make_codec()
+    stored = build_core(copies)
+    text = json.dumps([record for depth, record in stored])
+    samples = [(depth, codec.decode(json.loads(json.dumps(record))))
+               for depth, record in stored]
+
+    columnar = cStringIO.StringIO()
+    corefile.write_core(columnar, samples, codec)
+    data = columnar.getvalue()
+
+    def decode_each():
+        [codec.decode(record) for record in json.loads(text)]
+
+    def encode_each():
+        json.dumps([codec.encode(sample) for depth, sample in samples])
+
+    def decode_columns():
+        reader = corefile.CoreFileReader(cStringIO.StringIO(data), codec)
+        reader.iter_samples()
+
+    def encode_columns():
+        corefile.write_core(cStringIO.StringIO(), samples, codec)
+
+    print '%d samples; %d bytes as json, %d bytes columnar' % (
+            len(samples), len(text), len(data))
+    for name, each, columns in (('decode', decode_each, decode_columns),
+                                ('encode', encode_each, encode_columns)):
+        each = best(each)
+        columns = best(columns)
+        print '%s: %.3fs per value, %.3fs per column (%.1fx)' % (
+                name, each, columns, each / columns)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
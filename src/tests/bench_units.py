@@ -0,0 +1,91 @@
+"""
+Micro-benchmark for unit conversions.
+
+Compares doing the conversions that core loading, importing and looking up
+samples by depth need with quantities itself (what used to happen) against
+going through the cached factors in datastructures. Uses the largest core in
+database_dump, optionally repeated to make a bigger one:
+
+    python -m tests.bench_units [copies]
+"""
+
+import sys
+
+import quantities as pq
+
+import cscience.datastore
+from cscience.backends.codec import make_codec
+from cscience.framework import Core, datastructures
+from tests.bench_codec import best, build_core
+
+
+def old_unitkey(depth):
+    try:
+        return float(depth.rescale('mm').magnitude)
+    except AttributeError:
+        return float(depth)
+
+
+def old_units(value, new_unit):
+    #what the UncertainQuantity units setter used to do
+    to_dims = pq.quantity.validate_dimensionality(new_unit)
+    if value._dimensionality == to_dims:
+        return
+    factor = pq.quantity.get_conversion_factor(
+        pq.Quantity(1.0, value._dimensionality), pq.Quantity(1.0, to_dims))
+    mag = value.magnitude
+    mag *= factor
+    value._dimensionality = to_dims
+    for quant in value.uncertainty.magnitude:
+        quant.units = new_unit
+
+
+def main(copies=1):
+    codec = make_codec()
+    samples = [(depth, codec.decode(record))
+               for depth, record in build_core(copies)]
+    depths = [sample['input']['depth'] for depth, sample in samples
+              if 'depth' in sample.get('input', {})]
+    core = Core('bench')
+    core.loaded = True
+
+    def load(unitkey):
+        def run():
+            core._data = {}
+            for depth in depths:
+                core._data[unitkey(depth)] = None
+        return run
+
+    def lookup(unitkey):
+        def run():
+            for depth in depths:
+                core._data[unitkey(depth)]
+        return run
+
+    #a spreadsheet's worth of values, each converted from cm to m
+    cells = [(float(index), 0.5) for index in range(len(depths) * 10)]
+
+    def import_cells(convert):
+        def run():
+            for value, error in cells:
+                quantity = datastructures.UncertainQuantity(value, 'cm',
+                                                            error)
+                convert(quantity, 'm')
+        return run
+
+    def new_units(value, new_unit):
+        value.units = new_unit
+
+    print '%d samples, %d imported values' % (len(depths), len(cells))
+    for name, old, new in (
+            ('load', load(old_unitkey), load(core._unitkey)),
+            ('depth lookup', lookup(old_unitkey), lookup(core._unitkey)),
+            ('import', import_cells(old_units), import_cells(new_units))):
+        old = best(old)
+        new = best(new)
+        print '%s: %.3fs with quantities, %.3fs cached (%.1fx)' % (
+                name, old, new, old / new)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,49 @@
+"""
+Tests for running computation plans without the GUI.
+"""
+
+import unittest
+
+import cscience.datastore
+import cscibox_run
+from cscience.components import BaseComponent
+
+
+class TestAnswers(unittest.TestCase):
+
+    def setUp(self):
+        self.component = BaseComponent()
+        self.component.answers = {'Iterations': '300', 'Thickness': 2,
+                                  'Correction': [100, 20],
+                                  'Spread': {'value': 5, 'error': [1, 2]}}
+
+    def test_answer(self):
+        answer = self.component.answer
+        self.assertEqual(answer(('Iterations', ('integer', None, False), 200)),
+                         300)
+        thickness = answer(('Thickness', ('float', 'cm', False), 5))
+        self.assertEqual((thickness.magnitude, str(thickness.dimensionality)),
+                         (2.0, 'cm'))
+        correction = answer(('Correction', ('float', 'years', True)))
+        self.assertEqual(float(correction.magnitude), 100.0)
+        self.assertEqual(correction.uncertainty.get_mag_tuple(), (20.0, 20.0))
+        spread = answer(('Spread', ('float', 'years', True)))
+        self.assertEqual(spread.uncertainty.get_mag_tuple(), (1.0, 2.0))
+        #defaults fill in for anything not answered, if there is one
+        self.assertEqual(answer(('Memory', ('float', None, False), 0.7)), 0.7)
+        self.assertRaises(KeyError, answer, ('Memory', ('float', None, True)))
+
+    def test_cores(self):
+        found, missing = cscibox_run.find_cores(
+                        ['MD02', 'MD01', 'Steel Lake'], ['MD*', 'MD01', 'X*'])
+        self.assertEqual(found, ['MD01', 'MD02'])
+        self.assertEqual(missing, ['X*'])
+        parameters = {'a': 1, 'b': 2, 'cores': {'MD01': {'b': 3}}}
+        self.assertEqual(cscibox_run.core_answers(parameters, 'MD01'),
+                         {'a': 1, 'b': 3})
+        self.assertEqual(cscibox_run.core_answers(parameters, 'MD02'),
+                         {'a': 1, 'b': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
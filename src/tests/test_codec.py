@@ -0,0 +1,351 @@
+"""
+Round-trip tests for the storage codec, using the data shipped in
+database_dump as a corpus of everything we actually store.
+"""
+
+import copy
+import cPickle
+import cStringIO
+import json
+import os
+import unittest
+
+import bson
+import numpy as np
+
+import cscience.datastore
+from cscience.backends import corefile
+from cscience.backends.codec import make_codec
+from cscience.framework import datastructures
+
+DUMP = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                    os.pardir, 'database_dump', 'dump', 'repository')
+
+
+def read_collection(name):
+    with open(os.path.join(DUMP, name + '.bson'), 'rb') as dumpfile:
+        return bson.decode_all(dumpfile.read())
+
+
+def read_files(name):
+    """
+    Returns {filename: contents} for a GridFS collection in the dump.
+    """
+    files = read_collection(name + '.files')
+    chunks = {}
+    for chunk in sorted(read_collection(name + '.chunks'),
+                        key=lambda chunk: (chunk['files_id'], chunk['n'])):
+        chunks.setdefault(chunk['files_id'], []).append(str(chunk['data']))
+    return dict((item['name'], ''.join(chunks[item['_id']]))
+                for item in files)
+
+
+def stored_cores():
+    """
+    Returns {core name: list of stored (encoded) sample records}.
+    """
+    return dict((name, json.loads(data)) for name, data in
+                read_files('core_files').iteritems())
+
+
+def strip_ids(value):
+    value = dict(value)
+    value.pop('_id', None)
+    return value
+
+
+@unittest.skipUnless(os.path.isdir(DUMP), 'database dump not available')
+class TestCodecRoundTrip(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = make_codec()
+
+    def reencode(self, stored):
+        #go through json so we get what a real load would
+        return self.codec.encode(self.codec.decode(
+                                    json.loads(json.dumps(stored))))
+
+    def assertRoundTrip(self, stored):
+        self.assertEqual(self.reencode(stored), stored)
+
+    def test_core_samples(self):
+        for name, records in stored_cores().iteritems():
+            for record in records:
+                if record['_precise_sample_depth'] == 'all':
+                    #pre-properties data, with old untagged site info that
+                    #gets upgraded on load; has to be stable from then on
+                    self.assertRoundTrip(self.reencode(record))
+                else:
+                    self.assertRoundTrip(record)
+
+    def test_streamed_cores(self):
+        for name, data in read_files('core_files').iteritems():
+            if data.startswith(corefile.MAGIC):
+                continue
+            self.assertEqual(list(corefile.iter_json_list(
+                                    cStringIO.StringIO(data), 1000)),
+                             json.loads(data))
+
+    def test_core_properties(self):
+        for core in read_collection('cores'):
+            self.assertRoundTrip(strip_ids(core))
+
+    def test_milieus(self):
+        for name, data in read_files('milieu_files').iteritems():
+            for record in json.loads(data):
+                self.assertRoundTrip(record)
+
+    def test_records(self):
+        for name in ('workflows', 'cplans', 'views', 'atts', 'coreatts',
+                     'templates'):
+            for doc in read_collection(name):
+                value = cPickle.loads(str(doc['pickled_data']))
+                stored = self.codec.encode(value)
+                self.assertEqual(stored['version'], 1)
+                self.assertRoundTrip(stored)
+                self.assertIs(type(self.codec.decode(stored)), type(value))
+
+    def test_newer_record(self):
+        stored = self.codec.encode(
+                    cscience.framework.calculations.Workflow('test'))
+        stored['version'] += 1
+        self.assertRaises(ValueError, self.codec.decode, stored)
+
+    def test_types(self):
+        decoded = {}
+        for records in stored_cores().itervalues():
+            for record in records:
+                for run, data in self.codec.decode(record).iteritems():
+                    if isinstance(data, dict):
+                        for value in data.itervalues():
+                            decoded[type(value)] = value
+        self.assertIn(datastructures.UncertainQuantity, decoded)
+
+    def test_new_types(self):
+        values = [datastructures.PointlistInterpolation([1, 2, 3], [4, 5, 6]),
+                  datastructures.TimeData(
+                      datastructures.time.strptime('2016-04-01', '%Y-%m-%d')),
+                  datastructures.GeographyData(40.0, -105.3, 1655, 'Boulder'),
+                  datastructures.UncertainQuantity(12.5, 'years', [1.0, 2.0]),
+                  datastructures.UncertainQuantity(3, 'cm', 0.5)]
+        for value in values:
+            self.assertRoundTrip(self.codec.encode(value))
+
+    def test_pointlist_units(self):
+        model = datastructures.PointlistInterpolation([1, 2], [4, 5],
+                                                      xunits='mm')
+        self.assertEqual(self.codec.decode(self.codec.encode(model)).xunits,
+                         'mm')
+        #as saved before models kept their depth units
+        old = self.codec.decode({'_datatype': 'pointlist',
+                                 'xpoints': [1, 2], 'ypoints': [4, 5]})
+        self.assertIsNone(old.xunits)
+
+    def test_baconinfo(self):
+        model = datastructures.BaconInfo(
+                    [[0.0, 10.0, 20.0], [0, 150, 300.5], [0, 100, 250]], 'run')
+        for value in (model, model.summarized()):
+            stored = self.codec.encode(value)
+            self.assertRoundTrip(stored)
+            decoded = self.codec.decode(stored)
+            self.assertEqual(decoded.summary_only, value.summary_only)
+            self.assertEqual(decoded.mean().tolist(), [0, 125, 275.25])
+        #as saved before ensembles were packed
+        old = self.codec.decode({'_datatype': 'baconinfo', 'run': 'run',
+                                 'csv_data': model.csv_data})
+        self.assertEqual(old.ensemble.tolist(), model.ensemble.tolist())
+
+
+@unittest.skipUnless(os.path.isdir(DUMP), 'database dump not available')
+class TestQuantityColumns(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = make_codec()
+
+    def columns(self):
+        """
+        Yields (units, uncertain, values) for every numeric column that
+        has consistent units in the corpus.
+        """
+        for records in stored_cores().itervalues():
+            columns = {}
+            for record in records:
+                for run, data in self.codec.decode(record).iteritems():
+                    if not isinstance(data, dict):
+                        continue
+                    for att, value in data.iteritems():
+                        columns.setdefault((run, att), []).append(value)
+            for values in columns.itervalues():
+                info = set(corefile._quantity_info(val) for val in values)
+                if len(info) == 1 and None not in info:
+                    units, uncertain = info.pop()
+                    yield units, uncertain, values
+
+    def test_columns(self):
+        count = 0
+        for units, uncertain, values in self.columns():
+            mags, errors = self.codec.encode_quantities(values, uncertain)
+            result = self.codec.decode_quantities(mags, units, errors)
+            self.assertEqual(len(result), len(values))
+            for old, new in zip(values, result):
+                self.assertEqual(type(old), type(new))
+                self.assertEqual(repr(old), repr(new))
+                self.assertEqual(old.dimensionality, new.dimensionality)
+            count += 1
+        self.assertTrue(count)
+
+    def test_units_independent(self):
+        #each decoded value has to be able to change units on its own
+        values = [datastructures.UncertainQuantity(val, 'cm', 1)
+                  for val in (1, 2)]
+        mags, errors = self.codec.encode_quantities(values, True)
+        first, second = self.codec.decode_quantities(mags, 'cm', errors)
+        first.units = 'mm'
+        self.assertEqual(float(first.magnitude), 10)
+        self.assertEqual(float(first.uncertainty), 10)
+        self.assertEqual(str(second.dimensionality), 'cm')
+        self.assertEqual(float(second.uncertainty), 1)
+
+
+def calibrated_age(mean, sigma, xs=None):
+    if xs is None:
+        xs = np.arange(int(mean - 5 * sigma), int(mean + 5 * sigma) + 1)
+    ys = np.exp(-0.5 * ((xs - mean) / sigma) ** 2)
+    ys /= ys.sum()
+    dist = datastructures.ProbabilityDistribution(
+                    xs, ys, mean, (mean - 2 * sigma, mean + 2 * sigma))
+    return datastructures.UncertainQuantity(mean, 'years', dist)
+
+
+class TestDistributions(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = make_codec()
+
+    def assertSameDist(self, old, new):
+        self.assertTrue(np.allclose(old.x, new.x, rtol=0, atol=1e-9))
+        self.assertTrue(np.allclose(old.y, new.y, rtol=1e-6, atol=0))
+        self.assertEqual(old.average, new.average)
+        self.assertEqual(tuple(old.range), tuple(new.range))
+
+    def test_pack(self):
+        for xs in (None, np.linspace(0, 1000, 257), np.sort(
+                            np.random.RandomState(3).uniform(0, 900, 300))):
+            value = calibrated_age(450.5, 40, xs)
+            dist = value.uncertainty.distribution
+            info, data = self.codec.pack_distribution(dist)
+            self.assertSameDist(dist,
+                                self.codec.unpack_distribution(info, data))
+            self.assertSameDist(dist, self.codec.decode_distribution(
+                                json.loads(json.dumps(
+                                    self.codec.encode_distribution(dist)))))
+            #regular grids don't need their x values stored at all
+            self.assertEqual('start' in info, xs is None or len(xs) == 257)
+
+    def test_grid(self):
+        years = np.arange(1001)
+        #a triangle from 400 to 600
+        density = np.maximum(100 - abs(years - 500), 0) / 10000.0
+        dist = datastructures.ProbabilityDistribution(years, density)
+        #tails trimmed down to a single 0 at each end, and only the grid kept
+        self.assertEqual((dist.start, dist.step, len(dist)), (400, 1, 201))
+        self.assertIsNone(dist._x)
+        self.assertEqual(dist.x[-1], 600)
+        self.assertAlmostEqual(dist.average, 500)
+        self.assertAlmostEqual(dist.quantile(0.5), 500)
+        self.assertAlmostEqual(dist.cdf(450), 0.125)
+        #half-width 100 * (1 - sqrt(1 - .683)) either side of the peak
+        self.assertEqual(dist.range, (457, 543))
+
+    def test_old_json(self):
+        dist = calibrated_age(1200, 25).uncertainty.distribution
+        stored = {'_datatype': 'quantity', 'magnitude': u'1200.0',
+                  'units': u'yr', 'uncertainty': {'dist': {
+                        'x': dist.x.tolist(), 'y': dist.y.tolist(),
+                        'avg': dist.average, 'rng': dist.range}}}
+        value = self.codec.decode(stored)
+        self.assertEqual(value.uncertainty.get_mag_tuple(), (50, 50))
+        self.assertSameDist(dist, value.uncertainty.distribution)
+
+    def test_lazy(self):
+        original = calibrated_age(800, 30)
+        value = self.codec.decode(json.loads(json.dumps(
+                                self.codec.encode(original))))
+        self.assertIsNotNone(value.uncertainty._loader)
+        self.assertEqual(value.uncertainty.get_mag_tuple(), (60, 60))
+        self.assertSameDist(original.uncertainty.distribution,
+                            value.uncertainty.distribution)
+        self.assertIsNone(value.uncertainty._loader)
+
+    def test_core_file(self):
+        values = [calibrated_age(mean, 20 + mean / 100)
+                  for mean in range(500, 5000, 250)]
+        records = [(float(depth), {'input': {'age': value}})
+                   for depth, value in enumerate(values)]
+        #some samples without a distribution, or a value at all
+        records[1][1]['input']['age'] = datastructures.UncertainQuantity(
+                                                    3, 'years', [1.0])
+        del records[2][1]['input']['age']
+        out = cStringIO.StringIO()
+        corefile.write_core(out, records, self.codec)
+        reader = corefile.CoreFileReader(cStringIO.StringIO(out.getvalue()),
+                                         self.codec)
+        loaded = reader.read_column(reader.columns()[0])
+        self.assertIs(loaded[2], corefile.ABSENT)
+        self.assertIsNone(loaded[1].uncertainty.distribution)
+        for index, value in enumerate(values):
+            if index in (1, 2):
+                continue
+            self.assertEqual(value.uncertainty.get_mag_tuple(),
+                             loaded[index].uncertainty.get_mag_tuple())
+            self.assertSameDist(value.uncertainty.distribution,
+                                loaded[index].uncertainty.distribution)
+
+    def lazy_samples(self, records):
+        out = cStringIO.StringIO()
+        corefile.write_core(out, records, self.codec)
+        reader = corefile.CoreFileReader(cStringIO.StringIO(out.getvalue()),
+                                         self.codec)
+        return reader.lazy_samples()
+
+    def test_lazy_data(self):
+        records = [(float(depth), {'input': {'depth': float(depth),
+                        'age': datastructures.UncertainQuantity(depth * 100,
+                                                                'years', 5)}})
+                   for depth in range(3)]
+        data = self.lazy_samples(records)[1][1]['input']
+        self.assertIsInstance(data, corefile.LazyData)
+        self.assertEqual(sorted(data.keys()), ['age', 'depth'])
+        self.assertEqual((len(data), 'age' in data), (2, True))
+        self.assertEqual(data._pending, set(['age', 'depth']))
+        #copies have everything, whatever's been decoded so far
+        self.assertEqual(data['depth'], 1.0)
+        for copied in (data.copy(), copy.copy(data), copy.deepcopy(data)):
+            self.assertIs(type(copied), dict)
+            self.assertEqual(sorted(copied), ['age', 'depth'])
+            self.assertEqual(float(copied['age'].magnitude), 100.0)
+
+    def test_lazy_save(self):
+        records = [(float(depth), {'input': {'depth': float(depth),
+                                             'note': 'n%d' % depth},
+                                   'run1': {'x': depth * 2}})
+                   for depth in range(3)]
+        samples = self.lazy_samples(records)
+        #one column decoded, one changed, the rest never looked at
+        samples[0][1]['input']['depth']
+        samples[2][1]['input']['note'] = 'changed'
+        samples[1][1]['run1'].update({'y': 1})
+        self.assertEqual(cPickle.loads(cPickle.dumps(samples[0][1]['run1'])),
+                         {'x': 0})
+        resaved = dict((depth, dict((run, data.copy()) for run, data in
+                                    sample.iteritems()))
+                       for depth, sample in self.lazy_samples(samples))
+        self.assertEqual(resaved[2.0], {'input': {'depth': 2.0,
+                                                  'note': 'changed'},
+                                        'run1': {'x': 4}})
+        self.assertEqual(resaved[1.0]['run1'], {'x': 2, 'y': 1})
+        self.assertEqual(resaved[0.0]['input'], {'depth': 0.0, 'note': 'n0'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Tests for column-wise access to core data.
+"""
+
+import unittest
+
+import numpy as np
+
+import cscience.datastore
+from cscience.framework import Core, CoreFrame, Sample, VirtualCore
+from cscience.framework import datastructures
+
+
+def quantity(value, units, error=None):
+    return datastructures.UncertainQuantity(value, units, error)
+
+
+class TestCoreFrame(unittest.TestCase):
+
+    def setUp(self):
+        self.core = Core('Test', ['run1'])
+        #nothing stored; everything we need is in memory
+        self.core.loaded = True
+        for depth, age in ((30, 1200.0), (10, 500.0), (20, None)):
+            sample = Sample(exp_data={'depth': quantity(depth, 'cm'),
+                                      'note': 'x'})
+            self.core.add(sample)
+            if age is not None:
+                sample['run1'] = {'age': quantity(age, 'years', [10.0, 20.0])}
+        self.core[200.0]['input']['age'] = quantity(0.9, 'kiloyears', 50.0)
+
+    def test_columns(self):
+        frame = self.core.frame(['depth', 'age', 'note'])
+        self.assertTrue(isinstance(frame, CoreFrame))
+        self.assertEqual(frame.depths.tolist(), [100.0, 200.0, 300.0])
+        depth = frame.column('input', 'depth')
+        self.assertEqual(depth.units, 'cm')
+        self.assertEqual(depth.values.tolist(), [10.0, 20.0, 30.0])
+        #not numbers, so no column
+        self.assertNotIn(('input', 'note'), frame)
+        age = frame.column('run1', 'age')
+        self.assertEqual(age.present.tolist(), [True, False, True])
+        self.assertEqual(age.err_low[0], 10.0)
+        self.assertEqual(age.err_high[0], 20.0)
+        self.assertEqual(frame.index_of(300.0), 2)
+        self.assertRaises(KeyError, frame.index_of, 250.0)
+
+    def test_virtual(self):
+        depths, age = VirtualCore(self.core, 'run1').column('age')
+        self.assertEqual(age.units, 'yr')
+        self.assertEqual(age.values.tolist(), [500.0, 900.0, 1200.0])
+        self.assertEqual(age.err_low.tolist(), [10.0, 50000.0, 10.0])
+
+    def test_changes(self):
+        frame = self.core.frame(['depth'])
+        self.assertIs(self.core.frame(['depth']).column('input', 'depth'),
+                      frame.column('input', 'depth'))
+        self.core.forcesample(40.0)
+        self.assertEqual(len(self.core.frame(['depth'])), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
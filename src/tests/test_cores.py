@@ -0,0 +1,224 @@
+"""
+Tests for looking up a core's samples by depth, and their values by run.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cscience.datastore
+from cscience.backends import sqlite
+from cscience.framework import Attribute, Attributes, Core, Sample, \
+    VirtualCore
+from cscience.framework.samples import VirtualAttribute
+from cscience.framework import datastructures
+
+
+class TestDepthIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.core = Core('Test', ['run1'])
+        #nothing stored; everything we need is in memory
+        self.core.loaded = True
+        for depth in (3, 1, 4, 1.5, 9):
+            self.core.add(Sample(exp_data={
+                    'depth': datastructures.UncertainQuantity(depth, 'cm')}))
+
+    def test_depths(self):
+        self.assertEqual(self.core.depths(), [10.0, 15.0, 30.0, 40.0, 90.0])
+        self.assertEqual(self.core.depths(15, 40), [15.0, 30.0, 40.0])
+        #index keeps up with new samples
+        self.core.forcesample(20.0)
+        self.assertEqual(self.core.depths(12, 25), [15.0, 20.0])
+        depth = datastructures.UncertainQuantity(2, 'cm')
+        self.assertEqual(self.core.index_of(depth), 2)
+        self.assertRaises(KeyError, self.core.index_of, 21.0)
+
+    def test_lookups(self):
+        self.assertIs(self.core.nearest(36), self.core[40.0])
+        #ties go to the shallower sample
+        self.assertIs(self.core.nearest(35), self.core[30.0])
+        self.assertIs(self.core.nearest(500), self.core[90.0])
+        self.assertEqual(self.core[1:3], [self.core[15.0], self.core[30.0]])
+        self.assertEqual(self.core.range(12, 40),
+                         [self.core[15.0], self.core[30.0], self.core[40.0]])
+
+    def test_changes(self):
+        #as if just saved
+        self.core._dirty = {}
+        self.core.meta_modified = False
+        sample = self.core[10.0]
+        sample.touch('input', 'depth')
+        self.assertEqual(self.core._dirty, {'input': set(['depth'])})
+        sample['run1'] = {'age': 1}
+        self.assertIsNone(self.core._dirty['run1'])
+        VirtualCore(self.core, 'run2')[10.0]['age'] = 2
+        self.assertEqual(self.core._dirty['run2'], set(['age']))
+        #neither of these are sample data
+        sample.ignored = True
+        self.core.properties['run3'] = {'model': 'x'}
+        self.assertEqual(sorted(self.core._dirty), ['input', 'run1', 'run2'])
+        self.assertTrue(self.core.meta_modified)
+
+    def test_run_order(self):
+        #what VirtualCores iterate over
+        self.assertEqual(self.core.runkeys('run1'),
+                         [10.0, 15.0, 30.0, 40.0, 90.0])
+
+
+class TestVirtualSample(unittest.TestCase):
+
+    def setUp(self):
+        self.datastore = cscience.datastore.Datastore()
+        self.saved = getattr(self.datastore, 'sample_attributes', None)
+        atts = Attributes([])
+        for name in ('depth', 'age', 'model age'):
+            atts[name] = Attribute(name, 'float')
+        atts['best age'] = VirtualAttribute('best age', 'float',
+                                            ['age', 'model age'])
+        self.datastore.sample_attributes = atts
+
+        self.core = Core('Test', ['run1'])
+        self.core.loaded = True
+        self.core.properties = Sample(exp_data={'age': 'core-wide'})
+        self.core.add(Sample(exp_data={'depth': 1.0, 'model age': 5.0}))
+        self.core.add(Sample(exp_data={'depth': 2.0}))
+        self.core[2.0]['run1'] = {'age': 10.0}
+
+    def tearDown(self):
+        self.datastore.sample_attributes = self.saved
+
+    def test_layers(self):
+        first, second = VirtualCore(self.core, 'run1')
+        self.assertEqual(first['run'], 'run1')
+        self.assertEqual(first['depth'], 1.0)
+        self.assertEqual(second['age'], 10.0)
+        #falls back to core-wide data
+        self.assertEqual(first['age'], 'core-wide')
+        self.assertIsNone(first['nothing'])
+        self.assertIs(first.resolution, second.resolution)
+        self.assertFalse(hasattr(first, '__dict__'))
+
+    def test_virtual(self):
+        first, second = VirtualCore(self.core, 'run1')
+        self.assertEqual(second['best age'], 10.0)
+        self.assertEqual(first['best age'], 'core-wide')
+        self.core.properties['input'] = {}
+        self.assertEqual(first['best age'], 5.0)
+        #changes to the virtual attribute show up right away
+        self.datastore.sample_attributes['best age'].aggatts = ['model age']
+        self.assertIsNone(second['best age'])
+
+    def test_ignored(self):
+        vcore = VirtualCore(self.core, 'run1')
+        first = vcore[1.0]
+        self.assertIs(vcore[1.0], first)
+        first.sample.ignored = True
+        samples, ignored = vcore.partition()
+        self.assertEqual([sample['depth'] for sample in samples], [2.0])
+        self.assertEqual(ignored, [first])
+        self.assertEqual(list(vcore.__iter_ignored__()), [first])
+        first.sample.ignored = False
+        self.assertEqual(len(list(vcore)), 2)
+        #a sample that gets replaced gets a new view, and isn't ignored
+        first.sample.ignored = True
+        self.core.add(Sample(exp_data={'depth': 1.0}))
+        self.assertIsNot(vcore[1.0], first)
+        self.assertEqual(list(vcore.__iter_ignored__()), [])
+
+
+class TestStoredRuns(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.database = sqlite.Database(os.path.join(self.tempdir, 'repo.db'))
+        self.core = Core('Test', ['run1', 'run2'])
+        self.core._table = self.database.ctable('cores')
+        self.core._table.savemany(
+                [(float(depth), {'input': {'depth': float(depth)},
+                                 'run1': {'age': depth * 10},
+                                 'run2': {'age': depth * 20}})
+                 for depth in (1, 2)], name='Test')
+
+    def tearDown(self):
+        self.core.cache.discard(self.core)
+        self.database.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_lookup(self):
+        #only the one sample gets read in, but all of it
+        self.assertEqual(sorted(self.core[2.0].keys()),
+                         ['input', 'run1', 'run2'])
+        self.assertEqual(self.core._data.keys(), [2.0])
+        self.assertFalse(self.core.loaded)
+        self.assertRaises(KeyError, self.core.__getitem__, 1.5)
+        self.core.depths()
+        self.assertRaises(KeyError, self.core.__getitem__, 1.5)
+
+    def stored_ages(self):
+        return dict((key, value['run1']['age']) for key, value in
+                    self.core._table.iter_core_samples(self.core, ['run1']))
+
+    def test_unload_partial(self):
+        #only the one sample is in memory when it's changed
+        sample = self.core[2.0]
+        sample['run1']['age'] = 999
+        sample.touch('run1', 'age')
+        self.core.unload()
+        self.assertEqual([self.core[key]['run1']['age'] for key in self.core],
+                         [10, 999])
+        self.core.save(name='Test')
+        self.assertEqual(self.stored_ages(), {1.0: 10, 2.0: 999})
+
+    def test_unload_twice(self):
+        self.core[1.0]['run1'] = {'age': 5}
+        self.core.unload()
+        #changes made while unloaded go on top of the spilled ones
+        self.core.add(Sample(exp_data={'depth': 3.0}))
+        self.core.unload()
+        self.core.unload()
+        self.assertEqual(sorted(self.core), [1.0, 2.0, 3.0])
+        self.assertEqual(self.core[1.0]['run1'], {'age': 5})
+        self.core.save(name='Test')
+        self.assertEqual(self.stored_ages(), {1.0: 5, 2.0: 20})
+
+    def test_unload_replaced(self):
+        self.core[1.0]['run1'] = {'age': 5}
+        self.core.unload()
+        #same as replacing it while loaded; its runs go too
+        self.core.add(Sample(exp_data={'depth': 2.0}))
+        self.assertEqual([sorted(self.core[key]) for key in sorted(self.core)],
+                         [['input', 'run1', 'run2'], ['input']])
+        self.core.save(name='Test')
+        self.assertEqual(self.stored_ages(), {1.0: 5})
+
+    def test_delete_run(self):
+        self.core.properties['run1'] = {'Age/Depth Model': 'model'}
+        self.core.delete_run('run1')
+        self.assertNotIn('run1', self.core.properties)
+        #reading the rest of the core in doesn't bring it back
+        self.assertEqual([sorted(self.core[key].keys()) for key in self.core],
+                         [['input', 'run2']] * 2)
+        self.core.save(name='Test')
+        self.assertEqual(set(run for key, value in
+                             self.core._table.iter_core_samples(self.core)
+                             for run in value), set(['input', 'run2']))
+        #nor does unloading and loading again
+        self.core.delete_run('run2')
+        self.core.unload()
+        self.assertEqual(self.core[2.0].keys(), ['input'])
+        self.core.save(name='Test')
+        self.assertEqual(self.core.runs, set(['input']))
+
+    def test_unload_ignored(self):
+        self.core[1.0].ignored = True
+        self.core.unload()
+        self.assertTrue(self.core.is_ignored(1.0))
+        self.assertTrue(self.core[1.0].ignored)
+        self.assertEqual([view.sample['input']['depth'] for view in
+                          VirtualCore(self.core, 'run1')], [2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,249 @@
+"""
+Tests for the single-file SQLite backend.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cscience.datastore
+from cscience.backends import filecache, sqlite
+from cscience.framework import Attributes, Collection, Core, Cores, Sample, \
+                               VirtualCore
+from cscience.framework import datastructures
+
+
+class TestSqliteBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.database = sqlite.Database(os.path.join(self.tempdir, 'repo.db'))
+
+    def tearDown(self):
+        self.database.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_wal(self):
+        mode = self.database.connection.execute(
+                                    'PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    def test_table(self):
+        table = self.database.table('views')
+        self.assertRaises(NameError, table.loadkeys)
+        table.savemany([('one', {'a': 1, 'b': 2})])
+        #only the given fields get replaced
+        table.savemany([('one', {'b': 3})])
+        self.assertEqual(table.loadkeys(), ['one'])
+        self.assertEqual(table.loadone('one'), {'name': 'one', 'a': 1, 'b': 3})
+        table.delete_one({'name': 'one'})
+        self.assertIsNone(table.loadone('one'))
+
+    def test_core_runs(self):
+        table = self.database.ctable('cores')
+
+        class core(object):
+            name = 'Test'
+
+        age = datastructures.UncertainQuantity(1200, 'years', [30.0, 40.0])
+        table.savemany([(1.0, {'input': {'depth': 1.0}, 'run1': {'age': age}}),
+                        (2.0, {'input': {'depth': 2.0}})], name='Test')
+        #a new run, saved on its own, leaves the others alone
+        table.savemany([(1.0, {'run2': {'x': 'y'}})], name='Test',
+                       dirty={'run2': None})
+        samples = list(table.iter_core_samples(core))
+        self.assertEqual([key for key, value in samples], [1.0, 2.0])
+        self.assertEqual(samples[0][1]['run2'], {'x': 'y'})
+        self.assertEqual(repr(samples[0][1]['run1']['age']), repr(age))
+
+        samples = list(table.iter_core_samples(core, ['run2']))
+        self.assertEqual(samples, [(1.0, {'run2': {'x': 'y'}})])
+
+        table.delete_item('Test')
+        self.assertEqual(list(table.iter_core_samples(core)), [])
+
+    def test_depth_range(self):
+        table = self.database.ctable('cores')
+        table.chunk_size = 3
+
+        class core(object):
+            name = 'Test'
+
+        table.savemany([(float(depth), {'input': {'depth': float(depth)}})
+                        for depth in range(10)], name='Test')
+        self.assertEqual(len(table._open_segments('Test')), 4)
+        #only the chunks that cover 4-5 get read
+        self.assertEqual(len(table._open_segments('Test', None, (4, 5))), 1)
+        samples = list(table.iter_core_samples(core, None, (2.5, 6)))
+        self.assertEqual([key for key, value in samples], [3.0, 4.0, 5.0, 6.0])
+
+        #shrinking the core drops the chunks it no longer needs
+        table.savemany([(0.0, {'input': {'depth': 0.0}})], name='Test')
+        self.assertEqual(len(table._open_segments('Test')), 1)
+
+    def test_core_summary(self):
+        datastore = cscience.datastore.Datastore()
+        saved = (getattr(datastore, 'sample_attributes', None),
+                 getattr(Cores, '_table', None), getattr(Core, '_table', None))
+        datastore.sample_attributes = Attributes([])
+        try:
+            Cores.connect(self.database)
+            Core.connect(self.database)
+            cores = Cores([])
+            core = Core('Test', ['run1'])
+            for depth, age, units in ((1, 1200, 'years'), (2, None, None),
+                                      (3, 1.5, 'kiloyears')):
+                sample = Sample(exp_data={
+                    'depth': datastructures.UncertainQuantity(depth, 'cm')})
+                core.add(sample)
+                if age is not None:
+                    age = datastructures.UncertainQuantity(age, units)
+                sample['run1'] = {'age': age}
+            cores.add(core)
+            cores.save()
+
+            #a fresh copy, with no samples read in
+            Cores.loadkeys(self.database)
+            core = Cores.instance['Test']
+            self.assertEqual(core.summary_text(), '3 samples, 1 to 3 cm\n1 run')
+            stats = VirtualCore(core, 'run1').summary('age')
+            self.assertEqual((stats['count'], stats['present']), (3, 2))
+            self.assertEqual((stats['min'], stats['max'], stats['units']),
+                             (1200, 1500, 'yr'))
+            self.assertEqual(stats['depths'], [10, 30])
+            self.assertFalse(core.loaded or core._loaded_runs)
+            #no longer up to date once the run changes
+            vcore = VirtualCore(core, 'run1')
+            self.assertTrue(vcore.has_values('age'))
+            vcore[10.0]['age'] = None
+            self.assertIsNone(vcore.has_values('age'))
+        finally:
+            datastore.sample_attributes = saved[0]
+            Cores._table, Core._table = saved[1:]
+
+    def test_milieu(self):
+        table = self.database.mtable('milieus')
+        table.cache = filecache.FileCache(os.path.join(self.tempdir, 'cache'))
+
+        class milieu(object):
+            name = 'Curve'
+
+        table.savemany([((1, 2), {'v': 3.5}), (4, {'v': 'x'})], name='Curve')
+        expected = [((1, 2), {'v': 3.5}), ((4,), {'v': 'x'})]
+        self.assertEqual(sorted(table.iter_milieu_data(milieu)), expected)
+        #second time through comes from the cache
+        self.assertEqual(len(os.listdir(table.cache.directory)), 1)
+        self.assertEqual(sorted(table.iter_milieu_data(milieu)), expected)
+
+
+class Things(Collection):
+    _tablename = 'things'
+
+
+class TestSaving(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.database = sqlite.Database(os.path.join(self.tempdir, 'repo.db'))
+        self.datastore = cscience.datastore.Datastore()
+        self.saved = (getattr(self.datastore, 'sample_attributes', None),
+                      getattr(Cores, '_table', None),
+                      getattr(Core, '_table', None))
+        self.datastore.sample_attributes = Attributes([])
+        Things.connect(self.database)
+        Cores.connect(self.database)
+        Core.connect(self.database)
+
+    def tearDown(self):
+        self.datastore.sample_attributes = self.saved[0]
+        Cores._table, Core._table = self.saved[1:]
+        self.database.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_changed_items(self):
+        things = Things([])
+        things['a'] = {'x': 1}
+        things['b'] = {'x': 2}
+        self.assertEqual(sorted(key for key, value in things.changed_items()),
+                         ['a', 'b'])
+        things.save()
+        self.assertEqual(things.changed_items(), [])
+        #edited in place, without telling anyone
+        things['a']['x'] = 3
+        self.assertEqual([key for key, value in things.changed_items()], ['a'])
+
+    def test_failed_save(self):
+        things = Things([])
+        things['a'] = {'x': 1}
+        things.save()
+        things['a']['x'] = 3
+
+        def savemany(items, *args, **kwargs):
+            raise IOError('disk full')
+        things._table = sqlite.Table(self.database.connection, 'things')
+        things._table.savemany = savemany
+        self.assertRaises(IOError, things.save)
+        del things._table
+        #still to be saved, and gets saved next time
+        self.assertEqual([key for key, value in things.changed_items()], ['a'])
+        things.save()
+        self.assertEqual(Things(Things._table.loadkeys())['a'], {'x': 3})
+
+    def make_core(self):
+        cores = Cores([])
+        core = Core('Test', ['run1'])
+        sample = Sample(exp_data={
+                    'depth': datastructures.UncertainQuantity(1, 'cm')})
+        core.add(sample)
+        sample['run1'] = {
+                'width': datastructures.UncertainQuantity(2.0, 'cm', 0.5)}
+        core.properties['run1'] = {'note': 'core-wide'}
+        cores.add(core)
+        cores.save()
+        #a fresh copy, with nothing read in
+        Cores.loadkeys(self.database)
+        return Cores.instance['Test']
+
+    def test_unit_change(self):
+        core = self.make_core()
+        sample = VirtualCore(core, 'run1')[10.0]
+        sample['width'].units = 'mm'
+        sample.touch('width')
+        self.assertEqual(core._dirty, {'run1': set(['width'])})
+        Cores.instance.save()
+        self.assertFalse(core.modified)
+
+        Cores.loadkeys(self.database)
+        core = Cores.instance['Test']
+        width = VirtualCore(core, 'run1')[10.0]['width']
+        self.assertEqual((float(width.magnitude), str(width.dimensionality)),
+                         (20.0, 'mm'))
+
+    def test_core_map(self):
+        core = self.make_core()
+        self.assertIsNone(core._properties)
+        self.assertEqual(core.runs, set(['input', 'run1']))
+        self.assertEqual(core.properties['run1'], {'note': 'core-wide'})
+
+        #the list of cores doesn't read the rest of the map entry at all
+        connection = self.database.connection
+        data, = connection.execute(
+                        "SELECT data FROM cores WHERE name='Test'").fetchone()
+        with connection:
+            connection.execute("UPDATE cores SET data='garbage'")
+        Cores.loadkeys(self.database)
+        self.assertEqual(Cores.instance['Test'].runs, set(['input', 'run1']))
+        self.assertEqual(sorted(Cores.instance['Test'].summary), ['input', 'run1'])
+        #entries saved before it was split out have to be read in full
+        with connection:
+            connection.execute('UPDATE cores SET data=?, light=NULL',
+                               (data,))
+        Cores.loadkeys(self.database)
+        core = Cores.instance['Test']
+        self.assertEqual(core.runs, set(['input', 'run1']))
+        self.assertIsNone(core._properties)
+
+
+if __name__ == '__main__':
+    unittest.main()
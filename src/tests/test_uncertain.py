@@ -0,0 +1,161 @@
+"""
+Tests for UncertainArray against the UncertainQuantity behaviour it mirrors.
+"""
+
+import unittest
+
+import numpy as np
+
+import cscience.datastore
+from cscience.components import baconplugin
+from cscience.framework import datastructures
+from cscience.framework.datastructures import UncertainArray, \
+    UncertainQuantity
+
+
+def errors(value):
+    return [float(err.magnitude) for err in value.uncertainty.magnitude]
+
+
+class TestUncertainArray(unittest.TestCase):
+
+    def setUp(self):
+        self.values = [UncertainQuantity(1200.0, 'years', 30.0),
+                       UncertainQuantity(800.0, 'years', [20.0, 40.0]),
+                       UncertainQuantity(1.5, 'kiloyears', 0.1),
+                       UncertainQuantity(300.0, 'years')]
+
+    def assertSameQuantity(self, old, new):
+        self.assertEqual(old.dimensionality, new.dimensionality)
+        self.assertAlmostEqual(float(old.magnitude), float(new.magnitude))
+        self.assertEqual(len(errors(old)), len(errors(new)))
+        for olderr, newerr in zip(errors(old), errors(new)):
+            self.assertAlmostEqual(olderr, newerr)
+
+    def test_round_trip(self):
+        dist = datastructures.ProbabilityDistribution(
+                    np.arange(10.0), np.ones(10) / 10, 4.5, (1, 8))
+        self.values[0].uncertainty.distribution = dist
+        array = UncertainArray.from_quantities(self.values)
+        self.assertEqual(array.units, 'yr')
+        result = array.to_quantities()
+        for index in (0, 1, 3):
+            self.assertSameQuantity(self.values[index], result[index])
+        #converted to the units of the first value
+        self.assertSameQuantity(UncertainQuantity(1500.0, 'years', 100.0),
+                                result[2])
+        self.assertIs(result[0].uncertainty.distribution, dist)
+
+    def test_asymmetric(self):
+        #skewed: a long way up, not far down
+        value = UncertainQuantity(1799.62, 'years', [624.09, 299.24])
+        array = UncertainArray.from_quantities([value])
+        self.assertAlmostEqual(array.err_plus[0], 624.09)
+        self.assertAlmostEqual(array.err_minus[0], 299.24)
+        result, = array.to_quantities()
+        self.assertSameQuantity(value, result)
+        self.assertEqual(str(result.uncertainty), '+624.09/-299.24')
+
+    def test_arithmetic(self):
+        #same units throughout, so the scalar results are directly comparable
+        values = [value for value in self.values
+                  if value.dimensionality.string == 'yr']
+        correction = UncertainQuantity(100.0, 'years', 50.0)
+        expected = [value + (-correction) for value in values]
+        result = (UncertainArray.from_quantities(values) -
+                  correction).to_quantities()
+        for old, new in zip(expected, result):
+            self.assertSameQuantity(old, new)
+
+        corrections = UncertainArray.from_quantities(
+                            [UncertainQuantity(10.0, 'years', [1.0, 2.0])] * 3)
+        result = (UncertainArray.from_quantities(values) +
+                  corrections).to_quantities()
+        for value, new in zip(values, result):
+            self.assertSameQuantity(
+                value + UncertainQuantity(10.0, 'years', [1.0, 2.0]), new)
+
+    def test_rescale(self):
+        array = UncertainArray.from_quantities(self.values).rescale('kiloyears')
+        self.assertAlmostEqual(array.magnitude[0], 1.2)
+        self.assertAlmostEqual(array.err_plus[1], 0.02)
+        self.assertAlmostEqual(array.err_minus[1], 0.04)
+        mags, errs = array.unitless_normal()
+        self.assertAlmostEqual(errs[1], 0.03)
+        self.assertEqual(errs[3], 0)
+        self.assertRaises(ValueError, array.rescale, 'cm')
+
+
+class TestAgeModels(unittest.TestCase):
+
+    def test_pointlist(self):
+        model = datastructures.PointlistInterpolation([0, 100], [0, 1000])
+        ages = model.valueat_many([UncertainQuantity(0.5, 'm'), 20.0])
+        self.assertEqual(ages.magnitude.tolist(), [500.0, 200.0])
+
+    def test_pointlist_units(self):
+        #a core kept in mm, whose model has its depths in mm too
+        model = datastructures.PointlistInterpolation([0, 1000], [0, 1000],
+                                                      xunits='mm')
+        depths = [UncertainQuantity(500, 'mm'), UncertainQuantity(20, 'cm'),
+                  300.0]
+        self.assertEqual(model.valueat_many(depths).magnitude.tolist(),
+                         [500.0, 200.0, 300.0])
+        self.assertEqual(float(model.valueat(depths[1]).magnitude), 200.0)
+        #models saved without units take depths as they come
+        model = datastructures.PointlistInterpolation([0, 1000], [0, 1000],
+                                                      xunits=None)
+        self.assertEqual(model.valueat_many(depths).magnitude.tolist(),
+                         [500.0, 20.0, 300.0])
+
+    def test_bacon(self):
+        #ages at 0 and 10cm for 20 paths; 19 of them agree at 10cm
+        paths = [[0.0, 100.0]] * 19 + [[0.0, 500.0]]
+        model = datastructures.BaconInfo([[0.0, 10.0]] + paths, 'run')
+        ages = model.valueat_many(np.array([5.0, 10.0]))
+        self.assertAlmostEqual(ages.magnitude[1], 120.0)
+        self.assertAlmostEqual(ages.err_minus[1], 20.0)
+        self.assertEqual(ages.err_plus[1], 0)
+        self.assertAlmostEqual(ages.magnitude[0], 60.0)
+        single = model.valueat(UncertainQuantity(100, 'mm'))
+        self.assertAlmostEqual(float(single.magnitude), 120.0)
+
+    def test_bacon_output(self):
+        #rows as Bacon writes them: blank, age at the top, an accumulation
+        #rate (years/cm) per section, then w and U
+        rows = [['', str(start), '10', '20', '0.1', '0.2']
+                for start in (90.0, 100.0, 110.0)]
+        total_info, sums = baconplugin.read_output(rows, 0.0, 5.0, 2)
+        self.assertEqual(total_info[0], [0.0, 5.0, 10.0])
+        self.assertEqual(total_info[1], [90.0, 140.0, 240.0])
+        self.assertEqual(sums, [100.0, 150.0, 250.0])
+        model = datastructures.BaconInfo(total_info, 'run')
+        top = model.valueat(0.0)
+        self.assertAlmostEqual(float(top.magnitude), 100.0)
+        self.assertEqual(model.valueat_many([0.0, 10.0]).magnitude.tolist(),
+                         [100.0, 250.0])
+
+    def test_bacon_skewed(self):
+        #most paths young, a few much older
+        paths = [[0.0, 1500.0 + 10 * index] for index in range(16)] + \
+                [[0.0, 2400.0]] * 4
+        model = datastructures.BaconInfo([[0.0, 15.0]] + paths, 'run')
+        age = model.valueat(15.0)
+        plus, minus = age.uncertainty.get_mag_tuple()
+        self.assertGreater(float(plus), float(minus))
+        self.assertAlmostEqual(float(age.magnitude) + float(plus), 2400.0)
+
+    def test_bacon_summary(self):
+        paths = [[0.0, age] for age in range(101)]
+        model = datastructures.BaconInfo([[0.0, 10.0]] + paths, 'run')
+        summary = model.summarized()
+        self.assertIsNone(summary.ensemble)
+        self.assertEqual(summary.quantile(0.5).tolist(), [0.0, 50.0])
+        self.assertRaises(KeyError, summary.quantile, 0.1)
+        ages = summary.valueat_many([10.0])
+        self.assertAlmostEqual(ages.err_minus[0], 47.5)
+        self.assertAlmostEqual(ages.err_plus[0], 47.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
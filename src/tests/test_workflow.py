@@ -0,0 +1,172 @@
+"""
+Tests for compiling and running workflows.
+"""
+
+import threading
+import unittest
+
+import cscience.datastore
+from cscience.components import BaseComponent, ComponentAttribute as Att
+from cscience.framework import Attributes, CoreAttributes, Core, Sample, \
+                               Workflow
+
+
+class Split(BaseComponent):
+    visible_name = 'Test Split'
+    outputs = [Att('split')]
+
+    @classmethod
+    def output_ports(cls):
+        return ('left', 'right')
+
+    def __call__(self, core, progress_dialog):
+        for sample in core:
+            sample['split'] = sample['depth'] * 2
+        return [(self.connections['left'], core),
+                (self.connections['right'], core)]
+
+
+class Left(BaseComponent):
+    visible_name = 'Test Left'
+    inputs = [Att('split')]
+    outputs = [Att('left')]
+    #both branches wait here until the other has started
+    barrier = None
+
+    def run_component(self, core, progress_dialog):
+        if self.barrier:
+            self.barrier[0].set()
+            self.barrier[2].append(self.barrier[1].wait(2))
+        for sample in core:
+            sample['left'] = sample['split'] + 1
+
+
+class Right(BaseComponent):
+    visible_name = 'Test Right'
+    inputs = [Att('split')]
+    outputs = [Att('right')]
+    barrier = None
+
+    def run_component(self, core, progress_dialog):
+        if self.barrier:
+            self.barrier[1].set()
+            self.barrier[2].append(self.barrier[0].wait(2))
+        for sample in core:
+            sample['right'] = sample['split'] - 1
+
+
+class Join(BaseComponent):
+    visible_name = 'Test Join'
+    #only needs one branch connected to it, but has to wait for the other
+    inputs = [Att('left'), Att('right')]
+    outputs = [Att('joined')]
+
+    def run_component(self, core, progress_dialog):
+        for sample in core:
+            sample['joined'] = sample['left'] + sample['right']
+
+
+class Tally(BaseComponent):
+    visible_name = 'Test Tally'
+    #one entry per set of samples it's run on
+    calls = []
+
+    def run_component(self, core, progress_dialog):
+        self.calls.append(len(list(core)))
+
+
+class Extra(BaseComponent):
+    visible_name = 'Test Extra'
+
+    def __call__(self, core, progress_dialog):
+        #hands samples on to a component that isn't in the workflow
+        return [(self.connections['output'], core), (Tally(), core)]
+
+
+class TestWorkflow(unittest.TestCase):
+
+    def setUp(self):
+        self.datastore = cscience.datastore.Datastore()
+        self.saved = [getattr(self.datastore, name, None) for name in
+                      ('sample_attributes', 'core_attributes', 'milieus')]
+        self.datastore.sample_attributes = Attributes([])
+        self.datastore.core_attributes = CoreAttributes([])
+        self.datastore.milieus = {}
+
+        self.workflow = Workflow('Test')
+        self.workflow.connect('Test Split', 'Test Left', 'left')
+        self.workflow.connect('Test Split', 'Test Right', 'right')
+        self.workflow.connect('Test Left', 'Test Join')
+
+        self.core = Core('Test')
+        self.core.loaded = True
+        for depth in (1.0, 2.0):
+            self.core.add(Sample(exp_data={'depth': depth}))
+
+    def tearDown(self):
+        (self.datastore.sample_attributes, self.datastore.core_attributes,
+         self.datastore.milieus) = self.saved
+        Left.barrier = Right.barrier = None
+        Tally.calls = []
+
+    def test_compile(self):
+        first, waits = self.workflow.compile()
+        self.assertEqual(first, 'Test Split')
+        self.assertEqual(waits['Test Left'], set(['Test Split']))
+        #waits on Right for its input, though it isn't connected to it
+        self.assertEqual(waits['Test Join'], set(['Test Left', 'Test Right']))
+
+        loose = Workflow('Loose')
+        loose.add_component('Test Left')
+        loose.add_component('Test Right')
+        self.assertRaises(KeyError, loose.compile)
+        self.workflow.connect('Test Join', 'Test Left')
+        self.assertRaises(ValueError, self.workflow.compile)
+        #Right outputs what Join needs, and Join feeds Right
+        self.workflow.connections['Test Join'] = {'output': 'Test Right'}
+        self.assertRaises(ValueError, self.workflow.compile)
+
+    def test_execute(self):
+        for workers in (1, 2):
+            if workers > 1:
+                #only finishes if both branches run at once
+                Left.barrier = Right.barrier = (threading.Event(),
+                                                threading.Event(), [])
+            vcore = self.core.new_computation('Test', str(workers))
+            timings = self.workflow.execute({}, vcore, None, workers=workers)
+            self.assertEqual(timings.keys()[0], 'Test Split')
+            self.assertEqual(timings.keys()[-1], 'Test Join')
+            self.assertEqual(len(timings), 4)
+            self.assertEqual([sample['joined'] for sample in vcore],
+                             [4.0, 8.0])
+            if Left.barrier:
+                self.assertEqual(Left.barrier[2], [True, True])
+
+    def test_many_inputs(self):
+        #Tally gets samples from both branches, and runs on each set
+        self.workflow.connect('Test Right', 'Test Tally')
+        self.workflow.connect('Test Join', 'Test Tally')
+        for workers in (1, 2):
+            Tally.calls = []
+            vcore = self.core.new_computation('Test', str(workers))
+            timings = self.workflow.execute({}, vcore, None, workers=workers)
+            self.assertEqual(Tally.calls, [2, 2])
+            self.assertEqual(timings.keys()[-1], 'Test Tally')
+
+        extra = Workflow('Extra')
+        extra.add_component('Test Extra')
+        timings = extra.execute({}, self.core.new_computation('Test', 'x'),
+                                None)
+        self.assertEqual(Tally.calls, [2, 2, 2])
+        self.assertEqual(timings.keys(), ['Test Extra', 'Tally'])
+
+    def test_failure(self):
+        vcore = self.core.new_computation('Test')
+        self.core[1.0]['input']['depth'] = 'deep'
+        self.assertRaises(TypeError, self.workflow.execute, {}, vcore, None,
+                          workers=2)
+        self.assertIsNone(vcore[1.0]['left'])
+
+
+if __name__ == '__main__':
+    unittest.main()